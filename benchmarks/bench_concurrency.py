@@ -0,0 +1,134 @@
+"""
+并发会话基准测试：吞吐量与事件循环延迟
+
+在同一个事件循环里同时运行N个 graph.astream_events 会话，LLM和搜索指向本地桩服务，
+WebAgent图的爬取指向本地静态站点。统计会话吞吐量、单会话耗时，以及事件循环延迟
+（定时器实际唤醒时间比预期晚了多少）——节点里有同步阻塞调用时这个值会明显变大。
+
+运行：python benchmarks/bench_concurrency.py --graph 6 --sessions 50 --concurrency 10
+"""
+
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+from datetime import datetime
+
+from stub_servers import run_stub_server, FakeLLMHandler, FakeSearchHandler
+from static_site import local_static_site
+from graph_loader import load_study_module, use_stub_env
+from bench_crawler_pool import percentile
+
+
+class LoopLagMonitor:
+    """
+    事件循环延迟监控：每隔interval秒醒来一次，记录实际唤醒比预期晚了多少
+
+    Args:
+        interval: 采样间隔（秒）
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.lags = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - start - self.interval))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+def build_initial_state(module, question):
+    """构造与run_demo相同结构的初始消息"""
+    today = datetime.now().strftime("%Y-%m-%d")
+    return {"messages": [
+        module.SystemMessage(content=f"你是一个强大的AI助手，擅长搜索和分析网络信息。请牢记今天的日期是{today}。"),
+        module.HumanMessage(content=question),
+    ]}
+
+
+async def run_session(graph, initial_state):
+    """运行一个会话，消费完所有事件，返回耗时和事件数"""
+    start = time.perf_counter()
+    events = 0
+    async for _ in graph.astream_events(initial_state, version="v2"):
+        events += 1
+    return time.perf_counter() - start, events
+
+
+async def run_benchmark(module, sessions, concurrency):
+    graph = getattr(module, "graph", None) or module.app_graph
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors, events = [], [], 0
+
+    async def one(i):
+        nonlocal events
+        async with semaphore:
+            try:
+                elapsed, count = await run_session(graph, build_initial_state(module, f"问题{i}：crawl4ai是什么？"))
+                latencies.append(elapsed)
+                events += count
+            except Exception as e:
+                errors.append(repr(e))
+
+    monitor = LoopLagMonitor()
+    monitor.start()
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(sessions)))
+    wall = time.perf_counter() - start
+    await monitor.stop()
+    return wall, latencies, errors, events, monitor.lags
+
+
+async def main(args):
+    with local_static_site(pages=10) as site_urls, \
+            run_stub_server(FakeLLMHandler, first_token_latency=args.llm_latency) as llm_url, \
+            run_stub_server(FakeSearchHandler, latency=args.search_latency, result_urls=site_urls) as search_url:
+        use_stub_env(llm_url, search_url)
+        # 网页存储放在临时目录，不污染当前目录
+        os.environ.setdefault("PAGE_STORE_DIR", tempfile.mkdtemp(prefix="bench_page_store_"))
+        module = load_study_module(args.graph)
+        try:
+            wall, latencies, errors, events, lags = await run_benchmark(module, args.sessions, args.concurrency)
+        finally:
+            for name in ("shutdown_crawler_pool", "close_crawl_scheduler", "close_search_clients", "close_page_store",
+                         "close_local_index"):
+                if hasattr(module, name):
+                    await getattr(module, name)()
+
+    print("=" * 60)
+    print(f"图: 学习{args.graph}  会话数: {args.sessions}  并发: {args.concurrency}")
+    print(f"总耗时: {wall:.2f}s  吞吐量: {len(latencies) / wall:.2f} 会话/秒  事件数: {events}")
+    if latencies:
+        print(f"会话耗时 p50={percentile(latencies, 50):.3f}s p95={percentile(latencies, 95):.3f}s")
+    if lags:
+        print(f"事件循环延迟 p50={percentile(lags, 50) * 1000:.1f}ms "
+              f"p95={percentile(lags, 95) * 1000:.1f}ms max={max(lags) * 1000:.1f}ms "
+              f"mean={statistics.mean(lags) * 1000:.1f}ms")
+    if errors:
+        print(f"失败会话: {len(errors)}，示例: {errors[0]}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--graph", type=int, default=6, choices=[4, 6], help="要测试的学习记录编号")
+    parser.add_argument("--sessions", type=int, default=50, help="会话总数")
+    parser.add_argument("--concurrency", type=int, default=10, help="同时运行的会话数")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="假LLM首字延迟（秒）")
+    parser.add_argument("--search-latency", type=float, default=0.1, help="假搜索延迟（秒）")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,105 @@
+"""
+上下文打包基准测试：发给总结模型的token数和总结延迟
+
+用一组固定的网页语料（少量与问题相关的段落混在大量无关段落里）调用summary_bot_node，
+分别关闭/开启上下文打包，比较发送的token数和总结耗时。假LLM的首字延迟随prompt长度增长，
+模拟长上下文的预填充开销。
+
+运行：python benchmarks/bench_context_packing.py --pages 5 --paragraphs 200 --budget 3000
+"""
+
+import os
+import time
+import random
+import asyncio
+import argparse
+import statistics
+
+from stub_servers import run_stub_server, FakeLLMHandler
+from graph_loader import load_study_module, use_stub_env
+
+QUESTION = "crawl4ai是什么？它有哪些主要功能？"
+
+RELEVANT = [
+    "Crawl4AI是一个开源的网页爬虫工具，专为大语言模型和AI应用设计，输出干净的markdown。",
+    "crawl4ai的主要功能包括异步爬取、浏览器池、流式返回结果以及基于CSS或LLM的结构化提取。",
+    "使用crawl4ai时可以通过BrowserConfig配置无头浏览器，通过CrawlerRunConfig配置缓存和过滤规则。",
+]
+FILLER = [
+    "今天的天气晴朗，适合外出散步，公园里的花都开了。",
+    "这家餐厅的招牌菜是红烧肉，味道偏甜，分量很足。",
+    "股票市场今天小幅震荡，成交量较前一交易日略有下降。",
+    "The quick brown fox jumps over the lazy dog near the river bank.",
+    "本站所有内容仅供参考，转载请注明出处，联系我们请发送邮件。",
+]
+
+
+def build_corpus(pages: int, paragraphs: int, seed: int = 7) -> list[dict]:
+    """
+    生成固定的网页语料：每个网页大部分是无关段落，随机位置插入少量相关段落
+
+    Args:
+        pages: 网页数
+        paragraphs: 每个网页的段落数
+        seed: 随机种子，保证每次运行语料一致
+
+    Returns:
+        list[dict]: 网页列表，每项包含url和markdown
+    """
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(pages):
+        body = [rng.choice(FILLER) for _ in range(paragraphs)]
+        for text in RELEVANT:
+            body.insert(rng.randrange(len(body)), text)
+        corpus.append({"url": f"https://example.com/page_{i}", "markdown": "\n\n".join(body)})
+    return corpus
+
+
+async def run_summary(module, corpus, pack: bool):
+    """调用一次summary_bot_node，返回耗时和模型收到的prompt token数"""
+    module.SUMMARY_PACK_CONTEXT = pack
+    blob = "".join(f"{page['markdown']}\n\n" for page in corpus)
+    state = {"messages": [
+        module.SystemMessage(content="你是一个强大的AI助手"),
+        module.HumanMessage(content=QUESTION),
+        module.ToolMessage(content=blob, tool_call_id="bench"),
+    ]}
+    start = time.perf_counter()
+    result = await module.summary_bot_node(state)
+    elapsed = time.perf_counter() - start
+    usage = result["messages"][-1].response_metadata.get("token_usage", {})
+    return elapsed, usage.get("prompt_tokens", 0)
+
+
+async def main(args):
+    corpus = build_corpus(args.pages, args.paragraphs)
+    with run_stub_server(FakeLLMHandler, first_token_latency=0.05,
+                         prefill_seconds_per_1k=args.prefill, tokens_per_second=200) as llm_url:
+        use_stub_env(llm_url)
+        os.environ["SUMMARY_TOKEN_BUDGET"] = str(args.budget)
+        module = load_study_module(6)
+        rows = []
+        for name, pack in (("原文整段", False), ("上下文打包", True)):
+            latencies, tokens = [], 0
+            for _ in range(args.rounds):
+                elapsed, tokens = await run_summary(module, corpus, pack)
+                latencies.append(elapsed)
+            rows.append((name, tokens, statistics.median(latencies)))
+
+    print("=" * 60)
+    print(f"语料: {args.pages}个网页 x {args.paragraphs}段  token预算: {args.budget}")
+    for name, tokens, latency in rows:
+        print(f"{name:<8} prompt tokens={tokens:<8} 总结耗时(中位数)={latency:.3f}s")
+    if rows[1][1]:
+        print(f"token减少: {1 - rows[1][1] / rows[0][1]:.0%}  耗时减少: {1 - rows[1][2] / rows[0][2]:.0%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=5, help="网页数")
+    parser.add_argument("--paragraphs", type=int, default=200, help="每个网页的段落数")
+    parser.add_argument("--budget", type=int, default=3000, help="上下文打包的token预算")
+    parser.add_argument("--rounds", type=int, default=5, help="每种方式的运行次数")
+    parser.add_argument("--prefill", type=float, default=0.2, help="假LLM每1000个prompt token增加的延迟（秒）")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,97 @@
+"""
+浏览器池基准测试：冷启动 vs 常驻浏览器池
+
+对本地静态站点重复执行爬取，比较每次新建AsyncWebCrawler和从CrawlerPool借出
+两种方式的p50/p95延迟。
+
+运行：python benchmarks/bench_crawler_pool.py --rounds 20 --batch 2
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from crawl4ai import AsyncWebCrawler, CrawlerRunConfig, CacheMode
+from crawler_pool import CrawlerPool, default_browser_config
+from static_site import local_static_site
+
+# 关闭缓存，保证每次都真实爬取
+run_conf = CrawlerRunConfig(cache_mode=CacheMode.BYPASS, stream=False)
+
+
+def percentile(values, p):
+    """
+    计算百分位数（最近秩法）
+
+    Args:
+        values: 数值列表
+        p: 百分位，0-100
+
+    Returns:
+        float: 百分位数
+    """
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered) + 0.5) - 1))
+    return ordered[k]
+
+
+def report(name, latencies):
+    print(f"{name:<10} n={len(latencies):<4} "
+          f"p50={percentile(latencies, 50) * 1000:8.1f}ms "
+          f"p95={percentile(latencies, 95) * 1000:8.1f}ms "
+          f"mean={statistics.mean(latencies) * 1000:8.1f}ms")
+
+
+async def bench_cold(batches):
+    """每次爬取都新建一个浏览器"""
+    latencies = []
+    for urls in batches:
+        start = time.perf_counter()
+        async with AsyncWebCrawler(config=default_browser_config()) as crawler:
+            await crawler.arun_many(urls, config=run_conf)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def bench_pooled(batches, size, pages_per_browser):
+    """从常驻浏览器池借出浏览器"""
+    pool = CrawlerPool(size=size, pages_per_browser=pages_per_browser)
+    await pool.start()
+    latencies = []
+    try:
+        for urls in batches:
+            start = time.perf_counter()
+            async with pool.acquire(pages=len(urls)) as crawler:
+                await crawler.arun_many(urls, config=run_conf)
+            latencies.append(time.perf_counter() - start)
+    finally:
+        await pool.close()
+    return latencies
+
+
+async def main(args):
+    with local_static_site(pages=max(args.batch, 10)) as site_urls:
+        batches = [
+            [site_urls[(r * args.batch + i) % len(site_urls)] for i in range(args.batch)]
+            for r in range(args.rounds)
+        ]
+        cold = await bench_cold(batches)
+        pooled = await bench_pooled(batches, args.pool_size, args.pages_per_browser)
+    print("=" * 60)
+    report("cold", cold)
+    report("pooled", pooled)
+    print(f"p50加速比: {percentile(cold, 50) / percentile(pooled, 50):.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=20, help="每种方式的爬取轮数")
+    parser.add_argument("--batch", type=int, default=2, help="每轮爬取的URL数")
+    parser.add_argument("--pool-size", type=int, default=2, help="浏览器池实例数")
+    parser.add_argument("--pages-per-browser", type=int, default=4, help="每个浏览器的并发租约数")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,141 @@
+"""
+HTTP直连抓取基准测试：只用浏览器 vs 先HTTP、需要JS时再用浏览器
+
+对本地静态站点（其中一部分页面的正文由JS渲染）按给定并发抓取一遍，比较两种方式的
+吞吐量、单页延迟、HTTP直连命中的页面数和内存峰值，并检查两种方式得到的markdown是否一致。
+每种方式在单独的子进程里运行，浏览器占用的内存不会互相影响。
+
+运行：python benchmarks/bench_http_fetch.py --pages 40 --spa-pages 10 --concurrency 8
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import difflib
+import resource
+import subprocess
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from static_site import local_static_site
+from bench_crawler_pool import percentile
+
+
+async def run_mode(urls: list[str], concurrency: int, output: str):
+    """
+    子进程里执行：按并发抓取所有URL，把统计结果和每个页面的markdown写到output
+
+    Args:
+        urls: 要抓取的URL
+        concurrency: 同时抓取的页面数
+        output: 结果JSON文件路径
+    """
+    # HTTP_FIRST在导入时读取，由父进程通过环境变量指定
+    from crawl_tool import crawl_pages
+    from crawler_pool import shutdown_crawler_pool
+    from crawl_scheduler import close_crawl_scheduler
+    from instrumentation import get_metrics
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    markdowns = {}
+
+    async def fetch(url):
+        async with semaphore:
+            start = time.perf_counter()
+            async for page in crawl_pages([url], use_store=False):
+                markdowns[url] = page["markdown"] if page["success"] else None
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(fetch(url) for url in urls))
+        wall = time.perf_counter() - start
+    finally:
+        await shutdown_crawler_pool()
+        await close_crawl_scheduler()
+
+    metrics = get_metrics()
+    result = {
+        "wall": wall,
+        "latencies": latencies,
+        "success": sum(1 for markdown in markdowns.values() if markdown),
+        "http": metrics.crawl_fetches.value(fetcher="http"),
+        "browser": metrics.crawl_fetches.value(fetcher="browser"),
+        # Linux下ru_maxrss单位为KB；浏览器进程已经退出，计入子进程的峰值
+        "self_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "children_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+        "markdowns": markdowns,
+    }
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False)
+
+
+def run_child(mode: str, urls: list[str], concurrency: int) -> dict:
+    """在子进程里运行一种抓取方式，返回统计结果"""
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, "result.json")
+        env = dict(
+            os.environ,
+            HTTP_FIRST="1" if mode == "http" else "0",
+            # 本地站点只有一个host，不做礼貌限速
+            CRAWL_PER_HOST=str(concurrency),
+            CRAWL_HOST_DELAY="0",
+            CRAWL_MAX_ACTIVE=str(concurrency),
+            LOG_LEVEL="WARNING",
+        )
+        subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", output,
+             "--concurrency", str(concurrency), "--urls", json.dumps(urls)],
+            env=env, check=True,
+        )
+        with open(output, encoding="utf-8") as f:
+            return json.load(f)
+
+
+def report(name: str, result: dict):
+    latencies = result["latencies"]
+    print(f"{name:<12} 成功={result['success']:<4} 耗时={result['wall']:6.2f}s "
+          f"吞吐量={len(latencies) / result['wall']:6.1f}页/秒 "
+          f"p50={percentile(latencies, 50) * 1000:7.1f}ms p95={percentile(latencies, 95) * 1000:7.1f}ms "
+          f"HTTP/浏览器={result['http']:.0f}/{result['browser']:.0f} "
+          f"RSS: 本进程={result['self_rss_mb']:.0f}MB 子进程={result['children_rss_mb']:.0f}MB")
+
+
+def similarity(a: dict, b: dict) -> float:
+    """两种方式都抓取成功的页面，markdown的平均相似度"""
+    ratios = [
+        difflib.SequenceMatcher(None, a[url], b[url]).ratio()
+        for url in a if a.get(url) and b.get(url)
+    ]
+    return sum(ratios) / len(ratios) if ratios else 0.0
+
+
+def main(args):
+    with local_static_site(pages=args.pages, spa_pages=args.spa_pages) as urls:
+        browser = run_child("browser", urls, args.concurrency)
+        http = run_child("http", urls, args.concurrency)
+    print("=" * 60)
+    print(f"页面数: {args.pages}（其中JS渲染 {args.spa_pages}）  并发: {args.concurrency}")
+    report("browser", browser)
+    report("http-first", http)
+    print(f"吞吐量提升: {browser['wall'] / http['wall']:.1f}x")
+    print(f"markdown平均相似度: {similarity(browser['markdowns'], http['markdowns']):.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=40, help="页面数")
+    parser.add_argument("--spa-pages", type=int, default=10, help="其中正文由JS渲染的页面数")
+    parser.add_argument("--concurrency", type=int, default=8, help="同时抓取的页面数")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--urls", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        asyncio.run(run_mode(json.loads(args.urls), args.concurrency, args.child))
+    else:
+        main(args)
@@ -0,0 +1,288 @@
+"""
+搜索→爬取→总结全链路基准测试，结果可保存为JSON并与上一次结果对比
+
+用本地桩服务替代外部依赖：OpenAI兼容的假LLM（可配置首字延迟和token速率）、
+Tavily兼容的假搜索接口、供crawl4ai爬取的本地静态站点。按配置的并发度运行学习6的图，统计：
+- 会话耗时、首个token耗时、吞吐量
+- 每个节点（chatbot、search_tool、crawl4ai_tool、summary_bot……）的耗时分布
+- 内存峰值（进程最大RSS，可选tracemalloc峰值）和事件循环延迟
+
+结果用 --output 保存为JSON；用 --baseline 指定之前保存的JSON时，逐项对比，
+变差超过 --threshold 的指标列为回归，并以退出码1结束，方便在CI里使用。
+
+运行：
+    python benchmarks/bench_pipeline.py --sessions 50 --concurrency 10 --output base.json
+    python benchmarks/bench_pipeline.py --sessions 50 --concurrency 10 --baseline base.json
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import statistics
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime
+
+from stub_servers import run_stub_server, FakeLLMHandler, FakeSearchHandler
+from static_site import local_static_site
+from graph_loader import load_study_module, use_stub_env
+from bench_crawler_pool import percentile
+from bench_concurrency import LoopLagMonitor, build_initial_state
+
+# 越小越好的指标，其余（吞吐量）越大越好
+HIGHER_IS_BETTER = {"throughput"}
+
+
+def distribution(values: list) -> dict:
+    """
+    耗时分布
+
+    Args:
+        values: 数值列表（秒）
+
+    Returns:
+        dict: 样本数、p50/p95/p99、均值、最大值
+    """
+    if not values:
+        return {"n": 0}
+    return {
+        "n": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "mean": statistics.mean(values),
+        "max": max(values),
+    }
+
+
+async def run_session(graph, state, node_names, answer_nodes):
+    """
+    运行一个会话，从astream_events里统计每个节点的耗时和首个回答token的时间
+
+    Returns:
+        tuple: (会话耗时, 首个token耗时或None, {节点名: [耗时]})
+    """
+    start = time.perf_counter()
+    first_token = None
+    started = {}
+    node_times = defaultdict(list)
+    async for event in graph.astream_events(state, version="v2"):
+        event_type = event["event"]
+        node = event.get("metadata", {}).get("langgraph_node")
+        if event["name"] in node_names and node == event["name"]:
+            if event_type == "on_chain_start":
+                started[event["run_id"]] = time.perf_counter()
+            elif event_type == "on_chain_end" and event["run_id"] in started:
+                node_times[node].append(time.perf_counter() - started.pop(event["run_id"]))
+        elif event_type == "on_chat_model_stream" and first_token is None and node in answer_nodes:
+            if "map_summary" not in event.get("tags", []) and event["data"]["chunk"].content:
+                first_token = time.perf_counter() - start
+    return time.perf_counter() - start, first_token, node_times
+
+
+async def run_benchmark(module, sessions, concurrency):
+    graph = module.graph
+    node_names = set(graph.get_graph().nodes) - {"__start__", "__end__"}
+    answer_nodes = set(module.ANSWER_NODES)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, ttfts, errors = [], [], []
+    nodes = defaultdict(list)
+
+    async def one(i):
+        async with semaphore:
+            try:
+                state = build_initial_state(module, f"问题{i}：crawl4ai是什么？")
+                elapsed, ttft, node_times = await run_session(graph, state, node_names, answer_nodes)
+            except Exception as e:
+                errors.append(repr(e))
+                return
+            latencies.append(elapsed)
+            if ttft is not None:
+                ttfts.append(ttft)
+            for node, times in node_times.items():
+                nodes[node].extend(times)
+
+    monitor = LoopLagMonitor()
+    monitor.start()
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(sessions)))
+    wall = time.perf_counter() - start
+    await monitor.stop()
+    return {
+        "wall": wall,
+        "throughput": len(latencies) / wall if wall else 0.0,
+        "errors": len(errors),
+        "error_sample": errors[0] if errors else None,
+        "session_latency": distribution(latencies),
+        "ttft": distribution(ttfts),
+        "nodes": {node: distribution(times) for node, times in sorted(nodes.items())},
+        "loop_lag": distribution(monitor.lags),
+    }
+
+
+def max_rss_mb() -> float:
+    """进程的最大常驻内存（MB），Linux上ru_maxrss单位是KB，macOS上是字节"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def flatten_metrics(result: dict) -> dict:
+    """把结果里参与对比的指标展开成 {名称: 数值}"""
+    metrics = {"throughput": result["throughput"]}
+    for group in ("session_latency", "ttft", "loop_lag"):
+        for key in ("p50", "p95"):
+            if key in result[group]:
+                metrics[f"{group}.{key}"] = result[group][key]
+    for node, dist in result["nodes"].items():
+        for key in ("p50", "p95"):
+            if key in dist:
+                metrics[f"nodes.{node}.{key}"] = dist[key]
+    for key, value in result["memory"].items():
+        if value is not None:
+            metrics[f"memory.{key}"] = value
+    return metrics
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[dict]:
+    """
+    与基线结果逐项对比
+
+    Args:
+        baseline: 之前保存的结果
+        current: 本次结果
+        threshold: 变差超过这个比例（如0.1表示10%）视为回归
+
+    Returns:
+        list[dict]: 每个指标的对比，包含基线值、当前值、变化比例和是否回归
+    """
+    base_metrics = flatten_metrics(baseline)
+    rows = []
+    for name, value in flatten_metrics(current).items():
+        base = base_metrics.get(name)
+        if base is None:
+            continue
+        change = (value - base) / base if base else 0.0
+        worse = -change if name in HIGHER_IS_BETTER else change
+        rows.append({
+            "metric": name,
+            "baseline": base,
+            "current": value,
+            "change": change,
+            "regression": worse > threshold,
+        })
+    return rows
+
+
+def print_report(result: dict):
+    config = result["config"]
+    print("=" * 72)
+    print(f"会话数: {config['sessions']}  并发: {config['concurrency']}  总结方式: {config['summary_mode']}  "
+          f"LLM首字延迟: {config['llm_latency']}s  输出速率: {config['tokens_per_second']}/s")
+    print(f"总耗时: {result['wall']:.2f}s  吞吐量: {result['throughput']:.2f} 会话/秒  失败: {result['errors']}")
+    for name, dist in [("会话耗时", result["session_latency"]), ("首个token", result["ttft"])] + \
+            [(f"节点 {node}", dist) for node, dist in result["nodes"].items()]:
+        if dist.get("n"):
+            print(f"{name:<28} n={dist['n']:<5} p50={dist['p50'] * 1000:8.1f}ms "
+                  f"p95={dist['p95'] * 1000:8.1f}ms max={dist['max'] * 1000:8.1f}ms")
+    if result["loop_lag"].get("n"):
+        print(f"事件循环延迟 p95={result['loop_lag']['p95'] * 1000:.1f}ms max={result['loop_lag']['max'] * 1000:.1f}ms")
+    memory = result["memory"]
+    print(f"内存: 最大RSS {memory['max_rss_mb']:.1f}MB" +
+          (f"  tracemalloc峰值 {memory['tracemalloc_peak_mb']:.1f}MB" if memory["tracemalloc_peak_mb"] else ""))
+    if result["error_sample"]:
+        print(f"失败示例: {result['error_sample']}")
+
+
+def print_comparison(rows: list[dict], threshold: float):
+    print("-" * 72)
+    print(f"与基线对比（变差超过 {threshold:.0%} 视为回归）")
+    for row in rows:
+        mark = "回归" if row["regression"] else ""
+        print(f"{row['metric']:<40} {row['baseline']:>10.4f} -> {row['current']:>10.4f} "
+              f"{row['change']:>+8.1%} {mark}")
+
+
+async def main(args):
+    if args.tracemalloc:
+        tracemalloc.start()
+    with local_static_site(pages=args.pages) as site_urls, \
+            run_stub_server(FakeLLMHandler, first_token_latency=args.llm_latency,
+                            tokens_per_second=args.tokens_per_second, answer_tokens=args.answer_tokens) as llm_url, \
+            run_stub_server(FakeSearchHandler, latency=args.search_latency, result_urls=site_urls) as search_url:
+        use_stub_env(llm_url, search_url)
+        os.environ.setdefault("PAGE_STORE_DIR", tempfile.mkdtemp(prefix="bench_page_store_"))
+        os.environ["SUMMARY_MODE"] = args.summary_mode
+        if args.cold:
+            # 网页存储立即过期，每个会话都真实爬取
+            os.environ["PAGE_STORE_MAX_AGE"] = "0"
+        module = load_study_module(6)
+        try:
+            result = await run_benchmark(module, args.sessions, args.concurrency)
+        finally:
+            await module.shutdown_crawler_pool()
+            await module.close_crawl_scheduler()
+            await module.close_search_clients()
+            await module.close_page_store()
+            await module.close_local_index()
+
+    tracemalloc_peak = None
+    if args.tracemalloc:
+        tracemalloc_peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+    result["memory"] = {"max_rss_mb": max_rss_mb(), "tracemalloc_peak_mb": tracemalloc_peak}
+    result["config"] = {
+        "sessions": args.sessions,
+        "concurrency": args.concurrency,
+        "summary_mode": args.summary_mode,
+        "llm_latency": args.llm_latency,
+        "tokens_per_second": args.tokens_per_second,
+        "answer_tokens": args.answer_tokens,
+        "search_latency": args.search_latency,
+        "pages": args.pages,
+        "cold": args.cold,
+    }
+    result["environment"] = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+    }
+    print_report(result)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows = compare(baseline, result, args.threshold)
+        print_comparison(rows, args.threshold)
+        result["comparison"] = {"baseline": args.baseline, "threshold": args.threshold, "metrics": rows}
+        regressions = [row for row in rows if row["regression"]]
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {args.output}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=50, help="会话总数")
+    parser.add_argument("--concurrency", type=int, default=10, help="同时运行的会话数")
+    parser.add_argument("--summary-mode", default="single", choices=["single", "map_reduce"], help="总结方式")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="假LLM首字延迟（秒）")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="假LLM输出速率")
+    parser.add_argument("--answer-tokens", type=int, default=40, help="假LLM回答的token数")
+    parser.add_argument("--search-latency", type=float, default=0.1, help="假搜索延迟（秒）")
+    parser.add_argument("--pages", type=int, default=10, help="静态站点的页面数")
+    parser.add_argument("--cold", action="store_true", help="不使用网页存储，每次都真实爬取")
+    parser.add_argument("--tracemalloc", action="store_true", help="用tracemalloc统计Python内存峰值（会变慢）")
+    parser.add_argument("--output", help="结果保存为JSON的路径")
+    parser.add_argument("--baseline", help="用于对比的基线JSON")
+    parser.add_argument("--threshold", type=float, default=0.1, help="回归判定阈值，默认0.1（10%%）")
+    sys.exit(asyncio.run(main(parser.parse_args())))
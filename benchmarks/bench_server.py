@@ -0,0 +1,115 @@
+"""
+HTTP服务压测：并发限制、429背压和优雅关闭
+
+在本进程里用uvicorn启动 server.app，LLM和搜索指向本地桩服务，爬取指向本地静态站点，
+然后用httpx同时发出N个 POST /chat 流式请求（分属若干个客户端），统计：
+- 各状态码的数量（200正常执行，429被限流，503排队超时）
+- 200请求的首个token耗时和总耗时
+- 压测结束后触发关闭，排空在途请求和后台爬取所需的时间
+
+运行：python benchmarks/bench_server.py --requests 100 --clients 10 --max-concurrency 8 --max-queue 16
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+from collections import Counter
+
+import httpx
+
+from stub_servers import run_stub_server, FakeLLMHandler, FakeSearchHandler
+from static_site import local_static_site
+from graph_loader import use_stub_env, ROOT_DIR
+from bench_crawler_pool import percentile
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def one_request(client, base_url, i, client_id):
+    """发送一个流式请求，返回状态码、首个token耗时和总耗时"""
+    start = time.perf_counter()
+    ttft = None
+    payload = {"question": f"问题{i}：crawl4ai是什么？"}
+    async with client.stream("POST", f"{base_url}/chat", json=payload, headers={"X-Client-Id": client_id}) as response:
+        if response.status_code != 200:
+            await response.aread()
+            return response.status_code, None, time.perf_counter() - start
+        async for line in response.aiter_lines():
+            if ttft is None and line.startswith("data:") and json.loads(line[5:]).get("event") == "token":
+                ttft = time.perf_counter() - start
+    return 200, ttft, time.perf_counter() - start
+
+
+async def main(args):
+    import uvicorn
+
+    with local_static_site(pages=10) as site_urls, \
+            run_stub_server(FakeLLMHandler, first_token_latency=args.llm_latency) as llm_url, \
+            run_stub_server(FakeSearchHandler, result_urls=site_urls) as search_url:
+        use_stub_env(llm_url, search_url)
+        os.environ.setdefault("PAGE_STORE_DIR", tempfile.mkdtemp(prefix="bench_page_store_"))
+        os.environ["SERVER_MAX_CONCURRENCY"] = str(args.max_concurrency)
+        os.environ["SERVER_MAX_QUEUE"] = str(args.max_queue)
+        os.environ["SERVER_PER_CLIENT"] = str(args.per_client)
+        # server在导入时读取环境变量，所以要在设置之后再导入
+        if ROOT_DIR not in sys.path:
+            sys.path.append(ROOT_DIR)
+        from server import app
+
+        port = free_port()
+        server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        serve_task = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.05)
+
+        base_url = f"http://127.0.0.1:{port}"
+        limits = httpx.Limits(max_connections=args.requests)
+        async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+            start = time.perf_counter()
+            results = await asyncio.gather(*(
+                one_request(client, base_url, i, f"client-{i % args.clients}") for i in range(args.requests)
+            ), return_exceptions=True)
+            wall = time.perf_counter() - start
+            health = (await client.get(f"{base_url}/healthz")).json()
+
+        drain_start = time.perf_counter()
+        server.should_exit = True
+        await serve_task
+        drain = time.perf_counter() - drain_start
+
+    statuses = Counter(r[0] if not isinstance(r, Exception) else type(r).__name__ for r in results)
+    ok = [r for r in results if not isinstance(r, Exception) and r[0] == 200]
+    ttfts = [r[1] for r in ok if r[1] is not None]
+    totals = [r[2] for r in ok]
+
+    print("=" * 60)
+    print(f"请求数: {args.requests}  客户端数: {args.clients}  并发上限: {args.max_concurrency}  "
+          f"队列上限: {args.max_queue}  单客户端上限: {args.per_client}")
+    print(f"总耗时: {wall:.2f}s  状态码: {dict(statuses)}")
+    if ttfts:
+        print(f"首个token p50={percentile(ttfts, 50):.3f}s p95={percentile(ttfts, 95):.3f}s")
+    if totals:
+        print(f"请求耗时 p50={percentile(totals, 50):.3f}s p95={percentile(totals, 95):.3f}s  "
+              f"吞吐量: {len(totals) / wall:.2f} 请求/秒")
+    print(f"准入统计: {health['admission']}")
+    print(f"关闭耗时（排空在途请求和后台爬取）: {drain:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=100, help="请求总数")
+    parser.add_argument("--clients", type=int, default=10, help="客户端数（X-Client-Id）")
+    parser.add_argument("--max-concurrency", type=int, default=8, help="服务的并发上限")
+    parser.add_argument("--max-queue", type=int, default=16, help="服务的队列上限")
+    parser.add_argument("--per-client", type=int, default=4, help="单客户端并发上限")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="假LLM首字延迟（秒）")
+    asyncio.run(main(parser.parse_args()))
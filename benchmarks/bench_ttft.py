@@ -0,0 +1,77 @@
+"""
+首个token耗时基准测试：流式 vs 非流式
+
+分别以 LLM_STREAMING=0 和 LLM_STREAMING=1 加载WebAgent图，LLM和搜索指向本地桩服务，
+爬取指向本地静态站点，用 stream_answer 消费事件，统计用户看到第一个回答token的时间
+（time-to-first-token）和整个会话的耗时。非流式时首个token要等整段回答生成完才出现。
+
+运行：python benchmarks/bench_ttft.py --sessions 10 --answer-tokens 200
+"""
+
+import os
+import sys
+import asyncio
+import argparse
+import tempfile
+
+from stub_servers import run_stub_server, FakeLLMHandler, FakeSearchHandler
+from static_site import local_static_site
+from graph_loader import load_study_module, use_stub_env, ROOT_DIR
+from bench_crawler_pool import percentile
+from bench_concurrency import build_initial_state
+
+sys.path.append(ROOT_DIR)
+from streaming import stream_answer
+
+
+async def measure(module, sessions):
+    """依次运行sessions个会话，返回每个会话的首个token耗时和总耗时"""
+    ttfts, totals = [], []
+    for i in range(sessions):
+        state = build_initial_state(module, f"问题{i}：crawl4ai是什么？")
+        async for event in stream_answer(module.graph, state, answer_nodes=module.ANSWER_NODES):
+            if event["event"] == "done":
+                # 没有收到流式token时，用户要等到整个回答结束才能看到内容
+                ttfts.append(event["ttft"] if event["ttft"] is not None else event["elapsed"])
+                totals.append(event["elapsed"])
+    return ttfts, totals
+
+
+async def main(args):
+    with local_static_site(pages=5) as site_urls, \
+            run_stub_server(FakeLLMHandler, first_token_latency=args.llm_latency,
+                            tokens_per_second=args.tokens_per_second, answer_tokens=args.answer_tokens) as llm_url, \
+            run_stub_server(FakeSearchHandler, result_urls=site_urls) as search_url:
+        use_stub_env(llm_url, search_url)
+        os.environ.setdefault("PAGE_STORE_DIR", tempfile.mkdtemp(prefix="bench_page_store_"))
+        results = {}
+        module = None
+        try:
+            for streaming in ("0", "1"):
+                # 模块在导入时读取LLM_STREAMING，所以每种模式重新加载一次
+                os.environ["LLM_STREAMING"] = streaming
+                module = load_study_module(6)
+                results[streaming] = await measure(module, args.sessions)
+        finally:
+            if module is not None:
+                await module.shutdown_crawler_pool()
+                await module.close_crawl_scheduler()
+                await module.close_search_clients()
+                await module.close_page_store()
+                await module.close_local_index()
+
+    print("=" * 60)
+    print(f"会话数: {args.sessions}  回答token数: {args.answer_tokens}  输出速率: {args.tokens_per_second}/s")
+    for streaming, label in (("0", "非流式"), ("1", "流式")):
+        ttfts, totals = results[streaming]
+        print(f"{label}: 首个token p50={percentile(ttfts, 50):.3f}s p95={percentile(ttfts, 95):.3f}s  "
+              f"会话耗时 p50={percentile(totals, 50):.3f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=10, help="每种模式运行的会话数")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="假LLM首字延迟（秒）")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="假LLM输出速率")
+    parser.add_argument("--answer-tokens", type=int, default=200, help="假LLM回答的token数")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,59 @@
+"""
+按编号加载学习记录里的图模块
+
+学习记录的文件名包含中文和全角冒号，不能直接import，这里用importlib按路径加载。
+模块在导入时就会读取环境变量创建LLM，所以要先设置好桩服务的地址再加载。
+"""
+
+import os
+import sys
+import glob
+import importlib.util
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUDY_DIR = os.path.join(ROOT_DIR, "学习记录")
+
+
+def load_study_module(number: int):
+    """
+    加载 学习记录/Langgraph学习{number}：*.py
+
+    Args:
+        number: 学习记录编号
+
+    Returns:
+        module: 加载后的模块，图对象为module.graph或module.app_graph
+    """
+    paths = glob.glob(os.path.join(STUDY_DIR, f"Langgraph学习{number}：*.py"))
+    if not paths:
+        raise FileNotFoundError(f"找不到学习记录{number}")
+    if ROOT_DIR not in sys.path:
+        sys.path.append(ROOT_DIR)
+    spec = importlib.util.spec_from_file_location(f"langgraph_study_{number}", paths[0])
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def use_stub_env(llm_url: str, search_url: str = None):
+    """
+    把LLM和搜索的地址指向桩服务
+
+    桩服务和本地测试网站都在本机，默认关闭上游限流和按网站的抓取间隔，
+    测的是图本身的开销；需要评估限流影响时可以预先设置这些环境变量
+
+    Args:
+        llm_url: 假LLM服务的根地址
+        search_url: 假搜索服务的根地址
+    """
+    os.environ.setdefault("RATE_LIMIT_SILICONFLOW", "0")
+    os.environ.setdefault("RATE_LIMIT_TAVILY", "0")
+    os.environ.setdefault("CRAWL_PER_HOST", "64")
+    os.environ.setdefault("CRAWL_HOST_DELAY", "0")
+    os.environ["SILICONFLOW_API_KEY"] = "stub"
+    os.environ["SILICONFLOW_BASE_URL"] = llm_url
+    if search_url:
+        os.environ["TAVILY_API_KEY"] = "stub"
+        os.environ["TAVILY_SEARCH_URL"] = f"{search_url}/search"
+        os.environ["SEARCH_PROVIDER"] = "tavily"
+        os.environ["SEARCH_PROVIDERS"] = "tavily"
@@ -0,0 +1,84 @@
+"""
+本地静态站点，供benchmark脚本爬取，不依赖外网
+
+生成若干个带正文的HTML页面，用http.server在后台线程里提供服务。
+"""
+
+import os
+import json
+import tempfile
+import threading
+from contextlib import contextmanager
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    """不打印访问日志的静态文件处理器"""
+
+    def log_message(self, format, *args):
+        pass
+
+
+def build_fixture_pages(root: str, pages: int = 20, paragraphs: int = 30, spa_pages: int = 0):
+    """
+    在root目录下生成测试用的HTML页面
+
+    Args:
+        root: 输出目录
+        pages: 页面数量
+        paragraphs: 每个页面的段落数
+        spa_pages: 其中多少个页面的正文由JS渲染（HTML里只有空的挂载点），放在最后
+
+    Returns:
+        list[str]: 生成的页面文件名
+    """
+    names = []
+    for i in range(pages):
+        body = "\n".join(
+            f"<p>第{i}页第{j}段：LangGraph与crawl4ai的测试内容，用于衡量爬取延迟。</p>"
+            for j in range(paragraphs)
+        )
+        article = f"<article><h1>测试页面{i}</h1>{body}</article>"
+        if i >= pages - spa_pages:
+            # 正文只存在于脚本里，必须执行JS才能看到
+            article = (
+                '<div id="root"></div>'
+                f"<script>document.getElementById('root').innerHTML = {json.dumps(article)};</script>"
+            )
+        html = (
+            f"<html><head><title>测试页面{i}</title></head>"
+            f"<body><nav>导航</nav>{article}"
+            f"<footer>页脚</footer></body></html>"
+        )
+        name = f"page_{i}.html"
+        with open(os.path.join(root, name), "w", encoding="utf-8") as f:
+            f.write(html)
+        names.append(name)
+    return names
+
+
+@contextmanager
+def local_static_site(pages: int = 20, paragraphs: int = 30, spa_pages: int = 0):
+    """
+    启动本地静态站点
+
+    Args:
+        pages: 页面数量
+        paragraphs: 每个页面的段落数
+        spa_pages: 其中正文由JS渲染的页面数
+
+    Yields:
+        list[str]: 所有页面的URL
+    """
+    with tempfile.TemporaryDirectory() as root:
+        names = build_fixture_pages(root, pages, paragraphs, spa_pages)
+        server = ThreadingHTTPServer(("127.0.0.1", 0), partial(_QuietHandler, directory=root))
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            host, port = server.server_address
+            yield [f"http://{host}:{port}/{name}" for name in names]
+        finally:
+            server.shutdown()
+            server.server_close()
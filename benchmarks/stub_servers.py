@@ -0,0 +1,182 @@
+"""
+本地桩服务：OpenAI兼容的假LLM接口和假Tavily搜索接口
+
+供benchmark脚本使用，不依赖外网和API密钥。LLM桩服务按配置的首字延迟和
+token速率返回结果，支持stream=True的SSE输出和工具调用；搜索桩服务返回
+指定的URL列表。服务运行在后台线程里，延迟不占用被测进程的事件循环。
+"""
+
+import json
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class _JSONHandler(BaseHTTPRequestHandler):
+    """读取JSON请求体、返回JSON的基础处理器"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def send_json(self, payload: dict, status: int = 200):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeLLMHandler(_JSONHandler):
+    """
+    OpenAI兼容的 /chat/completions 桩接口
+
+    请求里带了tools且最后一条是用户消息时，返回一次工具调用（优先选名字里带search的工具），
+    否则返回一段固定长度的文本。
+    """
+
+    first_token_latency = 0.2  # 首个token前的延迟（秒）
+    prefill_seconds_per_1k = 0.0  # 每1000个prompt token增加的首字延迟，模拟长上下文的预填充开销
+    tokens_per_second = 50.0  # 输出速率
+    answer_tokens = 40  # 文本回复的token数
+
+    def do_POST(self):
+        request = self.read_json()
+        messages = request.get("messages", [])
+        tools = request.get("tools") or []
+        last_role = messages[-1]["role"] if messages else "user"
+        tool_call = None
+        if tools and last_role == "user":
+            names = [t["function"]["name"] for t in tools]
+            name = next((n for n in names if "search" in n), names[0])
+            query = messages[-1].get("content") or ""
+            if isinstance(query, list):
+                query = " ".join(part.get("text", "") for part in query if isinstance(part, dict))
+            tool_call = {"name": name, "arguments": json.dumps({"query": query.strip()}, ensure_ascii=False)}
+        tokens = [f"第{i}段" for i in range(self.answer_tokens)]
+        prompt_tokens = sum(len(str(m.get("content") or "")) for m in messages) // 2
+
+        time.sleep(self.first_token_latency + prompt_tokens / 1000 * self.prefill_seconds_per_1k)
+        if request.get("stream"):
+            self._stream(request, tokens, tool_call, prompt_tokens)
+        else:
+            time.sleep(len(tokens) / self.tokens_per_second if not tool_call else 0)
+            self._complete(request, tokens, tool_call, prompt_tokens)
+
+    def _complete(self, request, tokens, tool_call, prompt_tokens):
+        message = {"role": "assistant", "content": None if tool_call else "".join(tokens)}
+        if tool_call:
+            message["tool_calls"] = [{"id": f"call_{uuid.uuid4().hex[:8]}", "type": "function", "function": tool_call}]
+        completion_tokens = 10 if tool_call else len(tokens)
+        self.send_json({
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if tool_call else "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+    def _stream(self, request, tokens, tool_call, prompt_tokens):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+        def send(delta, finish_reason=None, usage=None):
+            payload = {
+                "id": chunk_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request.get("model", "stub"),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if delta is not None else [],
+            }
+            if usage:
+                payload["usage"] = usage
+            self.wfile.write(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        if tool_call:
+            send({"role": "assistant", "tool_calls": [{
+                "index": 0, "id": f"call_{uuid.uuid4().hex[:8]}", "type": "function",
+                "function": {"name": tool_call["name"], "arguments": ""},
+            }]})
+            args = tool_call["arguments"]
+            for i in range(0, len(args), 8):
+                send({"tool_calls": [{"index": 0, "function": {"arguments": args[i:i + 8]}}]})
+            send({}, "tool_calls")
+            completion_tokens = 10
+        else:
+            send({"role": "assistant", "content": ""})
+            for token in tokens:
+                time.sleep(1 / self.tokens_per_second)
+                send({"content": token})
+            send({}, "stop")
+            completion_tokens = len(tokens)
+        if (request.get("stream_options") or {}).get("include_usage"):
+            send(None, usage={
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            })
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+
+class FakeSearchHandler(_JSONHandler):
+    """Tavily兼容的 /search 桩接口，返回配置好的URL列表"""
+
+    latency = 0.1  # 搜索延迟（秒）
+    result_urls = []  # 返回的URL
+
+    def do_POST(self):
+        request = self.read_json()
+        time.sleep(self.latency)
+        query = request.get("query", "")
+        max_results = request.get("max_results", 5)
+        self.send_json({
+            "query": query,
+            "results": [
+                {"title": f"{query} 结果{i}", "url": url, "content": f"关于{query}的摘要{i}", "score": 1.0 - i * 0.1}
+                for i, url in enumerate(self.result_urls[:max_results])
+            ],
+        })
+
+
+@contextmanager
+def run_stub_server(handler_cls, **attrs):
+    """
+    在后台线程里启动桩服务
+
+    Args:
+        handler_cls: 处理器类
+        **attrs: 覆盖处理器类属性，如 first_token_latency=0.5
+
+    Yields:
+        str: 服务的根地址，如 http://127.0.0.1:12345
+    """
+    handler = type(handler_cls.__name__, (handler_cls,), attrs)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        host, port = server.server_address
+        yield f"http://{host}:{port}"
+    finally:
+        server.shutdown()
+        server.server_close()
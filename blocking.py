@@ -0,0 +1,59 @@
+"""
+有界线程池：把只能同步调用的阻塞操作放到线程里执行，不阻塞事件循环
+
+asyncio.to_thread使用默认线程池，大小不可控；这里统一使用一个可配置大小的线程池，
+并发会话很多时，阻塞调用在线程池里排队，而不是无限制地开线程。
+"""
+
+import os
+import asyncio
+import contextvars
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+_executor = None
+
+
+def get_blocking_executor() -> ThreadPoolExecutor:
+    """
+    获取共享的阻塞操作线程池
+
+    环境变量:
+        BLOCKING_POOL_SIZE: 线程池大小，默认8
+
+    Returns:
+        ThreadPoolExecutor: 共享线程池
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv('BLOCKING_POOL_SIZE', '8')),
+            thread_name_prefix="blocking",
+        )
+    return _executor
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    在共享线程池里执行阻塞函数
+
+    与asyncio.to_thread一样会带上当前的contextvars，回调和追踪信息不会丢失
+
+    Args:
+        func: 同步函数
+        *args, **kwargs: 传给func的参数
+
+    Returns:
+        func的返回值
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(get_blocking_executor(), ctx.run, partial(func, *args, **kwargs))
+
+
+def shutdown_blocking_executor(wait: bool = True):
+    """关闭共享线程池"""
+    global _executor
+    executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
@@ -0,0 +1,192 @@
+"""
+上下文打包：按token预算挑选与问题最相关的网页片段
+
+原来summary_bot_node把抓取到的所有网页原文拼起来整段发给总结模型，网页一大就会
+超出模型上下文、增加成本和延迟。这里改为：
+1. 把每个网页按段落切成大小相近的片段
+2. 用BM25（本地计算，中文按字的二元组切词）给每个片段和用户问题打分
+3. 按分数从高到低装入片段，直到用满token预算
+4. 装入的片段按原网页、原顺序输出，并带上来源URL
+"""
+
+import re
+import math
+from collections import Counter
+
+_CJK = r"㐀-䶿一-鿿豈-﫿"
+_CJK_RE = re.compile(f"[{_CJK}]")
+_WORD_RE = re.compile(f"[{_CJK}]+|[a-zA-Z0-9_]+")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本的token数：中文大约每字一个token，英文单词大约1.3个token
+
+    Args:
+        text: 文本
+
+    Returns:
+        int: 估算的token数
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    words = len(re.findall(r"[a-zA-Z0-9_]+", text))
+    others = len(re.findall(r"[^\sa-zA-Z0-9_" + _CJK + "]", text))
+    return cjk + math.ceil(words * 1.3) + others // 2
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    用于检索打分的切词：英文按单词转小写，中文按相邻两个字切成二元组（单字词保留单字）
+
+    Args:
+        text: 文本
+
+    Returns:
+        list[str]: 词列表
+    """
+    terms = []
+    for word in _WORD_RE.findall(text.lower()):
+        if _CJK_RE.match(word):
+            if len(word) == 1:
+                terms.append(word)
+            else:
+                terms.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            terms.append(word)
+    return terms
+
+
+def split_chunks(text: str, chunk_tokens: int = 300) -> list[str]:
+    """
+    把网页按段落切成不超过chunk_tokens的片段，短段落会合并，超长段落按句子再切
+
+    Args:
+        text: 网页markdown
+        chunk_tokens: 每个片段的目标token数
+
+    Returns:
+        list[str]: 片段列表
+    """
+    pieces = []
+    for paragraph in re.split(r"\n\s*\n", text or ""):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if estimate_tokens(paragraph) <= chunk_tokens:
+            pieces.append(paragraph)
+            continue
+        # 超长段落按句子切开
+        sentences = re.split(r"(?<=[。！？!?；;.\n])", paragraph)
+        current = ""
+        for sentence in sentences:
+            if current and estimate_tokens(current + sentence) > chunk_tokens:
+                pieces.append(current)
+                current = ""
+            current += sentence
+        if current.strip():
+            pieces.append(current)
+
+    chunks = []
+    current = ""
+    for piece in pieces:
+        if current and estimate_tokens(current) + estimate_tokens(piece) > chunk_tokens:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class BM25:
+    """
+    BM25打分
+
+    Args:
+        documents: 已切词的文档列表
+        k1, b: BM25参数
+    """
+
+    def __init__(self, documents: list[list[str]], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = [Counter(doc) for doc in documents]
+        self.doc_lens = [len(doc) for doc in documents]
+        self.avg_len = sum(self.doc_lens) / len(documents) if documents else 0.0
+        doc_freq = Counter()
+        for tf in self.term_freqs:
+            doc_freq.update(tf.keys())
+        n = len(documents)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freq.items()}
+
+    def score(self, query: list[str], index: int) -> float:
+        tf = self.term_freqs[index]
+        length_norm = 1 - self.b + self.b * self.doc_lens[index] / (self.avg_len or 1)
+        score = 0.0
+        for term in set(query):
+            freq = tf.get(term)
+            if freq:
+                score += self.idf[term] * freq * (self.k1 + 1) / (freq + self.k1 * length_norm)
+        return score
+
+
+def pack_context(question: str, pages: list[dict], token_budget: int = 6000, chunk_tokens: int = 300):
+    """
+    在token预算内，挑选与问题最相关的网页片段
+
+    Args:
+        question: 用户的原始问题
+        pages: 网页列表，每项包含url和markdown
+        token_budget: 输出内容的token预算
+        chunk_tokens: 每个片段的目标token数
+
+    Returns:
+        tuple[str, dict]: 打包后的文本，以及统计信息
+            （原始token数、打包后token数、片段总数、选中片段数、来源URL）
+    """
+    chunks = []  # (网页序号, 片段序号, 文本, token数)
+    for page_index, page in enumerate(pages):
+        for chunk_index, chunk in enumerate(split_chunks(page.get("markdown", ""), chunk_tokens)):
+            chunks.append((page_index, chunk_index, chunk, estimate_tokens(chunk)))
+
+    tokens_in = sum(estimate_tokens(page.get("markdown", "")) for page in pages)
+    stats = {"tokens_in": tokens_in, "tokens_out": 0, "chunks": len(chunks), "selected": 0, "sources": []}
+    if not chunks:
+        return "", stats
+
+    bm25 = BM25([tokenize(chunk[2]) for chunk in chunks])
+    query = tokenize(question)
+    # 分数相同时优先靠前的网页和片段
+    ranked = sorted(
+        range(len(chunks)),
+        key=lambda i: (-bm25.score(query, i), chunks[i][0], chunks[i][1]),
+    )
+
+    selected = []
+    used = 0
+    for i in ranked:
+        tokens = chunks[i][3]
+        if used + tokens > token_budget:
+            continue
+        selected.append(i)
+        used += tokens
+
+    # 选中的片段按原网页、原顺序输出
+    selected.sort(key=lambda i: (chunks[i][0], chunks[i][1]))
+    sections = []
+    current_page = None
+    for i in selected:
+        page_index, _, text, _ = chunks[i]
+        if page_index != current_page:
+            current_page = page_index
+            url = pages[page_index].get("url")
+            sections.append(f"## 来源: {url}" if url else "## 来源: 未知")
+            if url:
+                stats["sources"].append(url)
+        sections.append(text)
+
+    stats["tokens_out"] = used
+    stats["selected"] = len(selected)
+    return "\n\n".join(sections), stats
@@ -0,0 +1,292 @@
+"""
+爬取调度：按网站（host）控制抓取节奏
+
+多个会话同时抓取同一个热门网站时，请求一起打过去很容易被限速或封禁，重试的代价比省下的时间还多。
+所有抓取请求先在这里排队，再交给浏览器池：
+1. 每个网站的并发上限，以及同一网站两次请求之间的最小间隔（robots.txt里的Crawl-delay更大时以它为准）
+2. robots.txt按网站缓存，不允许抓取的URL直接返回失败
+3. 全局按优先级排队：交互请求（用户正在等的）排在后台预取前面；
+   某个网站达到上限时，后面其他网站的请求不会被它挡住
+4. 每个网站的排队等待时间记录到指标 crawl_host_wait_seconds
+5. 共享一个httpx客户端（robots.txt和HTTP直连抓取都用它），同一网站的连接保持复用
+
+环境变量:
+    CRAWL_MAX_ACTIVE: 同时进行的抓取总数，默认等于浏览器池容量
+    CRAWL_PER_HOST: 每个网站的并发上限，默认2
+    CRAWL_HOST_DELAY: 同一网站两次请求之间的最小间隔秒数，默认1
+    CRAWL_RESPECT_ROBOTS: 是否遵守robots.txt，默认1
+    CRAWL_ROBOTS_AGENT: 匹配robots.txt规则用的User-agent，默认 "*"
+    CRAWL_ROBOTS_TTL: robots.txt缓存秒数，默认3600
+"""
+
+import os
+import time
+import heapq
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+
+import httpx
+
+from instrumentation import get_metrics
+from structured_logging import get_logger
+
+logger = get_logger("crawl_scheduler")
+
+# 数值越小越先调度
+PRIORITIES = {"interactive": 0, "background": 10}
+# robots.txt最多读取的字节数（RFC 9309要求至少支持500KiB）
+ROBOTS_MAX_BYTES = 500 * 1024
+# robots.txt获取失败（5xx、网络错误）时的缓存秒数，过一会儿再试
+ROBOTS_ERROR_TTL = 60
+
+
+class RobotsDisallowedError(Exception):
+    """robots.txt不允许抓取该URL"""
+
+
+def host_of(url: str) -> str:
+    """URL所在的网站，如 www.zhihu.com"""
+    return (urlsplit(url).hostname or "").lower()
+
+
+class _HostState:
+    __slots__ = ("active", "next_allowed", "delay")
+
+    def __init__(self, delay: float):
+        self.active = 0
+        self.next_allowed = 0.0
+        self.delay = delay
+
+
+class CrawlScheduler:
+    """
+    按网站调度的抓取队列
+
+    Args:
+        max_active: 同时进行的抓取总数
+        per_host: 每个网站的并发上限
+        host_delay: 同一网站两次请求开始之间的最小间隔（秒）
+        respect_robots: 是否遵守robots.txt
+        robots_agent: 匹配robots.txt规则用的User-agent
+        robots_ttl: robots.txt缓存秒数
+        timeout: 获取robots.txt的超时秒数
+    """
+
+    def __init__(self, max_active: int = 8, per_host: int = 2, host_delay: float = 1.0,
+                 respect_robots: bool = True, robots_agent: str = "*", robots_ttl: float = 3600,
+                 timeout: float = 5.0):
+        self.max_active = max(1, max_active)
+        self.per_host = max(1, per_host)
+        self.host_delay = host_delay
+        self.respect_robots = respect_robots
+        self.robots_agent = robots_agent
+        self.robots_ttl = robots_ttl
+        self.timeout = timeout
+        self._waiters = []  # 堆：(优先级, 序号, host, future)
+        self._seq = itertools.count()
+        self._hosts = {}
+        self._active = 0
+        self._timer = None
+        self._timer_at = None
+        self._robots = {}  # host -> (过期时间, 加载任务)
+        self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """共享的HTTP客户端，按网站保持长连接"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                follow_redirects=True,
+                limits=httpx.Limits(
+                    max_connections=self.max_active * 2,
+                    max_keepalive_connections=self.max_active * 2,
+                    keepalive_expiry=30,
+                ),
+            )
+        return self._client
+
+    def _host(self, host: str) -> _HostState:
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _HostState(self.host_delay)
+        return state
+
+    # ---------- robots.txt ----------
+
+    async def _load_robots(self, host: str, robots_url: str):
+        """获取并解析robots.txt，不抛异常；返回None表示没有限制"""
+        ttl = self.robots_ttl
+        parser = None
+        try:
+            response = await self.client.get(robots_url)
+            if response.status_code == 200:
+                parser = RobotFileParser(robots_url)
+                parser.parse(response.content[:ROBOTS_MAX_BYTES].decode("utf-8", "ignore").splitlines())
+            elif response.status_code >= 500:
+                # 服务端暂时出错：先不限制，短时间后重新获取
+                ttl = ROBOTS_ERROR_TTL
+            # 4xx表示没有robots.txt，不限制
+        except Exception as e:
+            # 取不到robots.txt时不阻塞用户正在等的抓取，短时间后重新获取
+            logger.debug("获取 %s 失败: %s", robots_url, e)
+            ttl = ROBOTS_ERROR_TTL
+        if parser is not None:
+            crawl_delay = parser.crawl_delay(self.robots_agent)
+            if crawl_delay:
+                state = self._host(host)
+                state.delay = max(self.host_delay, float(crawl_delay))
+        self._robots[host] = (time.monotonic() + ttl, self._robots[host][1])
+        return parser
+
+    async def robots_for(self, url: str):
+        """
+        网站的robots.txt规则，按网站缓存，同一网站并发请求只获取一次
+
+        Returns:
+            RobotFileParser | None: 解析后的规则，None表示没有限制
+        """
+        parts = urlsplit(url)
+        host = host_of(url)
+        entry = self._robots.get(host)
+        if entry is None or entry[0] <= time.monotonic():
+            task = asyncio.create_task(self._load_robots(host, f"{parts.scheme}://{parts.netloc}/robots.txt"))
+            # 加载期间过期时间设为无穷大，其他请求等同一个任务
+            entry = self._robots[host] = (float("inf"), task)
+        # shield：某个等待者被取消不影响其他等待同一个robots.txt的请求
+        return await asyncio.shield(entry[1])
+
+    async def allowed(self, url: str) -> bool:
+        """robots.txt是否允许抓取该URL"""
+        if not self.respect_robots:
+            return True
+        parser = await self.robots_for(url)
+        return parser is None or parser.can_fetch(self.robots_agent, url)
+
+    # ---------- 排队 ----------
+
+    def _dispatch(self):
+        """按优先级把空出来的名额分给等待者；网站还在间隔期内的，定时再调度"""
+        now = time.monotonic()
+        skipped = []
+        wakeup = None
+        while self._waiters and self._active < self.max_active:
+            item = heapq.heappop(self._waiters)
+            _, _, host, future = item
+            if future.done():
+                # 等待者已取消
+                continue
+            state = self._host(host)
+            if state.active >= self.per_host:
+                skipped.append(item)
+                continue
+            if state.next_allowed > now:
+                skipped.append(item)
+                wakeup = state.next_allowed if wakeup is None else min(wakeup, state.next_allowed)
+                continue
+            state.active += 1
+            state.next_allowed = now + state.delay
+            self._active += 1
+            future.set_result(None)
+        for item in skipped:
+            heapq.heappush(self._waiters, item)
+        if wakeup is not None and (self._timer_at is None or wakeup < self._timer_at):
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer_at = wakeup
+            self._timer = asyncio.get_running_loop().call_later(wakeup - now, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = self._timer_at = None
+        self._dispatch()
+
+    def _release(self, host: str):
+        self._hosts[host].active -= 1
+        self._active -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, url: str, priority: str = "interactive"):
+        """
+        排队获得一个抓取名额，用完自动归还
+
+        Args:
+            url: 要抓取的URL
+            priority: "interactive"（用户正在等的请求）或 "background"（预取）
+
+        Raises:
+            RobotsDisallowedError: robots.txt不允许抓取
+        """
+        if not await self.allowed(url):
+            raise RobotsDisallowedError(url)
+        host = host_of(url)
+        wait_start = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (PRIORITIES.get(priority, 0), next(self._seq), host, future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # 名额已经分到但任务被取消，归还名额
+            if future.done() and not future.cancelled():
+                self._release(host)
+            raise
+        get_metrics().crawl_host_wait.observe(time.perf_counter() - wait_start, host=host, priority=priority)
+        try:
+            yield
+        finally:
+            self._release(host)
+
+    def stats(self) -> dict:
+        """当前的排队和并发情况"""
+        return {
+            "active": self._active,
+            "waiting": sum(1 for item in self._waiters if not item[3].done()),
+            "hosts": {host: state.active for host, state in self._hosts.items() if state.active},
+        }
+
+    async def aclose(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+_scheduler = None
+_scheduler_loop = None
+
+
+def get_crawl_scheduler() -> CrawlScheduler:
+    """
+    获取进程内共享的爬取调度器，首次调用时按环境变量创建；换了事件循环时重建
+
+    Returns:
+        CrawlScheduler: 共享的爬取调度器
+    """
+    global _scheduler, _scheduler_loop
+    loop = asyncio.get_running_loop()
+    if _scheduler_loop is not loop:
+        _scheduler, _scheduler_loop = None, loop
+    if _scheduler is None:
+        pool_capacity = int(os.getenv('CRAWLER_POOL_SIZE', '2')) * int(os.getenv('CRAWLER_PAGES_PER_BROWSER', '4'))
+        _scheduler = CrawlScheduler(
+            max_active=int(os.getenv('CRAWL_MAX_ACTIVE', str(pool_capacity))),
+            per_host=int(os.getenv('CRAWL_PER_HOST', '2')),
+            host_delay=float(os.getenv('CRAWL_HOST_DELAY', '1')),
+            respect_robots=os.getenv('CRAWL_RESPECT_ROBOTS', '1') == '1',
+            robots_agent=os.getenv('CRAWL_ROBOTS_AGENT', '*'),
+            robots_ttl=float(os.getenv('CRAWL_ROBOTS_TTL', '3600')),
+        )
+    return _scheduler
+
+
+async def close_crawl_scheduler():
+    """关闭共享的HTTP客户端，程序退出前调用"""
+    global _scheduler
+    scheduler, _scheduler = _scheduler, None
+    if scheduler is not None:
+        await scheduler.aclose()
@@ -0,0 +1,650 @@
+from crawl4ai import CrawlerRunConfig, CacheMode
+import time
+import uuid
+import asyncio
+from crawler_pool import get_crawler_pool, shutdown_crawler_pool
+from page_store import get_page_store, close_page_store
+from crawl_scheduler import get_crawl_scheduler, RobotsDisallowedError
+from http_fetch import HTTP_FIRST, fetch_http
+from document_extract import suffix_kind
+from search_engine import canonical_url
+from page_dedup import PAGE_DEDUP, dedup_pages, known_mirrors
+from local_index import LOCAL_INDEX, get_local_index
+from blocking import run_blocking
+from instrumentation import get_metrics
+from structured_logging import get_logger, preview
+
+logger = get_logger("crawl_tool")
+
+urls = [
+    "https://www.huangli.com/huangli/2025/04_12.html",
+    "https://www.zhihu.com/question/609483833/answer/3420895685"
+]
+
+# 爬虫配置
+run_conf = CrawlerRunConfig(
+    cache_mode=CacheMode.ENABLED, # 缓存模式
+    stream=True,  # 是否启用流式模式
+    excluded_tags=["form", "header", "footer", "nav"],
+    exclude_external_links=True, # 是否排除外部链接
+    exclude_social_media_links=True, # 是否排除社交媒体链接
+    remove_forms=True, # 移除表单
+    exclude_external_images=True, # 是否排除外部图片
+)
+
+# 单个URL爬取的配置，用于带截止时间的爬取
+single_conf = run_conf.clone(stream=False)
+
+# 爬虫工具
+async def iter_crawl_pages(urls: list[str], priority: str = "interactive"):
+    """
+    逐个产出爬取结果，每个网页爬完就立刻返回，不等待整批结束
+
+    每个URL单独经过爬取调度器排队（按网站限制并发和间隔），不再整批交给arun_many
+
+    Args:
+        urls: 要爬取的URL列表
+        priority: 调度优先级，"interactive" 或 "background"
+
+    Yields:
+        dict: 单个网页的结果，包含url、success、markdown、error
+    """
+    logger.debug("开始爬取 %d 个网页: %s", len(urls), preview(urls))
+
+    tasks = [asyncio.create_task(_fetch_one(url, None, priority)) for url in dict.fromkeys(urls)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def _to_page(res) -> dict:
+    """把crawl4ai的CrawlResult转换为网页结果字典"""
+    if res.success:
+        logger.debug("[OK] %s, length: %d", res.url, len(res.markdown.raw_markdown))
+        return {"url": res.url, "success": True, "markdown": res.markdown.raw_markdown, "error": "", "dropped": False, "cached": False}
+    logger.warning("[ERROR] %s => %s", res.url, preview(res.error_message))
+    return {"url": res.url, "success": False, "markdown": "", "error": res.error_message, "dropped": False, "cached": False}
+
+
+def _failed_page(url: str, error: str, dropped: bool = False) -> dict:
+    """构造一个失败的网页结果"""
+    logger.warning("[ERROR] %s => %s", url, preview(error))
+    return {"url": url, "success": False, "markdown": "", "error": error, "dropped": dropped, "cached": False}
+
+
+async def _fetch_one(url: str, timeout: float, priority: str = "interactive") -> dict:
+    """
+    爬取单个URL，超时或出错时返回失败结果
+
+    先在爬取调度器里按网站排队；静态页面和PDF等文档直接用HTTP抓取，需要JS渲染的再借浏览器。
+    超时在借出浏览器的外层控制，超时取消不会把浏览器标记为崩溃
+    """
+    async def fetch():
+        scheduler = get_crawl_scheduler()
+        async with scheduler.slot(url, priority):
+            # 关闭HTTP直连时，URL像是PDF等文档的仍然直接请求，浏览器抓不了文档
+            if HTTP_FIRST or suffix_kind(url):
+                page = await fetch_http(url, scheduler.client, single_conf)
+                if page is not None:
+                    return page
+            get_metrics().crawl_fetches.inc(fetcher="browser")
+            pool = await get_crawler_pool()
+            async with pool.acquire(pages=1) as crawler:
+                return _to_page(await crawler.arun(url=url, config=single_conf))
+
+    try:
+        return await asyncio.wait_for(fetch(), timeout)
+    except RobotsDisallowedError:
+        return _failed_page(url, "robots.txt不允许抓取该网页")
+    except asyncio.TimeoutError:
+        return _failed_page(url, f"抓取超时（{timeout}秒）")
+    except Exception as e:
+        return _failed_page(url, str(e))
+
+
+async def _fetch_hedged(url: str, timeout: float, hedge_after: float = None, priority: str = "interactive") -> dict:
+    """
+    对冲抓取：主请求超过hedge_after秒还没返回时，再借一个浏览器发一次相同请求，
+    先成功的那次胜出，另一次取消
+
+    Args:
+        url: 要爬取的URL
+        timeout: 单次请求的超时秒数
+        hedge_after: 多少秒后发出对冲请求，None表示不对冲
+        priority: 调度优先级
+
+    Returns:
+        dict: 网页结果
+    """
+    primary = asyncio.create_task(_fetch_one(url, timeout, priority))
+    if hedge_after is None or hedge_after >= timeout:
+        return await primary
+
+    tasks = {primary}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+        if done:
+            return primary.result()
+        logger.info("[HEDGE] %s 超过%s秒未返回，发出对冲请求", url, hedge_after)
+        tasks.add(asyncio.create_task(_fetch_one(url, timeout, priority)))
+        page = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                page = task.result()
+                if page["success"]:
+                    return page
+        return page
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def iter_crawl_pages_with_deadline(urls: list[str], deadline: float, per_url_timeout: float = None,
+                                         hedge_after: float = None, priority: str = "interactive"):
+    """
+    带截止时间的逐页爬取：每个URL独立超时，可选对冲请求，
+    到达总截止时间后放弃未完成的URL，只返回已经完成的网页
+
+    Args:
+        urls: 要爬取的URL列表
+        deadline: 整批爬取的总时间预算（秒）
+        per_url_timeout: 单个URL的超时秒数，默认等于deadline
+        hedge_after: 单个URL多少秒未返回时发出对冲请求，None表示不对冲
+        priority: 调度优先级
+
+    Yields:
+        dict: 单个网页的结果；截止时仍未完成的URL以dropped=True的失败结果返回
+    """
+    logger.debug("开始爬取 %d 个网页: %s", len(urls), preview(urls))
+    per_url_timeout = per_url_timeout or deadline
+    end_time = time.monotonic() + deadline
+    tasks = {
+        asyncio.create_task(_fetch_hedged(url, per_url_timeout, hedge_after, priority)): url
+        for url in dict.fromkeys(urls)
+    }
+
+    try:
+        while tasks:
+            remaining = end_time - time.monotonic()
+            if remaining <= 0:
+                break
+            done, _ = await asyncio.wait(tasks, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                tasks.pop(task)
+                yield task.result()
+
+        # 到达截止时间，放弃剩下的URL
+        for task in tasks:
+            task.cancel()
+        dropped_urls, tasks = list(tasks.values()), {}
+        for url in dropped_urls:
+            yield _failed_page(url, f"超过抓取截止时间（{deadline}秒）", dropped=True)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def crawl_pages(urls: list[str], deadline: float = None, per_url_timeout: float = None,
+                      hedge_after: float = None, use_store: bool = True, priority: str = "interactive"):
+    """
+    逐页爬取：最近抓取过的URL直接从网页存储返回，其余的按是否设置了截止时间选择爬取方式，
+    抓取成功的网页写入网页存储和本地索引
+
+    之前抓取过、指纹近似重复的镜像页面，只有在原网页已在存储里或本批抓取成功时才跳过，
+    跳过的以duplicate_of标记返回；原网页抓取失败时再抓取镜像
+
+    Args:
+        urls: 要爬取的URL列表
+        deadline: 整批爬取的总时间预算（秒），None表示不限制
+        per_url_timeout: 单个URL的超时秒数
+        hedge_after: 单个URL多少秒未返回时发出对冲请求
+        use_store: 是否使用网页存储（和本地索引）
+        priority: 调度优先级，"interactive"（用户正在等）或 "background"（预取）
+
+    Yields:
+        dict: 单个网页的结果，从存储返回的cached为True，因重复跳过的duplicate_of为原网页URL
+    """
+    start = time.monotonic()
+    store = get_page_store() if use_store else None
+    stored_urls = []
+    missing_urls = []
+    for url in dict.fromkeys(urls):
+        page = await store.get(url) if store else None
+        if page is not None:
+            stored_urls.append(url)
+            yield page
+        else:
+            missing_urls.append(url)
+    if not missing_urls:
+        return
+
+    # 原网页URL -> 等它抓取结果的镜像URL
+    waiting = {}
+    if PAGE_DEDUP:
+        mirrors = await run_blocking(known_mirrors, list(dict.fromkeys(urls)))
+        for url in missing_urls:
+            original = mirrors.get(url)
+            if original is None:
+                continue
+            if original in stored_urls:
+                yield _duplicate_page(url, original)
+            else:
+                waiting.setdefault(original, []).append(url)
+        skipped = {url for url in missing_urls if url in mirrors}
+        missing_urls = [url for url in missing_urls if url not in skipped]
+
+    index = get_local_index() if use_store and LOCAL_INDEX else None
+    retry_urls = []
+    async for page in _crawl_missing(missing_urls, deadline, per_url_timeout, hedge_after, priority, store, index):
+        yield page
+        for url in waiting.pop(page["url"], []):
+            if page["success"]:
+                yield _duplicate_page(url, page["url"])
+            elif page["dropped"]:
+                yield _failed_page(url, page["error"], dropped=True)
+            else:
+                retry_urls.append(url)
+
+    # 原网页抓取失败，镜像的内容不能丢，用剩下的时间再抓取镜像
+    if retry_urls:
+        if deadline is not None:
+            deadline = max(deadline - (time.monotonic() - start), 0)
+        async for page in _crawl_missing(retry_urls, deadline, per_url_timeout, hedge_after, priority, store, index):
+            yield page
+
+
+def _duplicate_page(url: str, original: str) -> dict:
+    """构造一个因与原网页内容重复而跳过的网页结果，不算抓取失败"""
+    logger.info("[DEDUP] %s 与 %s 内容重复，未抓取", url, original)
+    get_metrics().dedup_pages_dropped.inc()
+    return {"url": url, "success": False, "markdown": "", "error": "", "dropped": False, "cached": False,
+            "duplicate_of": original}
+
+
+async def _crawl_missing(urls: list[str], deadline: float, per_url_timeout: float, hedge_after: float,
+                         priority: str, store, index):
+    """爬取存储里没有的URL，抓取结果写入网页存储和本地索引"""
+    if not urls:
+        return
+    if deadline is None:
+        pages = iter_crawl_pages(urls, priority)
+    elif deadline <= 0:
+        pages = _dropped_pages(urls, "超过抓取截止时间")
+    else:
+        pages = iter_crawl_pages_with_deadline(urls, deadline, per_url_timeout, hedge_after, priority)
+    async for page in pages:
+        if store:
+            await store.put(page)
+        if index:
+            await index.add(page)
+        yield page
+
+
+async def _dropped_pages(urls: list[str], error: str):
+    """截止时间已经用完，直接把URL作为放弃的结果返回"""
+    for url in urls:
+        yield _failed_page(url, error, dropped=True)
+
+
+# 未纳入结果的URL说明的标题
+DROPPED_URLS_HEADER = "以下网页抓取较慢，未纳入本次总结:\n"
+
+
+def format_dropped_urls(urls: list[str]) -> str:
+    """未纳入结果的URL说明，供总结模型提示用户"""
+    return DROPPED_URLS_HEADER + "\n".join(urls)
+
+
+# 无法提取的文档说明的标题
+FAILED_DOCUMENTS_HEADER = "以下文档无法提取内容，请用户自行查看:\n"
+
+
+def format_failed_documents(pages: list[dict]) -> str:
+    """
+    提取失败的文档（超过大小上限、扫描件等）说明，供总结模型把链接告知用户
+
+    Args:
+        pages: 抓取结果，只看document字段不为空且失败的
+
+    Returns:
+        str: 说明文字，没有提取失败的文档时为空字符串
+    """
+    lines = [f"{page['url']}（{page['error']}）" for page in pages if page.get("document") and not page["success"]]
+    return FAILED_DOCUMENTS_HEADER + "\n".join(lines) if lines else ""
+
+
+async def quick_crawl_tool(urls: list[str], deadline: float = None, per_url_timeout: float = None, hedge_after: float = None):
+    """
+    爬取指定URL列表的网页内容，抓取结果保存到网页存储
+
+    浏览器从进程内共享的浏览器池借出，不再每次调用都冷启动一个浏览器；
+    最近抓取过的URL直接从网页存储返回；拼接前去掉重复的网页和段落
+
+    Args:
+        urls: 要爬取的URL列表
+        deadline: 整批爬取的总时间预算（秒），到时返回已完成的网页，None表示不限制
+        per_url_timeout: 单个URL的超时秒数
+        hedge_after: 单个URL多少秒未返回时发出对冲请求
+
+    Returns:
+        str: 所有爬取结果拼接的文本，提取失败的文档和截止时间内未完成的URL附在末尾
+    """
+    pages = []
+    failed_pages = []
+    dropped_urls = []
+    async for page in crawl_pages(urls, deadline, per_url_timeout, hedge_after):
+        if page["success"]:
+            pages.append(page)
+        elif page.get("duplicate_of"):
+            # 与已抓取到的网页内容重复，原网页已经在结果里
+            continue
+        elif page["dropped"]:
+            dropped_urls.append(page["url"])
+        else:
+            failed_pages.append(page)
+    if PAGE_DEDUP:
+        # 镜像、转载的重复内容不再重复拼接
+        pages, _ = await run_blocking(dedup_pages, pages)
+    search_results = "".join(f"{page['markdown']}\n\n" for page in pages)
+    failed_note = format_failed_documents(failed_pages)
+    if failed_note:
+        search_results += failed_note + "\n\n"
+    if dropped_urls:
+        search_results += format_dropped_urls(dropped_urls)
+    return search_results
+
+
+async def prefetch_pages(urls: list[str]) -> int:
+    """
+    后台预取：以background优先级把网页抓进网页存储，排在所有交互请求后面
+
+    Args:
+        urls: 要预取的URL列表
+
+    Returns:
+        int: 抓取成功的网页数
+    """
+    fetched = 0
+    async for page in crawl_pages(urls, priority="background"):
+        fetched += page["success"]
+    return fetched
+
+
+class PageStream:
+    """
+    后台爬取任务的结果流
+
+    爬取在后台任务里进行，网页按到达顺序追加到pages里，
+    消费者按下标读取，可以有多个消费者各自从头读取。
+
+    开放模式（open=True）下，创建时可以还没有URL：搜索和抓取流水线执行时，
+    每个搜索结果一返回就用add_urls()追加URL（按归一化后的URL去重）并立即开始爬取，
+    全部搜索结束后调用seal()，已追加的URL爬完后结果流结束。
+
+    Args:
+        urls: 要爬取的URL列表
+        known_pages: 已经有内容、不需要再爬取的网页，对应的URL加入时直接放进结果流
+        open: 是否为开放模式
+        **crawl_options: 传给crawl_pages的截止时间、单URL超时、对冲参数；
+                         开放模式下截止时间从第一个URL加入时算起
+    """
+
+    def __init__(self, urls: list[str] = (), known_pages: list[dict] = None, open: bool = False, **crawl_options):
+        self.id = uuid.uuid4().hex
+        self.urls = []
+        self.crawl_options = crawl_options
+        self.pages = []
+        self.done = False
+        self.sealed = not open
+        self.error = None
+        self.created_at = time.monotonic()
+        self.started_at = None
+        self._cond = asyncio.Condition()
+        self._known = {page["url"]: page for page in known_pages or []}
+        self._seen = set()
+        self._batches = []
+        self._wakeup = asyncio.Event()
+        self.task = None
+        self._enqueue(urls)
+
+    def _enqueue(self, urls: list[str]) -> list[str]:
+        """去重后记下新的URL，已知内容的网页直接放进结果流，其余的排进待爬取批次"""
+        new_urls = []
+        for url in urls:
+            key = canonical_url(url)
+            if key in self._seen:
+                continue
+            self._seen.add(key)
+            new_urls.append(url)
+        if not new_urls:
+            return []
+        if self.started_at is None:
+            self.started_at = time.monotonic()
+        self.urls.extend(new_urls)
+        self.pages.extend(self._known[url] for url in new_urls if url in self._known)
+        crawl_urls = [url for url in new_urls if url not in self._known]
+        if crawl_urls:
+            self._batches.append(crawl_urls)
+            self._wakeup.set()
+        return new_urls
+
+    async def add_urls(self, urls: list[str]) -> list[str]:
+        """
+        追加要爬取的URL并立即开始爬取
+
+        Args:
+            urls: URL列表，已经在结果流里的（归一化后相同）会跳过
+
+        Returns:
+            list[str]: 新加入的URL
+        """
+        if self.sealed:
+            raise RuntimeError("结果流已经结束追加，不能再加入URL")
+        async with self._cond:
+            new_urls = self._enqueue(urls)
+            self._cond.notify_all()
+        return new_urls
+
+    def seal(self):
+        """不再追加URL，已加入的URL爬完后结果流结束"""
+        self.sealed = True
+        self._wakeup.set()
+
+    async def _crawl(self, urls: list[str]):
+        options = dict(self.crawl_options)
+        if options.get("deadline") is not None:
+            # 后加入的URL只能用截止时间剩下的部分
+            options["deadline"] = max(options["deadline"] - (time.monotonic() - self.started_at), 0)
+        async for page in crawl_pages(urls, **options):
+            async with self._cond:
+                self.pages.append(page)
+                self._cond.notify_all()
+
+    async def _run(self):
+        crawls = []
+        try:
+            while True:
+                self._wakeup.clear()
+                while self._batches:
+                    crawls.append(asyncio.create_task(self._crawl(self._batches.pop(0))))
+                if self.sealed:
+                    break
+                await self._wakeup.wait()
+            # 一批出错时其他批次照常完成，第一个错误记在error里
+            for result in await asyncio.gather(*crawls, return_exceptions=True):
+                if isinstance(result, Exception):
+                    raise result
+        except Exception as e:
+            logger.exception("[PageStream] 爬取出错: %s", e)
+            self.error = str(e)
+        finally:
+            for task in crawls:
+                task.cancel()
+            async with self._cond:
+                self.done = True
+                self._cond.notify_all()
+
+    async def next_page(self, index: int, timeout: float = None):
+        """
+        读取第index个到达的网页，还没到达时等待
+
+        Args:
+            index: 网页到达的顺序下标
+            timeout: 最长等待秒数，None表示一直等
+
+        Returns:
+            dict | None: 网页结果，全部爬完且没有更多网页时返回None
+
+        Raises:
+            asyncio.TimeoutError: 超时仍未到达
+        """
+        async with self._cond:
+            await asyncio.wait_for(
+                self._cond.wait_for(lambda: index < len(self.pages) or self.done),
+                timeout,
+            )
+            if index < len(self.pages):
+                return self.pages[index]
+            return None
+
+    def pending_urls(self) -> list[str]:
+        """还没有返回结果的URL"""
+        arrived = {page["url"] for page in self.pages}
+        return [url for url in self.urls if url not in arrived]
+
+    async def __aiter__(self):
+        index = 0
+        while True:
+            page = await self.next_page(index)
+            if page is None:
+                return
+            yield page
+            index += 1
+
+
+# 后台运行中的结果流，按id查找；节点之间只传递id
+_page_streams = {}
+# 结果流最长保留时间（秒），超时未被消费的会被清理
+PAGE_STREAM_TTL = 600
+
+
+def start_page_stream(urls: list[str] = (), known_pages: list[dict] = None, open: bool = False,
+                      **crawl_options) -> PageStream:
+    """
+    在后台开始爬取，立刻返回结果流
+
+    Args:
+        urls: 要爬取的URL列表
+        known_pages: 已经有内容、不需要再爬取的网页
+        open: 开放模式，之后还可以用 stream.add_urls() 追加URL，追加完调用 stream.seal()
+        **crawl_options: 传给crawl_pages的截止时间、单URL超时、对冲参数
+
+    Returns:
+        PageStream: 结果流，可用 get_page_stream(stream.id) 再次取回
+    """
+    now = time.monotonic()
+    for stream_id, old in list(_page_streams.items()):
+        if old.done and now - old.created_at > PAGE_STREAM_TTL:
+            _page_streams.pop(stream_id, None)
+
+    stream = PageStream(urls, known_pages=known_pages, open=open, **crawl_options)
+    stream.task = asyncio.create_task(stream._run())
+    _page_streams[stream.id] = stream
+    return stream
+
+
+def get_page_stream(stream_id: str):
+    """
+    按id取回结果流
+
+    Args:
+        stream_id: start_page_stream返回的结果流id
+
+    Returns:
+        PageStream | None: 结果流，不存在时返回None
+    """
+    return _page_streams.get(stream_id)
+
+
+def release_page_stream(stream_id: str):
+    """消费完毕后移除结果流"""
+    _page_streams.pop(stream_id, None)
+
+
+def cancel_page_stream(stream_id: str):
+    """不再需要的结果流：取消后台爬取并移除"""
+    stream = _page_streams.pop(stream_id, None)
+    if stream is not None and stream.task is not None:
+        stream.task.cancel()
+
+
+async def drain_page_streams(timeout: float = None):
+    """
+    等待后台还在爬取的结果流完成，服务关闭前调用；超时后取消剩余的爬取
+
+    Args:
+        timeout: 最长等待秒数，None表示一直等
+
+    Returns:
+        int: 被取消的爬取任务数
+    """
+    tasks = [stream.task for stream in _page_streams.values() if stream.task is not None and not stream.task.done()]
+    if not tasks:
+        return 0
+    _, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+    return len(pending)
+
+
+async def collect_pages(stream: PageStream, min_pages: int = None, straggler_wait: float = None, on_page=None):
+    """
+    从结果流收集网页，可以不等慢的网页
+
+    先等到min_pages个网页到达，之后每个网页最多再等straggler_wait秒，
+    超时就带着已到达的网页返回，慢的网页留在后台继续爬取。
+
+    Args:
+        stream: 结果流
+        min_pages: 至少等待的网页数，None表示等待全部
+        straggler_wait: 达到min_pages后，等待后续网页的最长秒数
+        on_page: 每收到一个网页时调用的异步回调
+
+    Returns:
+        tuple[list[dict], list[str]]: 已到达的网页，以及还没返回的URL
+    """
+    pages = []
+    index = 0
+    while True:
+        timeout = None
+        if min_pages is not None and straggler_wait is not None and len(pages) >= min_pages:
+            timeout = straggler_wait
+        try:
+            page = await stream.next_page(index, timeout)
+        except asyncio.TimeoutError:
+            break
+        if page is None:
+            break
+        pages.append(page)
+        index += 1
+        if on_page is not None:
+            await on_page(page)
+    return pages, stream.pending_urls()
+
+
+async def _debug():
+    try:
+        print(await quick_crawl_tool(urls))
+    finally:
+        await shutdown_crawler_pool()
+        await close_page_store()
+
+# 单独调试时打开注释
+# if __name__ == "__main__":
+#    asyncio.run(_debug())
@@ -0,0 +1,297 @@
+"""
+常驻浏览器池：进程内共享的crawl4ai爬虫实例
+
+每次调用都 `async with AsyncWebCrawler(...)` 会冷启动一次无头浏览器，
+这里改为启动后常驻若干个浏览器实例，爬取时借出、用完归还：
+1. 可配置浏览器实例数和每个浏览器同时承载的租约数（限制的是租约数，不是标签页数：
+   一个租约里用arun_many爬多个URL时会同时打开多个页面；需要按页面限流时每个页面借一个租约，
+   crawl_tool就是这样做的）
+2. 定期健康检查（爬一个raw:页面），检查失败就重启该浏览器；检查和重建期间该浏览器不借出
+3. 单个浏览器累计爬取N个页面或出现崩溃后自动回收重建
+4. 提供关闭钩子，程序退出前调用 shutdown_crawler_pool() 关闭所有浏览器
+"""
+
+import os
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from crawl4ai import AsyncWebCrawler, CrawlerRunConfig, CacheMode, BrowserConfig
+from instrumentation import observe_queue_wait
+from structured_logging import get_logger
+
+logger = get_logger("crawler_pool")
+
+# 健康检查时爬取的页面，raw:前缀不会发起网络请求
+HEALTH_CHECK_URL = "raw:<html><body>ok</body></html>"
+
+
+def default_browser_config():
+    """
+    默认的浏览器配置，与quick_crawl_tool原来的配置保持一致
+
+    Returns:
+        BrowserConfig: 浏览器配置
+    """
+    return BrowserConfig(
+        headless=True,  # 启用无头模式
+        user_agent_mode="random", # 随机生成user_agent
+        text_mode=True, # 只返回文本内容
+    )
+
+
+class _PooledCrawler:
+    """池中的单个浏览器实例及其使用情况"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.crawler = None
+        self.active = 0  # 当前借出的租约数
+        self.pages_served = 0  # 启动以来累计爬取的页面数
+        self.healthy = True
+        self.last_check = 0.0
+        self.restarts = 0
+        self.checking = False  # 正在健康检查或重建，期间不借给其他请求
+
+
+class CrawlerPool:
+    """
+    常驻的爬虫浏览器池
+
+    Args:
+        browser_config: 浏览器配置，默认使用 default_browser_config()
+        size: 浏览器实例数
+        pages_per_browser: 每个浏览器同时承载的租约数（不是页面数，见模块说明）
+        recycle_after: 单个浏览器累计爬取多少页面后回收重建
+        health_check_interval: 健康检查间隔（秒），<=0 表示不检查
+    """
+
+    def __init__(
+        self,
+        browser_config: BrowserConfig = None,
+        size: int = 2,
+        pages_per_browser: int = 4,
+        recycle_after: int = 200,
+        health_check_interval: float = 60.0,
+    ):
+        self.browser_config = browser_config or default_browser_config()
+        self.size = max(1, size)
+        self.pages_per_browser = max(1, pages_per_browser)
+        self.recycle_after = recycle_after
+        self.health_check_interval = health_check_interval
+        self._slots = [_PooledCrawler(i) for i in range(self.size)]
+        self._cond = asyncio.Condition()
+        self._closed = False
+
+    async def _start_slot(self, slot: _PooledCrawler):
+        """启动（或重启）一个浏览器实例"""
+        if slot.crawler is not None:
+            await self._close_slot(slot)
+        crawler = AsyncWebCrawler(config=self.browser_config)
+        await crawler.start()
+        slot.crawler = crawler
+        slot.pages_served = 0
+        slot.healthy = True
+        slot.last_check = time.monotonic()
+
+    async def _close_slot(self, slot: _PooledCrawler):
+        """关闭一个浏览器实例，关闭出错时忽略（浏览器可能已经崩溃）"""
+        crawler, slot.crawler = slot.crawler, None
+        if crawler is None:
+            return
+        try:
+            await crawler.close()
+        except Exception as e:
+            logger.warning("关闭浏览器%d时出错: %s", slot.index, e)
+
+    async def _check_health(self, slot: _PooledCrawler) -> bool:
+        """爬一个raw:页面，确认浏览器还能正常工作"""
+        try:
+            res = await slot.crawler.arun(
+                url=HEALTH_CHECK_URL,
+                config=CrawlerRunConfig(cache_mode=CacheMode.BYPASS),
+            )
+            return bool(res.success)
+        except Exception:
+            return False
+        finally:
+            slot.last_check = time.monotonic()
+
+    def _needs_recycle(self, slot: _PooledCrawler) -> bool:
+        if slot.crawler is None or not slot.healthy:
+            return True
+        return self.recycle_after > 0 and slot.pages_served >= self.recycle_after
+
+    def _health_check_due(self, slot: _PooledCrawler) -> bool:
+        return self.health_check_interval > 0 and time.monotonic() - slot.last_check > self.health_check_interval
+
+    def _pick_slot(self):
+        """选出一个还有空位的浏览器，优先选择负载最低的"""
+        candidates = [s for s in self._slots if s.active < self.pages_per_browser and not s.checking]
+        if not candidates:
+            return None
+        # 需要回收的实例只有在没有租约时才能重建，否则先跳过
+        usable = [s for s in candidates if not self._needs_recycle(s) or s.active == 0]
+        if not usable:
+            return None
+        return min(usable, key=lambda s: (s.active, s.pages_served))
+
+    async def start(self):
+        """预热：一次性启动所有浏览器"""
+        await asyncio.gather(*(self._start_slot(s) for s in self._slots))
+
+    @asynccontextmanager
+    async def acquire(self, pages: int = 1):
+        """
+        借出一个浏览器实例，用完自动归还
+
+        Args:
+            pages: 本次要爬取的页面数，用于统计回收阈值
+
+        Yields:
+            AsyncWebCrawler: 已启动的爬虫实例
+        """
+        if self._closed:
+            raise RuntimeError("CrawlerPool已关闭")
+
+        wait_start = time.perf_counter()
+        async with self._cond:
+            while True:
+                # 等待期间池被关闭时不再借出，避免拿到已经关掉的浏览器
+                if self._closed:
+                    raise RuntimeError("CrawlerPool已关闭")
+                slot = self._pick_slot()
+                if slot is not None:
+                    break
+                await self._cond.wait()
+            slot.active += 1
+            # 只有没有其他租约时才回收或健康检查；标记checking后其他请求不会再借到这个实例，
+            # 重建时不会关掉别人正在用的浏览器
+            recycle = self._needs_recycle(slot) and slot.active == 1
+            check = not recycle and slot.active == 1 and self._health_check_due(slot)
+            if recycle or check:
+                slot.checking = True
+        observe_queue_wait("crawler_pool", time.perf_counter() - wait_start)
+
+        try:
+            # 需要回收或健康检查不通过时，在借出前重建
+            if recycle:
+                if slot.crawler is not None:
+                    slot.restarts += 1
+                await self._start_slot(slot)
+            elif check and not await self._check_health(slot):
+                logger.warning("浏览器%d健康检查失败，重启中", slot.index)
+                slot.restarts += 1
+                await self._start_slot(slot)
+        except BaseException:
+            slot.checking = False
+            await self._release(slot)
+            raise
+        if recycle or check:
+            # 检查和重建完成，唤醒等待这个实例的请求
+            async with self._cond:
+                slot.checking = False
+                self._cond.notify_all()
+
+        try:
+            yield slot.crawler
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # 爬取过程中抛异常，多半是浏览器崩溃，标记后等租约归零时重建
+            slot.healthy = False
+            raise
+        finally:
+            slot.pages_served += pages
+            await self._release(slot)
+
+    async def _release(self, slot: _PooledCrawler):
+        async with self._cond:
+            slot.active -= 1
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        """
+        当前池的状态
+
+        Returns:
+            dict: 每个浏览器的租约数、累计页面数、重启次数
+        """
+        return {
+            "size": self.size,
+            "pages_per_browser": self.pages_per_browser,
+            "browsers": [
+                {
+                    "index": s.index,
+                    "running": s.crawler is not None,
+                    "active": s.active,
+                    "pages_served": s.pages_served,
+                    "restarts": s.restarts,
+                }
+                for s in self._slots
+            ],
+        }
+
+    async def close(self):
+        """关闭池中所有浏览器，正在排队等待的请求会收到RuntimeError"""
+        async with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        await asyncio.gather(*(self._close_slot(s) for s in self._slots))
+
+
+# 进程内共享的浏览器池
+_pool = None
+_pool_loop = None
+_pool_lock = None
+
+
+async def get_crawler_pool() -> CrawlerPool:
+    """
+    获取进程内共享的浏览器池，首次调用时按环境变量创建
+
+    环境变量:
+        CRAWLER_POOL_SIZE: 浏览器实例数，默认2
+        CRAWLER_PAGES_PER_BROWSER: 每个浏览器同时承载的租约数，默认4
+        CRAWLER_RECYCLE_AFTER: 累计爬取多少页面后回收，默认200
+
+    Returns:
+        CrawlerPool: 共享的浏览器池
+    """
+    global _pool, _pool_loop, _pool_lock
+    loop = asyncio.get_running_loop()
+    # 浏览器对象绑定在创建它的事件循环上，换了循环（比如多次asyncio.run）就要重建
+    if _pool_loop is not loop:
+        _pool, _pool_loop, _pool_lock = None, loop, asyncio.Lock()
+    async with _pool_lock:
+        if _pool is None:
+            _pool = CrawlerPool(
+                size=int(os.getenv('CRAWLER_POOL_SIZE', '2')),
+                pages_per_browser=int(os.getenv('CRAWLER_PAGES_PER_BROWSER', '4')),
+                recycle_after=int(os.getenv('CRAWLER_RECYCLE_AFTER', '200')),
+            )
+    return _pool
+
+
+async def shutdown_crawler_pool():
+    """关闭进程内共享的浏览器池，程序退出前调用"""
+    global _pool
+    pool, _pool = _pool, None
+    if pool is not None:
+        await pool.close()
+
+
+@asynccontextmanager
+async def crawler_pool_lifespan(warmup: bool = True):
+    """
+    浏览器池的生命周期管理，适合在服务启动/关闭时使用
+
+    Args:
+        warmup: 是否在进入时预先启动所有浏览器
+    """
+    pool = await get_crawler_pool()
+    if warmup:
+        await pool.start()
+    try:
+        yield pool
+    finally:
+        await shutdown_crawler_pool()
@@ -0,0 +1,243 @@
+"""
+非HTML文档的抓取：PDF、纯文本、JSON、CSV
+
+浏览器抓不了在线PDF，原来只能把PDF链接返回给用户自行查看。这里按Content-Type（或URL后缀）识别文档，
+在本地提取文本，结果和网页一样是markdown，进入同一条总结流程：
+1. 响应体边下载边写入临时文件（小文件在内存里，超过1MB落盘），超过大小上限立即中止
+2. PDF逐页提取文本（需要安装pypdf），达到页数或字数上限就停止，不把整个文档读进内存
+3. 纯文本、JSON、CSV按流读取，只读到字数/行数上限为止
+4. 提取在线程池里执行，不阻塞事件循环
+
+环境变量:
+    DOC_MAX_BYTES: 文档的最大字节数，默认20MB
+    DOC_MAX_PAGES: PDF最多提取的页数，默认50
+    DOC_MAX_CHARS: 最多保留的字符数，默认200000
+    DOC_MAX_ROWS: CSV最多转换的行数，默认200
+"""
+
+import io
+import os
+import csv
+import json
+import tempfile
+from urllib.parse import urlsplit, unquote
+
+from blocking import run_blocking
+from structured_logging import get_logger
+
+logger = get_logger("document_extract")
+
+DOC_MAX_BYTES = int(os.getenv('DOC_MAX_BYTES', str(20 * 1024 * 1024)))
+DOC_MAX_PAGES = int(os.getenv('DOC_MAX_PAGES', '50'))
+DOC_MAX_CHARS = int(os.getenv('DOC_MAX_CHARS', '200000'))
+DOC_MAX_ROWS = int(os.getenv('DOC_MAX_ROWS', '200'))
+# 下载时在内存里保留的最大字节数，超过后写到临时文件
+SPOOL_BYTES = 1024 * 1024
+# 小于这个大小的JSON会解析后格式化输出，更大的按原文截断
+JSON_PRETTY_BYTES = 1024 * 1024
+
+CONTENT_TYPES = {
+    "application/pdf": "pdf",
+    "application/x-pdf": "pdf",
+    "text/plain": "text",
+    "text/markdown": "text",
+    "application/json": "json",
+    "text/json": "json",
+    "text/csv": "csv",
+    "application/csv": "csv",
+}
+SUFFIXES = {".pdf": "pdf", ".txt": "text", ".md": "text", ".json": "json", ".csv": "csv"}
+
+
+class DocumentTooLarge(Exception):
+    """文档超过大小上限"""
+
+
+def suffix_kind(url: str):
+    """按URL后缀判断文档类型，不是文档时返回None"""
+    path = urlsplit(url).path.lower()
+    return next((kind for suffix, kind in SUFFIXES.items() if path.endswith(suffix)), None)
+
+
+def document_kind(content_type: str, url: str):
+    """
+    判断响应是不是支持的文档
+
+    Args:
+        content_type: 响应的Content-Type
+        url: 请求的URL，服务器返回application/octet-stream时按后缀判断
+
+    Returns:
+        str | None: "pdf"、"text"、"json"、"csv"，不是文档时返回None
+    """
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    if media_type in CONTENT_TYPES:
+        return CONTENT_TYPES[media_type]
+    if media_type in ("", "application/octet-stream", "binary/octet-stream"):
+        return suffix_kind(url)
+    return None
+
+
+async def download(response, max_bytes: int = None):
+    """
+    边下载边写入临时文件
+
+    Args:
+        response: httpx的流式响应
+        max_bytes: 最大字节数，默认DOC_MAX_BYTES
+
+    Returns:
+        SpooledTemporaryFile: 已回到开头的文件，调用方负责关闭
+
+    Raises:
+        DocumentTooLarge: 超过大小上限
+    """
+    max_bytes = max_bytes or DOC_MAX_BYTES
+    if int(response.headers.get("content-length") or 0) > max_bytes:
+        raise DocumentTooLarge(f"文件超过{max_bytes // (1024 * 1024)}MB上限")
+    file = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+    size = 0
+    try:
+        async for chunk in response.aiter_bytes():
+            size += len(chunk)
+            if size > max_bytes:
+                raise DocumentTooLarge(f"文件超过{max_bytes // (1024 * 1024)}MB上限")
+            # 落盘后写文件是阻塞操作，但每次只写一个chunk，开销可以忽略
+            file.write(chunk)
+    except BaseException:
+        file.close()
+        raise
+    file.seek(0)
+    return file
+
+
+def _text_stream(file, encoding: str):
+    return io.TextIOWrapper(file, encoding=encoding or "utf-8", errors="replace", newline="")
+
+
+def extract_pdf(file, max_pages: int = None, max_chars: int = None) -> str:
+    """
+    逐页提取PDF文本，达到页数或字数上限就停止
+
+    Args:
+        file: 可seek的文件对象
+        max_pages: 最多提取的页数
+        max_chars: 最多保留的字符数
+
+    Returns:
+        str: 每页一节的markdown
+    """
+    from pypdf import PdfReader
+
+    max_pages = max_pages or DOC_MAX_PAGES
+    max_chars = max_chars or DOC_MAX_CHARS
+    # PdfReader只读交叉引用表，页面内容在访问时才解析
+    reader = PdfReader(file)
+    total = len(reader.pages)
+    extracted = min(total, max_pages)
+    parts = []
+    chars = 0
+    for index in range(extracted):
+        text = (reader.pages[index].extract_text() or "").strip()
+        if not text:
+            continue
+        parts.append(f"## 第{index + 1}页\n\n{text}")
+        chars += len(text)
+        if chars >= max_chars:
+            extracted = index + 1
+            break
+    body = "\n\n".join(parts)[:max_chars]
+    if parts and extracted < total:
+        body += f"\n\n（共{total}页，只提取了前{extracted}页）"
+    return body
+
+
+def extract_text(file, encoding: str, max_chars: int = None) -> str:
+    """读取纯文本的前max_chars个字符"""
+    return _text_stream(file, encoding).read(max_chars or DOC_MAX_CHARS)
+
+
+def extract_json(file, encoding: str, size: int, max_chars: int = None) -> str:
+    """较小的JSON格式化后输出，较大的按原文截断"""
+    max_chars = max_chars or DOC_MAX_CHARS
+    text = _text_stream(file, encoding).read(max_chars if size > JSON_PRETTY_BYTES else -1)
+    if size <= JSON_PRETTY_BYTES:
+        try:
+            text = json.dumps(json.loads(text), ensure_ascii=False, indent=2)
+        except ValueError:
+            pass
+    return f"```json\n{text[:max_chars]}\n```"
+
+
+def extract_csv(file, encoding: str, max_rows: int = None, max_chars: int = None) -> str:
+    """CSV的前max_rows行转成markdown表格"""
+    max_rows = max_rows or DOC_MAX_ROWS
+    max_chars = max_chars or DOC_MAX_CHARS
+    rows = []
+    chars = 0
+    for row in csv.reader(_text_stream(file, encoding)):
+        cells = [cell.replace("|", "\\|").replace("\n", " ") for cell in row]
+        line = "| " + " | ".join(cells) + " |"
+        rows.append(line)
+        chars += len(line)
+        if len(rows) == 1:
+            rows.append("|" + " --- |" * len(cells))
+        if len(rows) > max_rows or chars >= max_chars:
+            rows.append(f"（只保留了前{len(rows) - 2}行）")
+            break
+    return "\n".join(rows)
+
+
+def _extract(kind: str, file, encoding: str, size: int) -> str:
+    if kind == "pdf":
+        return extract_pdf(file)
+    if kind == "json":
+        return extract_json(file, encoding, size)
+    if kind == "csv":
+        return extract_csv(file, encoding)
+    return extract_text(file, encoding)
+
+
+def failed_document(url: str, kind: str, error: str) -> dict:
+    """文档提取失败的结果，document字段标明文档类型，总结时会把这些链接告知用户"""
+    return {"url": url, "success": False, "markdown": "", "error": error, "dropped": False, "cached": False,
+            "document": kind}
+
+
+async def extract_document(url: str, response, kind: str) -> dict:
+    """
+    下载并提取文档文本
+
+    Args:
+        url: 文档URL
+        response: httpx的流式响应（状态码200）
+        kind: document_kind()返回的类型
+
+    Returns:
+        dict: 网页结果，格式与浏览器抓取相同；超过大小上限、缺少依赖或解析失败时success为False
+    """
+    try:
+        file = await download(response)
+    except DocumentTooLarge as e:
+        return failed_document(url, kind, str(e))
+    except Exception as e:
+        # 下载中途出错也返回失败结果，不能交给浏览器，浏览器处理不了文档
+        logger.warning("[DOC] %s 下载失败: %s", url, e)
+        return failed_document(url, kind, f"文档下载失败: {e}")
+    try:
+        size = file.seek(0, io.SEEK_END)
+        file.seek(0)
+        body = await run_blocking(_extract, kind, file, response.charset_encoding, size)
+    except ImportError:
+        return failed_document(url, kind, "需要安装pypdf才能提取PDF内容")
+    except Exception as e:
+        logger.warning("[DOC] %s 提取失败: %s", url, e)
+        return failed_document(url, kind, f"文档解析失败: {e}")
+    finally:
+        file.close()
+    if not body.strip():
+        return failed_document(url, kind, "文档中没有可提取的文本（可能是扫描件）")
+    name = unquote(urlsplit(url).path.rsplit("/", 1)[-1]) or url
+    logger.debug("[DOC OK] %s (%s), length: %d", url, kind, len(body))
+    return {"url": url, "success": True, "markdown": f"# {name}\n\n{body}", "error": "", "dropped": False, "cached": False,
+            "document": kind}
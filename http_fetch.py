@@ -0,0 +1,162 @@
+"""
+HTTP直连抓取：静态页面不启动浏览器
+
+BrowserConfig(text_mode=True)说明我们只要网页文本，而文档、博客、知乎回答等大多是服务端渲染的，
+直接GET拿到的HTML里已经有正文。这里先用普通HTTP请求抓取：
+1. PDF、纯文本、JSON、CSV交给document_extract在本地提取；
+   其他不是HTML的响应、状态码不是200、内容超过大小上限时，交回浏览器抓取
+2. 正文太短，或者带有SPA挂载点（<div id="root"></div>等）/提示开启JavaScript且正文不多时，
+   判断为需要JS渲染，交回浏览器抓取
+3. 否则用crawl4ai自己的内容清洗和markdown生成（与CrawlerRunConfig里配置的相同），
+   得到与 res.markdown.raw_markdown 相同格式的结果；解析在线程池里执行，不阻塞事件循环
+
+环境变量:
+    HTTP_FIRST: 是否先尝试HTTP直连，默认1
+    HTTP_FETCH_TIMEOUT: 单次请求超时秒数，默认10
+    HTTP_FETCH_MAX_BYTES: HTML的最大字节数，超过时交给浏览器，默认5MB
+    HTTP_FETCH_MIN_CHARS: 正文少于多少字符时认为需要JS渲染，默认200
+"""
+
+import os
+import re
+
+from blocking import run_blocking
+from document_extract import document_kind, extract_document, failed_document, suffix_kind
+from instrumentation import get_metrics
+from structured_logging import get_logger
+
+logger = get_logger("http_fetch")
+
+HTTP_FIRST = os.getenv('HTTP_FIRST', '1') == '1'
+HTTP_FETCH_TIMEOUT = float(os.getenv('HTTP_FETCH_TIMEOUT', '10'))
+HTTP_FETCH_MAX_BYTES = int(os.getenv('HTTP_FETCH_MAX_BYTES', str(5 * 1024 * 1024)))
+HTTP_FETCH_MIN_CHARS = int(os.getenv('HTTP_FETCH_MIN_CHARS', '200'))
+# 带SPA标记的页面，正文少于这个字符数时仍然交给浏览器
+SPA_MIN_CHARS = HTTP_FETCH_MIN_CHARS * 10
+
+HEADERS = {
+    "User-Agent": ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                   "(KHTML, like Gecko) Chrome/124.0 Safari/537.36"),
+    "Accept": "text/html,application/xhtml+xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
+}
+
+_INVISIBLE = re.compile(r"<(script|style|noscript|template|svg)\b.*?</\1\s*>", re.I | re.S)
+_TAG = re.compile(r"<[^>]+>")
+_SPA_MOUNT = re.compile(r"<div[^>]+id=[\"'](root|app|__next|__nuxt)[\"'][^>]*>\s*</div>", re.I)
+_META_CHARSET = re.compile(r"<meta[^>]+charset=[\"']?([\w-]+)", re.I)
+_NEEDS_JS = re.compile(r"<noscript[^>]*>[^<]*(enable|启用|开启|打开)[^<]*javascript", re.I)
+
+
+def visible_text_length(html: str) -> int:
+    """去掉脚本、样式和标签之后的正文字符数（不含空白）"""
+    text = _TAG.sub(" ", _INVISIBLE.sub(" ", html))
+    return len(re.sub(r"\s+", "", text))
+
+
+def needs_browser(html: str) -> bool:
+    """
+    判断页面是否需要浏览器执行JS才能拿到正文
+
+    Args:
+        html: 直接请求得到的HTML
+
+    Returns:
+        bool: 需要浏览器渲染时返回True
+    """
+    text_length = visible_text_length(html)
+    if text_length < HTTP_FETCH_MIN_CHARS:
+        return True
+    if _SPA_MOUNT.search(html) or _NEEDS_JS.search(html):
+        return text_length < SPA_MIN_CHARS
+    return False
+
+
+def html_to_markdown(url: str, html: str, config) -> str:
+    """
+    用CrawlerRunConfig里的内容清洗和markdown生成策略把HTML转成markdown
+
+    Args:
+        url: 网页URL，用于补全相对链接
+        html: 原始HTML
+        config: 浏览器抓取用的CrawlerRunConfig，保证两条路径的清洗规则一致
+
+    Returns:
+        str: 与 res.markdown.raw_markdown 相同格式的markdown
+    """
+    from crawl4ai.content_scraping_strategy import WebScrapingStrategy
+    from crawl4ai.markdown_generation_strategy import DefaultMarkdownGenerator
+
+    scraping_strategy = getattr(config, "scraping_strategy", None) or WebScrapingStrategy()
+    markdown_generator = getattr(config, "markdown_generator", None) or DefaultMarkdownGenerator()
+    # crawl4ai内部也是把整个配置作为参数传给scrap
+    params = {key: value for key, value in vars(config).items() if key != "url"}
+    scraped = scraping_strategy.scrap(url, html, **params)
+    # 不同版本的crawl4ai返回dict或ScrapingResult
+    cleaned_html = scraped.get("cleaned_html", "") if isinstance(scraped, dict) else scraped.cleaned_html
+    result = markdown_generator.generate_markdown(cleaned_html, base_url=url)
+    return result.raw_markdown
+
+
+async def fetch_http(url: str, client, config) -> dict:
+    """
+    HTTP直连抓取单个网页
+
+    Args:
+        url: 要抓取的URL
+        client: 共享的httpx.AsyncClient
+        config: 浏览器抓取用的CrawlerRunConfig
+
+    Returns:
+        dict | None: 网页结果（与浏览器抓取的格式相同），文档提取失败时success为False；需要交给浏览器时返回None
+    """
+    try:
+        async with client.stream("GET", url, headers=HEADERS, timeout=HTTP_FETCH_TIMEOUT) as response:
+            content_type = response.headers.get("content-type", "")
+            kind = document_kind(content_type, url) if response.status_code == 200 else None
+            if kind is not None:
+                # PDF、纯文本等文档在本地提取，浏览器处理不了
+                get_metrics().crawl_fetches.inc(fetcher=kind)
+                return await extract_document(url, response, kind)
+            if response.status_code != 200 or "html" not in content_type:
+                logger.debug("[HTTP] %s 状态码%d、类型%s，交给浏览器", url, response.status_code, content_type)
+                return None
+            declared = int(response.headers.get("content-length") or 0)
+            if declared > HTTP_FETCH_MAX_BYTES:
+                return None
+            body = bytearray()
+            async for chunk in response.aiter_bytes():
+                body += chunk
+                if len(body) > HTTP_FETCH_MAX_BYTES:
+                    return None
+            encoding = response.charset_encoding
+    except Exception as e:
+        kind = suffix_kind(url)
+        if kind is not None:
+            # URL看起来是文档时浏览器也抓不了，直接返回失败结果，总结时告知用户链接
+            logger.warning("[DOC] %s 请求失败: %s", url, e)
+            return failed_document(url, kind, f"文档下载失败: {e}")
+        logger.debug("[HTTP] %s 请求失败（%s），交给浏览器", url, e)
+        return None
+
+    if not encoding:
+        # 响应头没有声明编码时看HTML里的<meta charset>（不少中文网站是GBK）
+        match = _META_CHARSET.search(body[:4096].decode("ascii", errors="ignore"))
+        encoding = match.group(1) if match else "utf-8"
+    try:
+        html = body.decode(encoding, errors="replace")
+    except LookupError:
+        html = body.decode("utf-8", errors="replace")
+    if needs_browser(html):
+        logger.debug("[HTTP] %s 需要JS渲染，交给浏览器", url)
+        return None
+    try:
+        markdown = await run_blocking(html_to_markdown, url, html, config)
+    except Exception as e:
+        logger.warning("[HTTP] %s 转换markdown失败（%s），交给浏览器", url, e)
+        return None
+    if not markdown.strip():
+        return None
+    logger.debug("[HTTP OK] %s, length: %d", url, len(markdown))
+    get_metrics().crawl_fetches.inc(fetcher="http")
+    return {"url": url, "success": True, "markdown": markdown, "error": "", "dropped": False, "cached": False}
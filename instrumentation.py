@@ -0,0 +1,472 @@
+"""
+图执行的指标和链路追踪
+
+挂在 astream_events 事件流上，不需要修改各个节点：
+    async for event in instrument_events(graph.astream_events(state, version="v2"), graph_name="webagent"):
+        ...
+
+1. 指标（Prometheus文本格式，render_metrics() 输出，HTTP服务的 /metrics 直接返回）：
+   - 每个节点的耗时、出错次数
+   - LLM调用耗时，prompt/completion token数
+   - 工具调用耗时
+   - 每个网页抓取的字节数、抓取成功/失败/命中存储的次数
+   - 搜索缓存、网页存储的命中率（渲染时读取）
+   - 排队等待时间（HTTP服务的准入队列、浏览器池的借出等待）
+2. 链路追踪（OpenTelemetry，可选依赖）：图的一次执行是一个根span，节点、LLM调用、工具调用是子span，
+   网页抓取结果作为span事件。环境变量TRACE_EXPORTER选择导出方式：
+   none（默认，不追踪）、console（打印到标准输出）、file（写到TRACE_FILE，每行一个JSON）、otlp
+"""
+
+import os
+import time
+import threading
+
+import page_store
+import search_cache
+from structured_logging import get_logger
+
+logger = get_logger("instrumentation")
+
+# 耗时直方图的分桶（秒）
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# 网页大小直方图的分桶（字节）
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: dict = None) -> str:
+    pairs = list(zip(names, values)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class _Metric:
+    """指标基类：按标签值分组保存数据"""
+
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value) -> list[str]:
+        return [f"{self.name}{_format_labels(self.label_names, key)} {value}"]
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    """只增不减的计数"""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """可以任意设置的当前值"""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    """分桶计数的分布，附带总和与样本数"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = DURATION_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data["buckets"][i] += 1
+            data["sum"] += value
+            data["count"] += 1
+
+    def _render_value(self, key, data) -> list[str]:
+        lines = []
+        for bound, count in zip(self.buckets, data["buckets"]):
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, {'le': bound})} {count}")
+        lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, {'le': '+Inf'})} {data['count']}")
+        lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {data['sum']}")
+        lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {data['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    进程内的指标集合
+
+    Args:
+        prefix: 指标名前缀
+    """
+
+    def __init__(self, prefix: str = "webagent"):
+        self.prefix = prefix
+        self._metrics = []
+        self._collectors = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labels: tuple = ()) -> Counter:
+        return self._add(Counter(f"{self.prefix}_{name}", help, labels))
+
+    def gauge(self, name: str, help: str, labels: tuple = ()) -> Gauge:
+        return self._add(Gauge(f"{self.prefix}_{name}", help, labels))
+
+    def histogram(self, name: str, help: str, labels: tuple = (), buckets: tuple = DURATION_BUCKETS) -> Histogram:
+        return self._add(Histogram(f"{self.prefix}_{name}", help, labels, buckets))
+
+    def add_collector(self, collector):
+        """注册渲染前调用的函数，用于读取缓存命中率这类由其他模块维护的值"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """
+        输出Prometheus文本格式
+
+        Returns:
+            str: 所有指标的文本
+        """
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.warning("收集指标出错: %s", e)
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        for metric in self._metrics:
+            metric.clear()
+
+
+class WebAgentMetrics(MetricsRegistry):
+    """图执行用到的所有指标"""
+
+    def __init__(self):
+        super().__init__("webagent")
+        self.graph_runs = self.counter("graph_runs_total", "图的执行次数", ("graph", "status"))
+        self.graph_duration = self.histogram("graph_duration_seconds", "图单次执行的耗时", ("graph",))
+        self.node_duration = self.histogram("node_duration_seconds", "节点耗时", ("graph", "node"))
+        self.node_errors = self.counter("node_errors_total", "节点执行未完成（出错或被取消）的次数", ("graph", "node"))
+        self.llm_duration = self.histogram("llm_duration_seconds", "LLM调用耗时", ("node", "model"))
+        self.llm_tokens = self.counter("llm_tokens_total", "LLM消耗的token数", ("node", "model", "type"))
+        self.tool_duration = self.histogram("tool_duration_seconds", "工具调用耗时", ("tool",))
+        self.crawl_pages = self.counter("crawl_pages_total", "抓取的网页数", ("status",))
+        self.crawl_fetches = self.counter("crawl_fetches_total", "按抓取方式统计的抓取次数", ("fetcher",))
+        self.crawl_bytes = self.histogram("crawl_page_bytes", "每个网页抓取到的内容大小", (), BYTES_BUCKETS)
+        self.queue_wait = self.histogram("queue_wait_seconds", "排队等待时间", ("queue",))
+        self.crawl_host_wait = self.histogram("crawl_host_wait_seconds", "抓取在每个网站排队等待的时间", ("host", "priority"))
+        self.cache_hit_ratio = self.gauge("cache_hit_ratio", "缓存命中率", ("cache",))
+        self.cache_events = self.gauge("cache_events", "缓存累计的命中/未命中次数", ("cache", "result"))
+        self.upstream_retries = self.counter("upstream_retries_total", "上游调用的重试次数", ("upstream",))
+        self.pre_routes = self.counter("pre_routes_total", "本地预路由直接搜索（search）还是交给对话模型（llm）", ("route", "decided_by"))
+        self.dedup_bytes_removed = self.counter("dedup_bytes_removed_total", "网页去重删掉的字节数")
+        self.dedup_tokens_removed = self.counter("dedup_tokens_removed_total", "网页去重删掉的估算token数")
+        self.dedup_pages_dropped = self.counter("dedup_pages_dropped_total", "整页重复被去掉的网页数")
+        self.snippet_routes = self.counter("snippet_routes_total", "搜索后直接用摘要回答（snippets）还是抓取网页（crawl）", ("route", "decided_by"))
+        self.snippet_saved_seconds = self.counter("snippet_saved_seconds_total", "直接用摘要回答估算节省的抓取时间")
+        self.local_index_lookups = self.counter("local_index_lookups_total", "搜索前查询本地索引的结果：命中（hit）或未命中（miss）", ("result",))
+        self.circuit_state = self.gauge("circuit_state", "上游熔断器状态：0正常，1试探，2熔断", ("upstream",))
+        self.add_collector(self._collect_caches)
+
+    def _collect_caches(self):
+        cache = search_cache._cache
+        if cache is not None:
+            stats = cache.get_stats()
+            self.cache_hit_ratio.set(stats["hit_rate"], cache="search")
+            self.cache_events.set(stats["memory_hits"] + stats["disk_hits"] + stats["coalesced"], cache="search", result="hit")
+            self.cache_events.set(stats["misses"], cache="search", result="miss")
+        store = page_store._store
+        if store is not None:
+            hits, misses = store.stats["hits"], store.stats["misses"]
+            self.cache_hit_ratio.set(hits / (hits + misses) if hits + misses else 0.0, cache="page_store")
+            self.cache_events.set(hits, cache="page_store", result="hit")
+            self.cache_events.set(misses, cache="page_store", result="miss")
+
+
+_metrics = None
+
+
+def get_metrics() -> WebAgentMetrics:
+    """获取进程内共享的指标集合"""
+    global _metrics
+    if _metrics is None:
+        _metrics = WebAgentMetrics()
+    return _metrics
+
+
+def render_metrics() -> str:
+    """Prometheus文本格式的当前指标"""
+    return get_metrics().render()
+
+
+def write_metrics(path: str):
+    """
+    把当前指标写到文件，离线运行时查看
+
+    Args:
+        path: 输出文件路径
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(render_metrics())
+
+
+def observe_queue_wait(queue: str, seconds: float):
+    """
+    记录一次排队等待时间
+
+    Args:
+        queue: 队列名，如 "server"、"crawler_pool"
+        seconds: 等待秒数
+    """
+    get_metrics().queue_wait.observe(seconds, queue=queue)
+
+
+# ---------- 链路追踪 ----------
+
+_tracer = None
+_tracer_provider = None
+_trace_api = None
+
+
+def get_tracer():
+    """
+    按环境变量TRACE_EXPORTER创建OpenTelemetry tracer，首次调用时初始化
+
+    环境变量:
+        TRACE_EXPORTER: none / console / file / otlp，默认none
+        TRACE_FILE: file导出时的文件路径，默认 traces.jsonl
+
+    Returns:
+        Tracer | None: 未启用或未安装opentelemetry-sdk时返回None
+    """
+    global _tracer, _tracer_provider, _trace_api
+    if _tracer_provider is not None:
+        return _tracer
+    kind = os.getenv('TRACE_EXPORTER', 'none').lower()
+    if kind == "none":
+        _tracer_provider = False
+        return None
+    try:
+        # 需要安装 opentelemetry-sdk；otlp导出还需要 opentelemetry-exporter-otlp
+        from opentelemetry import trace
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+        if kind == "console":
+            exporter = ConsoleSpanExporter()
+        elif kind == "file":
+            out = open(os.getenv('TRACE_FILE', 'traces.jsonl'), "a", encoding="utf-8")
+            exporter = ConsoleSpanExporter(out=out, formatter=lambda span: span.to_json(indent=None) + "\n")
+        elif kind == "otlp":
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+            exporter = OTLPSpanExporter()
+        else:
+            raise ValueError(f"不支持的TRACE_EXPORTER: {kind}")
+    except ImportError as e:
+        logger.warning("未安装OpenTelemetry，链路追踪不可用: %s", e)
+        _tracer_provider = False
+        return None
+    _tracer_provider = TracerProvider(resource=Resource.create({"service.name": "langgraph-webagent"}))
+    _tracer_provider.add_span_processor(BatchSpanProcessor(exporter))
+    _tracer = _tracer_provider.get_tracer("webagent")
+    _trace_api = trace
+    return _tracer
+
+
+def shutdown_tracing():
+    """把缓冲中的span导出完，程序退出前调用"""
+    global _tracer, _tracer_provider
+    if _tracer_provider:
+        _tracer_provider.shutdown()
+    _tracer, _tracer_provider = None, None
+
+
+# ---------- 事件流观察 ----------
+
+class GraphObserver:
+    """
+    观察一次图执行的astream_events事件，记录指标和span
+
+    Args:
+        graph_name: 指标和span里的图名
+        metrics: 指标集合，默认使用共享的
+        tracer: OpenTelemetry tracer，默认按环境变量创建
+    """
+
+    def __init__(self, graph_name: str = "graph", metrics: WebAgentMetrics = None, tracer=None):
+        self.graph_name = graph_name
+        self.metrics = metrics or get_metrics()
+        self.tracer = tracer if tracer is not None else get_tracer()
+        self._runs = {}  # run_id -> (类型, 名称, 开始时间, 标签)
+        self._spans = {}  # run_id -> span
+        self._root = None
+        self._start = time.perf_counter()
+
+    def _start_span(self, event, name: str, attributes: dict):
+        if self.tracer is None:
+            return
+        parent = None
+        for parent_id in reversed(event.get("parent_ids") or []):
+            parent = self._spans.get(parent_id)
+            if parent is not None:
+                break
+        context = _trace_api.set_span_in_context(parent) if parent is not None else None
+        self._spans[event["run_id"]] = self.tracer.start_span(name, context=context, attributes=attributes)
+
+    def _end_span(self, run_id: str, attributes: dict = None, error: str = None):
+        span = self._spans.pop(run_id, None)
+        if span is None:
+            return
+        for key, value in (attributes or {}).items():
+            if value is not None:
+                span.set_attribute(key, value)
+        if error:
+            span.set_attribute("error", True)
+            span.set_attribute("error.message", error)
+        span.end()
+
+    def observe(self, event: dict):
+        """处理一条astream_events事件"""
+        event_type = event["event"]
+        run_id = event.get("run_id")
+        metadata = event.get("metadata") or {}
+        node = metadata.get("langgraph_node")
+
+        if event_type == "on_chain_start":
+            if self._root is None and not event.get("parent_ids"):
+                self._root = run_id
+                self._start_span(event, f"graph {self.graph_name}", {"graph": self.graph_name})
+            elif node and event["name"] == node:
+                self._runs[run_id] = ("node", node, time.perf_counter())
+                self._start_span(event, f"node {node}", {"graph": self.graph_name, "node": node})
+        elif event_type == "on_chain_end" and run_id in self._runs:
+            _, node_name, started = self._runs.pop(run_id)
+            self.metrics.node_duration.observe(time.perf_counter() - started, graph=self.graph_name, node=node_name)
+            self._end_span(run_id)
+        elif event_type == "on_chat_model_start":
+            model = metadata.get("ls_model_name") or event["name"]
+            self._runs[run_id] = ("llm", (node or "", model), time.perf_counter())
+            self._start_span(event, f"llm {model}", {"node": node or "", "model": model})
+        elif event_type == "on_chat_model_end" and run_id in self._runs:
+            _, (node_name, model), started = self._runs.pop(run_id)
+            self.metrics.llm_duration.observe(time.perf_counter() - started, node=node_name, model=model)
+            usage = getattr(event["data"].get("output"), "usage_metadata", None) or {}
+            prompt_tokens, completion_tokens = usage.get("input_tokens"), usage.get("output_tokens")
+            if prompt_tokens:
+                self.metrics.llm_tokens.inc(prompt_tokens, node=node_name, model=model, type="prompt")
+            if completion_tokens:
+                self.metrics.llm_tokens.inc(completion_tokens, node=node_name, model=model, type="completion")
+            self._end_span(run_id, {"llm.prompt_tokens": prompt_tokens, "llm.completion_tokens": completion_tokens})
+        elif event_type == "on_tool_start":
+            self._runs[run_id] = ("tool", event["name"], time.perf_counter())
+            self._start_span(event, f"tool {event['name']}", {"tool": event["name"]})
+        elif event_type == "on_tool_end" and run_id in self._runs:
+            _, tool_name, started = self._runs.pop(run_id)
+            self.metrics.tool_duration.observe(time.perf_counter() - started, tool=tool_name)
+            self._end_span(run_id)
+        elif event_type == "on_custom_event" and event["name"] == "crawl_page":
+            self.observe_page(event["data"], event.get("parent_ids") or [])
+
+    def observe_page(self, page: dict, parent_ids: list = ()):
+        """记录一个网页的抓取结果，并作为span事件挂到最近的span上"""
+        status = "ok" if page.get("success") else "error"
+        if page.get("cached"):
+            status = "cached"
+        self.metrics.crawl_pages.inc(status=status)
+        if page.get("success"):
+            self.metrics.crawl_bytes.observe(page.get("length", 0))
+        for parent_id in reversed(list(parent_ids)):
+            span = self._spans.get(parent_id)
+            if span is not None:
+                span.add_event("crawl_page", {
+                    "url": page.get("url") or "",
+                    "status": status,
+                    "bytes": page.get("length", 0),
+                })
+                break
+
+    def finish(self, error: BaseException = None):
+        """
+        结束本次观察：记录图的耗时，没有结束事件的节点记为未完成
+
+        Args:
+            error: 图执行抛出的异常，正常结束为None
+        """
+        message = repr(error) if error is not None else None
+        for run_id, (kind, name, _) in list(self._runs.items()):
+            if kind == "node":
+                self.metrics.node_errors.inc(graph=self.graph_name, node=name)
+            self._end_span(run_id, error=message or "未完成")
+        self._runs.clear()
+        self.metrics.graph_runs.inc(graph=self.graph_name, status="error" if error is not None else "ok")
+        self.metrics.graph_duration.observe(time.perf_counter() - self._start, graph=self.graph_name)
+        if self._root is not None:
+            self._end_span(self._root, error=message)
+        for run_id in list(self._spans):
+            self._end_span(run_id, error=message)
+
+
+async def instrument_events(events, graph_name: str = "graph"):
+    """
+    包装astream_events的事件流：事件原样产出，同时记录指标和span
+
+    Args:
+        events: graph.astream_events(...) 返回的异步迭代器
+        graph_name: 指标和span里的图名
+
+    Yields:
+        dict: 原始事件
+    """
+    observer = GraphObserver(graph_name)
+    try:
+        async for event in events:
+            observer.observe(event)
+            yield event
+    except BaseException as e:
+        observer.finish(error=e)
+        raise
+    observer.finish()
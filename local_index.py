@@ -0,0 +1,490 @@
+"""
+本地检索索引：抓取过的网页建成可增量更新的索引，问题相关且内容够新时不再联网
+
+每个问题原来都要走一遍搜索API和浏览器，哪怕几分钟前刚为别的用户抓取过高度相关的网页。这里：
+1. 抓取成功的网页按段落切成片段，写入SQLite里的倒排索引（词 -> 片段、词频），检索时按BM25打分；
+   同一URL再次抓取时内容没变只刷新时间，内容变了替换旧片段
+2. 可选的哈希向量（需要numpy）：每个片段的词按hash映射到固定维数并归一化，追加写入磁盘上的
+   float32数组文件，检索时用内存映射（np.memmap）读取，不把整个向量文件读进内存；
+   与BM25的排名用倒数排名融合
+3. 并发：SQLite开启WAL，检索各自打开只读连接，可以和写入同时进行；写入只由一个后台任务
+   批量执行（多进程时靠SQLite的写锁串行），向量文件只在持有写锁时追加
+4. 大小有界：超过保留时间的片段淘汰；片段总数超过上限时按抓取时间从旧到新淘汰整页；
+   向量文件里被淘汰的行超过一半时重写成新文件；上一代文件保留到下次压缩，
+   压缩前开始的检索仍然可以读完
+5. lookup()给出"问题里的词（去掉疑问词，按idf加权）被某个网页的片段覆盖的比例"作为相关度，
+   调用方按相关度和新鲜度阈值决定是否直接用索引回答
+
+环境变量:
+    LOCAL_INDEX: 是否把抓取结果写入索引、并在搜索前先查索引，默认1
+    LOCAL_INDEX_DIR: 索引目录，默认网页存储目录下的 local_index
+    LOCAL_INDEX_MAX_CHUNKS: 片段总数上限，默认20000
+    LOCAL_INDEX_RETENTION: 片段保留秒数，默认86400
+    LOCAL_INDEX_VECTORS: 是否保存哈希向量（需要numpy），默认1
+    LOCAL_INDEX_DIM: 哈希向量维数，默认256
+"""
+
+import os
+import math
+import time
+import sqlite3
+import asyncio
+import hashlib
+import threading
+from collections import Counter
+
+from blocking import run_blocking
+from context_packer import tokenize, split_chunks
+from snippet_router import question_terms
+from instrumentation import get_metrics
+from structured_logging import get_logger
+
+logger = get_logger("local_index")
+
+LOCAL_INDEX = os.getenv('LOCAL_INDEX', '1') == '1'
+# BM25参数，与context_packer相同
+BM25_K1 = 1.5
+BM25_B = 0.75
+# 向量检索与BM25融合时的平滑常数，与search_engine相同
+RRF_K = 60
+
+
+def _term_hash(term: str) -> int:
+    return int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def hashed_vector(terms: list[str], dim: int):
+    """
+    哈希向量：词按hash映射到dim维之一，符号也由hash决定，词频取对数后归一化
+
+    Args:
+        terms: 切好的词
+        dim: 维数
+
+    Returns:
+        numpy.ndarray: float32的单位向量，没有词时为全0
+    """
+    import numpy as np
+
+    vector = np.zeros(dim, dtype=np.float32)
+    for term, count in Counter(terms).items():
+        value = _term_hash(term)
+        vector[value % dim] += (1.0 if value >> 63 else -1.0) * (1.0 + math.log(count))
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
+
+
+class LocalIndex:
+    """
+    增量更新的本地检索索引
+
+    Args:
+        root: 索引目录
+        max_chunks: 片段总数上限
+        retention: 片段保留秒数
+        use_vectors: 是否保存哈希向量，没有安装numpy时自动关闭
+        dim: 哈希向量维数
+        chunk_tokens: 每个片段的目标token数
+        batch_size: 攒够多少个网页就立即写入
+        flush_interval: 写入最多延迟多少秒
+        compact_min_rows: 向量文件至少有多少行才考虑压缩
+    """
+
+    def __init__(self, root: str, max_chunks: int = 20000, retention: float = 86400, use_vectors: bool = True,
+                 dim: int = 256, chunk_tokens: int = 300, batch_size: int = 8, flush_interval: float = 0.5,
+                 compact_min_rows: int = 1024):
+        self.root = root
+        self.compact_min_rows = compact_min_rows
+        self.max_chunks = max_chunks
+        self.retention = retention
+        self.dim = dim
+        self.chunk_tokens = chunk_tokens
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        if use_vectors:
+            try:
+                import numpy  # noqa: F401
+            except ImportError:
+                logger.warning("没有安装numpy，本地索引只使用BM25")
+                use_vectors = False
+        self.use_vectors = use_vectors
+        self._write_lock = threading.Lock()
+        self._map_lock = threading.Lock()
+        self._mapped = (None, 0, None)  # (向量文件名, 行数, memmap)
+        self._queue = None
+        self._writer = None
+        self._writer_loop = None
+
+        os.makedirs(root, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute("CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, content_hash TEXT, added_at REAL)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "id INTEGER PRIMARY KEY, url TEXT, position INTEGER, text TEXT, length INTEGER, "
+                "added_at REAL, vec_row INTEGER)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_url ON chunks (url)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_added_at ON chunks (added_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS postings ("
+                "term TEXT, chunk_id INTEGER, tf INTEGER, PRIMARY KEY (term, chunk_id)) WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_postings_chunk ON postings (chunk_id)")
+            conn.execute("INSERT OR IGNORE INTO meta VALUES ('vector_file', 'vectors-0.f32')")
+
+    def _connect(self):
+        return sqlite3.connect(os.path.join(self.root, "index.db"), timeout=30)
+
+    def _vector_path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    # ---------- 写入（只在后台写入任务里执行） ----------
+
+    def _delete_urls(self, conn, urls: list[str]):
+        for url in urls:
+            conn.execute("DELETE FROM postings WHERE chunk_id IN (SELECT id FROM chunks WHERE url = ?)", (url,))
+            conn.execute("DELETE FROM chunks WHERE url = ?", (url,))
+            conn.execute("DELETE FROM pages WHERE url = ?", (url,))
+
+    def _write_batch_sync(self, pages: list[dict]):
+        with self._write_lock, self._connect() as conn:
+            # 先拿到SQLite的写锁，多个进程共用索引时也只有一个在写
+            conn.execute("BEGIN IMMEDIATE")
+            vector_file = conn.execute("SELECT value FROM meta WHERE key = 'vector_file'").fetchone()[0]
+            vector_path = self._vector_path(vector_file)
+            next_row = os.path.getsize(vector_path) // (self.dim * 4) if os.path.exists(vector_path) else 0
+            vectors = []
+            for page in pages:
+                markdown = page["markdown"]
+                added_at = page.get("fetched_at") or time.time()
+                content_hash = hashlib.sha256(markdown.encode("utf-8")).hexdigest()
+                row = conn.execute("SELECT content_hash FROM pages WHERE url = ?", (page["url"],)).fetchone()
+                if row is not None and row[0] == content_hash:
+                    # 内容没变，只刷新时间
+                    conn.execute("UPDATE pages SET added_at = ? WHERE url = ?", (added_at, page["url"]))
+                    conn.execute("UPDATE chunks SET added_at = ? WHERE url = ?", (added_at, page["url"]))
+                    continue
+                self._delete_urls(conn, [page["url"]])
+                conn.execute("INSERT INTO pages VALUES (?, ?, ?)", (page["url"], content_hash, added_at))
+                for position, text in enumerate(split_chunks(markdown, self.chunk_tokens)):
+                    terms = tokenize(text)
+                    if not terms:
+                        continue
+                    vec_row = None
+                    if self.use_vectors:
+                        vec_row = next_row + len(vectors)
+                        vectors.append(hashed_vector(terms, self.dim))
+                    cursor = conn.execute(
+                        "INSERT INTO chunks (url, position, text, length, added_at, vec_row) VALUES (?, ?, ?, ?, ?, ?)",
+                        (page["url"], position, text, len(terms), added_at, vec_row),
+                    )
+                    conn.executemany(
+                        "INSERT INTO postings VALUES (?, ?, ?)",
+                        [(term, cursor.lastrowid, tf) for term, tf in Counter(terms).items()],
+                    )
+            if vectors:
+                # 向量先追加到文件再提交；提交失败时多出来的行没有片段引用，压缩时会被清掉
+                import numpy as np
+
+                with open(vector_path, "ab") as f:
+                    f.write(np.stack(vectors).astype(np.float32).tobytes())
+            self._evict_locked(conn)
+            conn.commit()
+            if self.use_vectors:
+                self._compact_locked(conn, vector_file)
+
+    def _evict_locked(self, conn):
+        """淘汰超过保留时间的片段；总数超过上限时按抓取时间从旧到新淘汰整页"""
+        cutoff = time.time() - self.retention
+        expired = [url for url, in conn.execute("SELECT url FROM pages WHERE added_at < ?", (cutoff,))]
+        self._delete_urls(conn, expired)
+        total = conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        if total <= self.max_chunks:
+            return
+        for url, count in conn.execute(
+            "SELECT p.url, COUNT(c.id) FROM pages p LEFT JOIN chunks c ON c.url = p.url "
+            "GROUP BY p.url ORDER BY p.added_at"
+        ).fetchall():
+            self._delete_urls(conn, [url])
+            total -= count
+            if total <= self.max_chunks:
+                break
+
+    def _compact_locked(self, conn, vector_file: str):
+        """向量文件里一半以上的行已经没有片段引用时，重写成新文件"""
+        import numpy as np
+
+        old_path = self._vector_path(vector_file)
+        if not os.path.exists(old_path):
+            return
+        rows = os.path.getsize(old_path) // (self.dim * 4)
+        if rows < self.compact_min_rows:
+            return
+        # 持有写锁读出仍被引用的行，重写期间不会有其他写入改动它们
+        conn.execute("BEGIN IMMEDIATE")
+        live = conn.execute("SELECT id, vec_row FROM chunks WHERE vec_row IS NOT NULL ORDER BY id").fetchall()
+        if len(live) * 2 > rows:
+            conn.rollback()
+            return
+        generation = int(vector_file.split("-")[1].split(".")[0]) + 1
+        new_file = f"vectors-{generation}.f32"
+        old = np.memmap(old_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+        with open(self._vector_path(new_file), "wb") as f:
+            if live:
+                f.write(np.asarray(old[[vec_row for _, vec_row in live]], dtype=np.float32).tobytes())
+        del old
+        conn.executemany("UPDATE chunks SET vec_row = ? WHERE id = ?", [(i, chunk_id) for i, (chunk_id, _) in enumerate(live)])
+        conn.execute("UPDATE meta SET value = ? WHERE key = 'vector_file'", (new_file,))
+        conn.commit()
+        # 刚被替换的文件留给压缩前开始的检索，更早的几代删掉
+        for name in os.listdir(self.root):
+            if name.startswith("vectors-") and name.endswith(".f32") and name not in (vector_file, new_file):
+                try:
+                    os.remove(self._vector_path(name))
+                except OSError:
+                    pass
+        logger.info("本地索引向量文件压缩: %d -> %d 行", rows, len(live))
+
+    def _ensure_writer(self):
+        loop = asyncio.get_running_loop()
+        if self._writer_loop is not loop or self._writer is None or self._writer.done():
+            self._queue = asyncio.Queue()
+            self._writer_loop = loop
+            self._writer = loop.create_task(self._write_loop())
+
+    async def add(self, page: dict):
+        """
+        把一个抓取成功的网页加入写入队列，立即返回
+
+        Args:
+            page: 爬虫返回的网页结果
+        """
+        if not page.get("success") or not page.get("markdown") or not page.get("url"):
+            return
+        self._ensure_writer()
+        self._queue.put_nowait(page)
+
+    async def _write_loop(self):
+        while True:
+            pages = [await self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(pages) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    pages.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            # 同一批里同一URL只保留最后一次
+            batch = list({page["url"]: page for page in pages}.values())
+            try:
+                await run_blocking(self._write_batch_sync, batch)
+            except Exception as e:
+                logger.exception("本地索引写入失败: %s", e)
+            finally:
+                for _ in pages:
+                    self._queue.task_done()
+
+    async def flush(self):
+        """等待队列里的网页全部写入"""
+        if self._queue is not None and self._writer_loop is asyncio.get_running_loop():
+            await self._queue.join()
+
+    async def close(self):
+        """写完后停止后台写入任务"""
+        await self.flush()
+        if self._writer is not None:
+            self._writer.cancel()
+            try:
+                await self._writer
+            except (asyncio.CancelledError, RuntimeError):
+                pass
+            self._writer = None
+
+    # ---------- 检索（可以和写入并发） ----------
+
+    def _vectors(self, vector_file: str, needed_rows: int):
+        """
+        内存映射向量文件，文件变长或换了文件时重新映射
+
+        Returns:
+            numpy.memmap | None: 至少有needed_rows行的映射；文件已被删除或行数不够时为None
+        """
+        import numpy as np
+
+        with self._map_lock:
+            name, rows, mapped = self._mapped
+            if name == vector_file and rows >= needed_rows:
+                return mapped
+            path = self._vector_path(vector_file)
+            try:
+                rows = os.path.getsize(path) // (self.dim * 4)
+                mapped = np.memmap(path, dtype=np.float32, mode="r", shape=(rows, self.dim)) if rows else None
+            except (OSError, ValueError):
+                return None
+            self._mapped = (vector_file, rows, mapped)
+            return mapped if rows >= needed_rows else None
+
+    def search(self, query: str, top_k: int = 8, max_age: float = None) -> tuple[list[dict], dict]:
+        """
+        检索与问题最相关的片段（同步，在线程池里调用）
+
+        所有查询在同一个读事务里执行，看到的是同一个快照，期间提交的写入和压缩不会混进来
+
+        Args:
+            query: 问题或搜索词
+            top_k: 返回的片段数
+            max_age: 只检索多少秒内抓取的片段，None表示不限制
+
+        Returns:
+            tuple[list[dict], dict]: 片段（包含url、position、text、added_at、score融合后的排序分、
+                                     matched命中的问题词），以及问题词 -> idf
+        """
+        terms = list(question_terms(query))
+        if not terms:
+            return [], {}
+        min_added = time.time() - max_age if max_age else 0.0
+        placeholders = ",".join("?" * len(terms))
+        with self._connect() as conn:
+            conn.execute("BEGIN")
+            total, total_length = conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks").fetchone()
+            if not total:
+                return [], {}
+            doc_freq = dict(conn.execute(
+                f"SELECT term, COUNT(*) FROM postings WHERE term IN ({placeholders}) GROUP BY term", terms
+            ).fetchall())
+            postings = conn.execute(
+                f"SELECT p.term, p.chunk_id, p.tf, c.length FROM postings p JOIN chunks c ON c.id = p.chunk_id "
+                f"WHERE p.term IN ({placeholders}) AND c.added_at >= ?",
+                (*terms, min_added),
+            ).fetchall()
+            vector_rows = []
+            if self.use_vectors:
+                vector_file = conn.execute("SELECT value FROM meta WHERE key = 'vector_file'").fetchone()[0]
+                vector_rows = conn.execute(
+                    "SELECT id, vec_row FROM chunks WHERE vec_row IS NOT NULL AND added_at >= ?", (min_added,)
+                ).fetchall()
+
+            avg_length = total_length / total
+            idf = {term: math.log(1 + (total - doc_freq.get(term, 0) + 0.5) / (doc_freq.get(term, 0) + 0.5))
+                   for term in terms}
+            bm25 = Counter()
+            matched = {}
+            for term, chunk_id, tf, length in postings:
+                norm = 1 - BM25_B + BM25_B * length / avg_length
+                bm25[chunk_id] += idf[term] * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+                matched.setdefault(chunk_id, set()).add(term)
+            ranked = [chunk_id for chunk_id, _ in bm25.most_common(top_k * 4)]
+            fused = Counter({chunk_id: 1 / (RRF_K + rank) for rank, chunk_id in enumerate(ranked, 1)})
+
+            if vector_rows:
+                # 压缩后上一代文件还保留着，映射不到（或行数不够）时只用BM25
+                mapped = self._vectors(vector_file, max(row for _, row in vector_rows) + 1)
+                if mapped is not None:
+                    import numpy as np
+
+                    query_vector = hashed_vector(tokenize(query), self.dim)
+                    similarity = np.asarray(mapped[[row for _, row in vector_rows]]) @ query_vector
+                    best = np.argsort(-similarity)[:top_k * 4]
+                    for rank, i in enumerate(best, 1):
+                        if similarity[i] > 0:
+                            fused[vector_rows[i][0]] += 1 / (RRF_K + rank)
+
+            top = [chunk_id for chunk_id, _ in fused.most_common(top_k)]
+            if not top:
+                return [], idf
+            rows = conn.execute(
+                f"SELECT id, url, position, text, added_at FROM chunks WHERE id IN ({','.join('?' * len(top))})", top
+            ).fetchall()
+        by_id = {row[0]: row for row in rows}
+        chunks = [
+            {
+                "url": by_id[chunk_id][1], "position": by_id[chunk_id][2], "text": by_id[chunk_id][3],
+                "added_at": by_id[chunk_id][4], "score": fused[chunk_id], "matched": matched.get(chunk_id, set()),
+            }
+            for chunk_id in top if chunk_id in by_id
+        ]
+        return chunks, idf
+
+    def lookup_sync(self, query: str, max_age: float, min_score: float, top_k: int = 8) -> list[dict]:
+        """
+        用索引回答：按网页汇总检索到的片段，问题词的覆盖率达到min_score的网页才返回
+
+        Args:
+            query: 问题或搜索词
+            max_age: 只使用多少秒内抓取的网页
+            min_score: 问题词（按idf加权）被一个网页的片段覆盖的最低比例
+            top_k: 检索的片段数
+
+        Returns:
+            list[dict]: 与爬虫结果相同结构的网页（cached为True，markdown为相关片段），不满足阈值时为空列表
+        """
+        chunks, idf = self.search(query, top_k=top_k, max_age=max_age)
+        if not chunks:
+            return []
+        total_idf = sum(idf.values())
+        by_url = {}
+        for chunk in chunks:
+            by_url.setdefault(chunk["url"], []).append(chunk)
+        pages = []
+        for url, url_chunks in by_url.items():
+            matched = set().union(*(chunk["matched"] for chunk in url_chunks))
+            coverage = sum(idf[term] for term in matched) / total_idf if total_idf else 0.0
+            if coverage < min_score:
+                continue
+            url_chunks.sort(key=lambda chunk: chunk["position"])
+            pages.append({
+                "url": url, "success": True, "markdown": "\n\n".join(chunk["text"] for chunk in url_chunks),
+                "error": "", "dropped": False, "cached": True,
+                "fetched_at": max(chunk["added_at"] for chunk in url_chunks), "coverage": coverage,
+            })
+        pages.sort(key=lambda page: -page["coverage"])
+        return pages
+
+    async def lookup(self, query: str, max_age: float, min_score: float, top_k: int = 8) -> list[dict]:
+        """lookup_sync的异步版本，在线程池里检索并记录命中指标"""
+        pages = await run_blocking(self.lookup_sync, query, max_age, min_score, top_k)
+        get_metrics().local_index_lookups.inc(result="hit" if pages else "miss")
+        logger.info("本地索引%s: %s", "命中" if pages else "未命中", [page["url"] for page in pages])
+        return pages
+
+    def get_stats(self) -> dict:
+        """索引里的网页数、片段数和向量文件大小"""
+        with self._connect() as conn:
+            pages = conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+            chunks = conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+            vector_file = conn.execute("SELECT value FROM meta WHERE key = 'vector_file'").fetchone()[0]
+        path = self._vector_path(vector_file)
+        return {"pages": pages, "chunks": chunks, "vector_bytes": os.path.getsize(path) if os.path.exists(path) else 0}
+
+
+_index = None
+
+
+def get_local_index() -> LocalIndex:
+    """
+    获取进程内共享的本地索引，首次调用时按环境变量创建
+
+    Returns:
+        LocalIndex: 共享的本地索引
+    """
+    global _index
+    if _index is None:
+        _index = LocalIndex(
+            root=os.getenv('LOCAL_INDEX_DIR') or os.path.join(
+                os.getenv('PAGE_STORE_DIR') or os.path.join(os.getcwd(), ".page_store"), "local_index"),
+            max_chunks=int(os.getenv('LOCAL_INDEX_MAX_CHUNKS', '20000')),
+            retention=float(os.getenv('LOCAL_INDEX_RETENTION', '86400')),
+            use_vectors=os.getenv('LOCAL_INDEX_VECTORS', '1') == '1',
+            dim=int(os.getenv('LOCAL_INDEX_DIM', '256')),
+        )
+    return _index
+
+
+async def close_local_index():
+    """把队列里的网页写完，程序退出前调用"""
+    if _index is not None:
+        await _index.close()
@@ -0,0 +1,338 @@
+"""
+网页去重：镜像、转载、分页变体的重复内容不再重复发给总结模型
+
+搜索结果里经常有同一篇文章的镜像和转载，原来所有网页原文直接拼接，同样的文字要付好几次token。
+在抓取结果交给总结之前按到达顺序逐个去重：
+1. URL归一化（协议域名小写、去掉fragment和utm参数）后相同的网页只保留第一个
+2. 正文的SimHash（64位，中文按二元组、英文按单词）与已保留网页的海明距离不超过阈值时，判为近似重复，整页去掉
+3. 段落级去重：已保留网页里出现过的段落（归一化后相同）从后来的网页里删掉
+4. 指纹持久化在SQLite里，跨会话使用：
+   - 段落在同一网站超过DEDUP_BOILERPLATE_PAGES个不同网页出现过时视为网站模板（版权声明、导航等），直接删掉；
+     只按同一网站统计，转载到多个网站的正文不会被当成模板
+   - 一批URL里，之前抓取过且指纹近似重复的，只抓取第一个（known_mirrors）
+5. 每次请求删掉的字节数和估算token数写日志并计入指标
+
+环境变量:
+    PAGE_DEDUP: 是否去重，默认1
+    DEDUP_DB: 指纹数据库路径，默认 .page_store/fingerprints.db
+    DEDUP_SIMHASH_DISTANCE: 判为近似重复的最大海明距离，默认3
+    DEDUP_MIN_PARAGRAPH_CHARS: 参与段落去重的最短段落字符数，默认20
+    DEDUP_BOILERPLATE_PAGES: 段落出现在同一网站多少个不同网页后视为模板文字，默认5，0表示不判断
+    DEDUP_MAX_AGE_DAYS: 指纹保留天数，默认30
+"""
+
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import Counter
+from urllib.parse import urlsplit
+
+from context_packer import tokenize, estimate_tokens
+from search_engine import canonical_url
+from instrumentation import get_metrics
+from structured_logging import get_logger
+
+logger = get_logger("page_dedup")
+
+PAGE_DEDUP = os.getenv('PAGE_DEDUP', '1') == '1'
+
+_PARAGRAPH_SPLIT = re.compile(r"\n\s*\n")
+# 归一化段落时去掉的markdown符号、链接地址和空白
+_LINK_TARGET = re.compile(r"\]\([^)]*\)")
+_PARAGRAPH_NOISE = re.compile(r"[\s#>*_`|\-\[\]()!]+")
+
+
+def simhash(text: str, bits: int = 64) -> int:
+    """
+    文本的SimHash指纹
+
+    Args:
+        text: 文本
+        bits: 指纹位数
+
+    Returns:
+        int: 指纹，相似文本的指纹海明距离小
+    """
+    weights = [0] * bits
+    for term, count in Counter(tokenize(text)).items():
+        value = int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=bits // 8).digest(), "big")
+        for i in range(bits):
+            weights[i] += count if value >> i & 1 else -count
+    return sum(1 << i for i in range(bits) if weights[i] > 0)
+
+
+def hamming(a: int, b: int) -> int:
+    """两个指纹的海明距离"""
+    return bin(a ^ b).count("1")
+
+
+def paragraph_hash(paragraph: str) -> str:
+    """段落归一化（去掉markdown符号、链接地址、空白，英文小写）后的hash，没有文字的段落返回空字符串"""
+    text = _PARAGRAPH_NOISE.sub("", _LINK_TARGET.sub("]", paragraph)).lower()
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest() if text else ""
+
+
+class FingerprintStore:
+    """
+    持久化的网页指纹
+
+    Args:
+        path: SQLite文件路径
+        max_age: 指纹保留秒数，打开时清理更旧的记录
+    """
+
+    def __init__(self, path: str, max_age: float = 30 * 86400):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, simhash TEXT, seen_at REAL)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS paragraphs ("
+                "hash TEXT, url TEXT, host TEXT, seen_at REAL, PRIMARY KEY (hash, url))"
+            )
+            cutoff = time.time() - max_age
+            conn.execute("DELETE FROM pages WHERE seen_at < ?", (cutoff,))
+            conn.execute("DELETE FROM paragraphs WHERE seen_at < ?", (cutoff,))
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def page_fingerprints(self, urls: list[str]) -> dict:
+        """
+        查询网页的指纹
+
+        Args:
+            urls: 归一化后的URL
+
+        Returns:
+            dict: url -> simhash，没有记录的URL不在结果里
+        """
+        if not urls:
+            return {}
+        placeholders = ",".join("?" * len(urls))
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(f"SELECT url, simhash FROM pages WHERE url IN ({placeholders})", urls).fetchall()
+        return {url: int(value, 16) for url, value in rows}
+
+    def boilerplate(self, hashes: list[str], url: str, min_pages: int) -> set[str]:
+        """
+        找出在同一网站至少min_pages个其他网页里出现过的段落
+
+        Args:
+            hashes: 段落hash
+            url: 当前网页（归一化后），不计入
+            min_pages: 网页数阈值
+
+        Returns:
+            set[str]: 属于模板文字的段落hash
+        """
+        if not hashes or min_pages <= 0:
+            return set()
+        placeholders = ",".join("?" * len(hashes))
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT hash FROM paragraphs WHERE hash IN ({placeholders}) AND host = ? AND url != ? "
+                "GROUP BY hash HAVING COUNT(*) >= ?",
+                (*hashes, urlsplit(url).netloc, url, min_pages),
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def record(self, url: str, fingerprint: int, hashes: list[str]):
+        """保存一个网页（归一化后的URL）的指纹和段落hash"""
+        now = time.time()
+        host = urlsplit(url).netloc
+        with self._lock, self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?)", (url, f"{fingerprint:016x}", now))
+            conn.executemany(
+                "INSERT OR REPLACE INTO paragraphs VALUES (?, ?, ?, ?)",
+                [(paragraph, url, host, now) for paragraph in set(hashes)],
+            )
+
+
+class PageDeduper:
+    """
+    一次请求内的网页去重，网页按到达顺序逐个加入
+
+    add()会读写指纹数据库，在事件循环里要用run_blocking调用
+
+    Args:
+        store: 持久化的指纹，None表示只在本次请求内去重
+        distance: 判为近似重复的最大海明距离
+        min_paragraph_chars: 参与段落去重的最短段落字符数
+        boilerplate_pages: 段落出现在同一网站多少个不同网页后视为模板文字，0表示不判断
+    """
+
+    def __init__(self, store: FingerprintStore = None, distance: int = 3, min_paragraph_chars: int = 20,
+                 boilerplate_pages: int = 5):
+        self.store = store
+        self.distance = distance
+        self.min_paragraph_chars = min_paragraph_chars
+        self.boilerplate_pages = boilerplate_pages
+        self._urls = {}  # 归一化URL -> 保留的网页URL
+        self._fingerprints = []  # (simhash, 保留的网页URL)
+        self._paragraphs = set()
+        self.stats = {
+            "pages_in": 0, "pages_out": 0, "duplicate_pages": 0, "duplicate_paragraphs": 0,
+            "boilerplate_paragraphs": 0, "bytes_removed": 0, "tokens_removed": 0,
+        }
+
+    def _removed(self, text: str):
+        self.stats["bytes_removed"] += len(text.encode("utf-8"))
+        self.stats["tokens_removed"] += estimate_tokens(text)
+
+    def add(self, page: dict):
+        """
+        加入一个网页
+
+        Args:
+            page: 抓取结果，失败的网页原样返回
+
+        Returns:
+            dict | None: 去掉重复段落后的网页（markdown是新字符串，原网页不修改）；整页重复时返回None
+        """
+        if not page.get("success") or not page.get("markdown"):
+            return page
+        self.stats["pages_in"] += 1
+        markdown = page["markdown"]
+        key = canonical_url(page["url"]) if page.get("url") else None
+        fingerprint = simhash(markdown)
+
+        duplicate_of = self._urls.get(key) if key else None
+        if duplicate_of is None:
+            duplicate_of = next(
+                (url for value, url in self._fingerprints if hamming(value, fingerprint) <= self.distance), None
+            )
+        paragraphs = _PARAGRAPH_SPLIT.split(markdown)
+        hashes = [paragraph_hash(p) if len(p.strip()) >= self.min_paragraph_chars else "" for p in paragraphs]
+        boilerplate = set()
+        # 同一URL在本次请求里重复出现时不再记录，避免覆盖已保留网页的指纹
+        if self.store is not None and key and key not in self._urls:
+            if duplicate_of is None:
+                boilerplate = self.store.boilerplate([h for h in hashes if h], key, self.boilerplate_pages)
+            # 近似重复的网页只记指纹，段落不计入模板统计
+            self.store.record(key, fingerprint, [h for h in hashes if h] if duplicate_of is None else [])
+
+        if duplicate_of is not None:
+            logger.debug("[DEDUP] %s 与 %s 内容重复", page["url"], duplicate_of)
+            self.stats["duplicate_pages"] += 1
+            self._removed(markdown)
+            return None
+
+        kept = []
+        for paragraph, value in zip(paragraphs, hashes):
+            if value and value in boilerplate:
+                self.stats["boilerplate_paragraphs"] += 1
+                self._removed(paragraph)
+            elif value and value in self._paragraphs:
+                self.stats["duplicate_paragraphs"] += 1
+                self._removed(paragraph)
+            else:
+                kept.append(paragraph)
+                if value:
+                    self._paragraphs.add(value)
+        if key:
+            self._urls[key] = page["url"]
+        self._fingerprints.append((fingerprint, page["url"]))
+        if not any(paragraph.strip() for paragraph in kept):
+            # 所有段落都在前面的网页里出现过
+            self.stats["duplicate_pages"] += 1
+            return None
+        self.stats["pages_out"] += 1
+        if len(kept) == len(paragraphs):
+            return page
+        return {**page, "markdown": "\n\n".join(kept)}
+
+    def report(self):
+        """本次请求的去重结果写日志并计入指标"""
+        stats = self.stats
+        if not stats["pages_in"]:
+            return
+        metrics = get_metrics()
+        metrics.dedup_bytes_removed.inc(stats["bytes_removed"])
+        metrics.dedup_tokens_removed.inc(stats["tokens_removed"])
+        metrics.dedup_pages_dropped.inc(stats["duplicate_pages"])
+        logger.info("网页去重: %d -> %d 个网页，删掉重复段落 %d、模板段落 %d，共 %d 字节 / 约 %d tokens",
+                    stats["pages_in"], stats["pages_out"], stats["duplicate_paragraphs"],
+                    stats["boilerplate_paragraphs"], stats["bytes_removed"], stats["tokens_removed"])
+
+
+def dedup_pages(pages: list[dict], store: FingerprintStore = None) -> tuple[list[dict], dict]:
+    """
+    一次性对一批网页去重（同步，在线程池里调用）
+
+    Args:
+        pages: 抓取结果
+        store: 持久化的指纹，默认使用共享的指纹库
+
+    Returns:
+        tuple[list[dict], dict]: 去重后的网页和统计信息
+    """
+    deduper = new_deduper(store)
+    result = [page for page in (deduper.add(page) for page in pages) if page is not None]
+    deduper.report()
+    return result, deduper.stats
+
+
+def known_mirrors(urls: list[str], store: FingerprintStore = None) -> dict:
+    """
+    按之前保存的指纹，找出一批URL里内容近似重复的（同步，在线程池里调用）
+
+    Args:
+        urls: 要抓取的URL，按优先顺序排列
+        store: 持久化的指纹，默认使用共享的指纹库
+
+    Returns:
+        dict: 不需要再抓取的URL -> 与它重复、排在前面的URL
+    """
+    store = store or get_fingerprint_store()
+    keys = {url: canonical_url(url) for url in urls}
+    fingerprints = store.page_fingerprints(list(set(keys.values())))
+    distance = int(os.getenv('DEDUP_SIMHASH_DISTANCE', '3'))
+    kept = []  # (simhash, url)
+    mirrors = {}
+    for url in urls:
+        fingerprint = fingerprints.get(keys[url])
+        if fingerprint is None:
+            continue
+        original = next((other for value, other in kept if hamming(value, fingerprint) <= distance), None)
+        if original is not None and keys[original] != keys[url]:
+            mirrors[url] = original
+        else:
+            kept.append((fingerprint, url))
+    return mirrors
+
+
+_store = None
+
+
+def get_fingerprint_store() -> FingerprintStore:
+    """获取进程内共享的指纹库，首次调用时按环境变量创建"""
+    global _store
+    if _store is None:
+        _store = FingerprintStore(
+            path=os.getenv('DEDUP_DB') or os.path.join(os.getcwd(), ".page_store", "fingerprints.db"),
+            max_age=float(os.getenv('DEDUP_MAX_AGE_DAYS', '30')) * 86400,
+        )
+    return _store
+
+
+def new_deduper(store: FingerprintStore = None) -> PageDeduper:
+    """
+    按环境变量创建一次请求用的去重器
+
+    Args:
+        store: 持久化的指纹，默认使用共享的指纹库
+
+    Returns:
+        PageDeduper: 去重器
+    """
+    return PageDeduper(
+        store=store or get_fingerprint_store(),
+        distance=int(os.getenv('DEDUP_SIMHASH_DISTANCE', '3')),
+        min_paragraph_chars=int(os.getenv('DEDUP_MIN_PARAGRAPH_CHARS', '20')),
+        boilerplate_pages=int(os.getenv('DEDUP_BOILERPLATE_PAGES', '5')),
+    )
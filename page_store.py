@@ -0,0 +1,323 @@
+"""
+网页内容存储：按内容寻址的压缩存储，替代每次爬取都新建一个crawl_results_*.md
+
+1. 网页正文按sha256寻址，zlib压缩后保存为 objects/ab/<hash>.zz，镜像页面只存一份
+2. SQLite索引记录 URL -> 内容hash、抓取时间、最近访问时间
+3. 写入先放进内存队列，由后台任务批量写盘（在线程池里执行），不阻塞事件循环
+4. 总大小超过上限时，按最近访问时间淘汰最旧的记录
+5. 最近抓取过的URL直接从存储返回，不再启动浏览器爬取
+"""
+
+import os
+import time
+import zlib
+import sqlite3
+import asyncio
+import hashlib
+import threading
+from blocking import run_blocking
+from structured_logging import get_logger
+
+logger = get_logger("page_store")
+
+
+class PageStore:
+    """
+    按内容寻址的网页存储
+
+    Args:
+        root: 存储目录
+        max_bytes: 压缩后正文的总大小上限，超过时淘汰
+        max_age: 默认的新鲜度（秒），超过这个时间的记录lookup时视为未命中
+        batch_size: 攒够多少条写入就立即落盘
+        flush_interval: 写入最多延迟多少秒落盘
+    """
+
+    def __init__(self, root: str, max_bytes: int = 200 * 1024 * 1024, max_age: float = 3600,
+                 batch_size: int = 16, flush_interval: float = 0.5):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._db_lock = threading.Lock()
+        self._pending = {}  # 还没落盘的写入：url -> (markdown, fetched_at)
+        self._queue = None
+        self._writer = None
+        self._writer_loop = None
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                "url TEXT PRIMARY KEY, content_hash TEXT, fetched_at REAL, last_access REAL, size INTEGER)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_pages_fetched_at ON pages (fetched_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_pages_last_access ON pages (last_access)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS blobs (content_hash TEXT PRIMARY KEY, stored_size INTEGER)"
+            )
+            self._sweep_orphan_files(conn)
+            self._evict_locked(conn)
+
+    def _connect(self):
+        return sqlite3.connect(os.path.join(self.root, "index.db"), timeout=10)
+
+    def _blob_path(self, content_hash: str) -> str:
+        return os.path.join(self.root, "objects", content_hash[:2], f"{content_hash}.zz")
+
+    # ---------- 读取 ----------
+
+    def _read_sync(self, url: str, max_age: float):
+        now = time.time()
+        with self._db_lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT content_hash, fetched_at FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None or now - row[1] > max_age:
+                return None
+            conn.execute("UPDATE pages SET last_access = ? WHERE url = ?", (now, url))
+        try:
+            with open(self._blob_path(row[0]), "rb") as f:
+                return zlib.decompress(f.read()).decode("utf-8"), row[1]
+        except (OSError, zlib.error):
+            return None
+
+    async def get(self, url: str, max_age: float = None):
+        """
+        读取最近抓取过的网页
+
+        Args:
+            url: 网页URL
+            max_age: 新鲜度（秒），默认使用存储的max_age
+
+        Returns:
+            dict | None: 与爬虫结果相同结构的网页结果（cached=True），未命中返回None
+        """
+        max_age = self.max_age if max_age is None else max_age
+        pending = self._pending.get(url)
+        found = pending if pending is not None else await run_blocking(self._read_sync, url, max_age)
+        if found is None or time.time() - found[1] > max_age:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        markdown, fetched_at = found
+        logger.debug("[STORE] %s, length: %d", url, len(markdown))
+        return {
+            "url": url, "success": True, "markdown": markdown, "error": "",
+            "dropped": False, "cached": True, "fetched_at": fetched_at,
+        }
+
+    # ---------- 写入 ----------
+
+    def _ensure_writer(self):
+        loop = asyncio.get_running_loop()
+        if self._writer_loop is not loop or self._writer is None or self._writer.done():
+            self._queue = asyncio.Queue()
+            self._writer_loop = loop
+            # 换了事件循环时，旧循环里没落盘的写入重新排队
+            for url in list(self._pending):
+                self._queue.put_nowait(url)
+            self._writer = loop.create_task(self._write_loop())
+
+    async def put(self, page: dict):
+        """
+        保存一个抓取成功的网页，只放进写入队列，立即返回
+
+        Args:
+            page: 爬虫返回的网页结果
+        """
+        if not page.get("success") or not page.get("markdown"):
+            return
+        self._pending[page["url"]] = (page["markdown"], time.time())
+        self._ensure_writer()
+        self._queue.put_nowait(page["url"])
+
+    async def _write_loop(self):
+        while True:
+            urls = [await self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(urls) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    urls.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            batch = {url: self._pending[url] for url in dict.fromkeys(urls) if url in self._pending}
+            try:
+                await run_blocking(self._write_batch_sync, batch)
+            except Exception as e:
+                logger.exception("写入失败: %s", e)
+            finally:
+                for url, record in batch.items():
+                    # 落盘期间同一URL又有新写入时保留新的
+                    if self._pending.get(url) is record:
+                        del self._pending[url]
+                for _ in urls:
+                    self._queue.task_done()
+
+    def _write_batch_sync(self, batch: dict):
+        rows = []
+        for url, (markdown, fetched_at) in batch.items():
+            data = markdown.encode("utf-8")
+            content_hash = hashlib.sha256(data).hexdigest()
+            path = self._blob_path(content_hash)
+            if os.path.exists(path):
+                stored_size = os.path.getsize(path)
+            else:
+                compressed = zlib.compress(data, 6)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(compressed)
+                os.replace(tmp_path, path)
+                stored_size = len(compressed)
+            rows.append((url, content_hash, fetched_at, len(data), stored_size))
+
+        with self._db_lock, self._connect() as conn:
+            for url, content_hash, fetched_at, size, stored_size in rows:
+                conn.execute(
+                    "INSERT OR REPLACE INTO pages (url, content_hash, fetched_at, last_access, size) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (url, content_hash, fetched_at, fetched_at, size),
+                )
+                # 文件已经在磁盘上但没有blobs记录时（之前写入中途退出）也补上，计入总大小
+                conn.execute(
+                    "INSERT OR IGNORE INTO blobs (content_hash, stored_size) VALUES (?, ?)",
+                    (content_hash, stored_size),
+                )
+            self.stats["writes"] += len(rows)
+            self._evict_locked(conn)
+
+    def _evict_locked(self, conn):
+        """总大小超限时，按最近访问时间淘汰最旧的记录，并删除不再被引用的正文"""
+        total = conn.execute("SELECT COALESCE(SUM(stored_size), 0) FROM blobs").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # 先在内存里按引用计数算出要淘汰哪些记录，再批量删除，正文被多个URL共用时最后一个引用删掉才释放空间
+        sizes = dict(conn.execute("SELECT content_hash, stored_size FROM blobs").fetchall())
+        refs = dict(conn.execute("SELECT content_hash, COUNT(*) FROM pages GROUP BY content_hash").fetchall())
+        evicted = []
+        for url, content_hash in conn.execute("SELECT url, content_hash FROM pages ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            evicted.append((url,))
+            refs[content_hash] -= 1
+            if refs[content_hash] == 0:
+                total -= sizes.get(content_hash) or 0
+        conn.executemany("DELETE FROM pages WHERE url = ?", evicted)
+        self.stats["evictions"] += len(evicted)
+        self._delete_orphan_blobs_locked(conn)
+
+    def _delete_orphan_blobs_locked(self, conn):
+        """删除没有记录引用的正文，只查询一次"""
+        orphans = conn.execute(
+            "SELECT content_hash FROM blobs WHERE content_hash NOT IN (SELECT content_hash FROM pages)"
+        ).fetchall()
+        conn.executemany("DELETE FROM blobs WHERE content_hash = ?", orphans)
+        for content_hash, in orphans:
+            try:
+                os.remove(self._blob_path(content_hash))
+            except OSError:
+                pass
+
+    def _sweep_orphan_files(self, conn, grace: float = 60):
+        """
+        启动时清理磁盘上没有blobs记录的正文文件（写完文件、还没提交索引时进程退出留下的）
+
+        仍被pages引用的补上blobs记录计入总大小，没有引用的删除；
+        最近grace秒内写入的文件可能是其他进程正在提交的，跳过
+
+        Args:
+            conn: 索引数据库连接
+            grace: 跳过多少秒内修改过的文件
+        """
+        known = {content_hash for content_hash, in conn.execute("SELECT content_hash FROM blobs")}
+        referenced = {content_hash for content_hash, in conn.execute("SELECT DISTINCT content_hash FROM pages")}
+        now = time.time()
+        removed = 0
+        for dirpath, _, filenames in os.walk(os.path.join(self.root, "objects")):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                    if now - stat.st_mtime < grace:
+                        continue
+                    content_hash = filename[:-len(".zz")] if filename.endswith(".zz") else None
+                    if content_hash in known:
+                        continue
+                    if content_hash in referenced:
+                        conn.execute(
+                            "INSERT OR IGNORE INTO blobs (content_hash, stored_size) VALUES (?, ?)",
+                            (content_hash, stat.st_size),
+                        )
+                    else:
+                        # 没有引用的正文和残留的临时文件
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    pass
+        if removed:
+            logger.info("清理了 %d 个没有索引记录的正文文件", removed)
+
+    async def flush(self):
+        """等待队列里的写入全部落盘"""
+        if self._queue is not None and self._writer_loop is asyncio.get_running_loop():
+            await self._queue.join()
+
+    async def close(self):
+        """落盘后停止后台写入任务"""
+        await self.flush()
+        if self._writer is not None:
+            self._writer.cancel()
+            try:
+                await self._writer
+            except (asyncio.CancelledError, RuntimeError):
+                pass
+            self._writer = None
+
+    def get_stats(self) -> dict:
+        """
+        存储统计
+
+        Returns:
+            dict: 命中/未命中/写入/淘汰次数，以及记录数和压缩后总大小
+        """
+        with self._db_lock, self._connect() as conn:
+            pages = conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+            stored = conn.execute("SELECT COALESCE(SUM(stored_size), 0) FROM blobs").fetchone()[0]
+        return {**self.stats, "pages": pages, "stored_bytes": stored, "pending": len(self._pending)}
+
+
+_store = None
+
+
+def get_page_store() -> PageStore:
+    """
+    获取进程内共享的网页存储，首次调用时按环境变量创建
+
+    环境变量:
+        PAGE_STORE_DIR: 存储目录，默认当前目录下的 .page_store
+        PAGE_STORE_MAX_MB: 压缩后总大小上限（MB），默认200
+        PAGE_STORE_MAX_AGE: 记录的新鲜度（秒），默认3600
+
+    Returns:
+        PageStore: 共享的网页存储
+    """
+    global _store
+    if _store is None:
+        _store = PageStore(
+            root=os.getenv('PAGE_STORE_DIR') or os.path.join(os.getcwd(), ".page_store"),
+            max_bytes=int(float(os.getenv('PAGE_STORE_MAX_MB', '200')) * 1024 * 1024),
+            max_age=float(os.getenv('PAGE_STORE_MAX_AGE', '3600')),
+        )
+    return _store
+
+
+async def close_page_store():
+    """把还没落盘的写入写完，程序退出前调用"""
+    if _store is not None:
+        await _store.close()
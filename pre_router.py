@@ -0,0 +1,281 @@
+"""
+本地预路由：不调用模型，先判断问题是否需要联网搜索
+
+原来每个问题都要先等对话模型回一次，才知道要不要调用搜索工具。这里在对话模型之前先做一次本地判断：
+1. 分类器：字符n-gram（1到3个字，中文不需要分词）的朴素贝叶斯，用内置的示例问题训练，
+   可以用PRE_ROUTER_DATA追加自己的标注数据；需要搜索的概率不低于阈值时直接搜索
+2. 规则：问题里有今天、新闻、黄历、天气这类实时信息的关键词时，把分类器给出的需要搜索的几率
+   放大PRE_ROUTER_RULE_ODDS倍，而不是直接判为搜索："帮我翻译这句话：今天天气很好"这类
+   分类器很有把握不用搜索的任务仍然交给对话模型；直接搜索时今天/明天/昨天换成具体日期作为搜索词
+3. 追问里有"它""这个"等指代词时，搜索词要结合上下文改写，交给对话模型
+4. 其余拿不准的问题照旧交给对话模型判断
+
+环境变量:
+    PRE_ROUTER_THRESHOLD: 判为需要搜索的最低概率，默认0.99
+    PRE_ROUTER_RULE_ODDS: 命中实时关键词时需要搜索的几率放大的倍数，默认1000
+    PRE_ROUTER_DATA: 额外的训练数据，JSONL文件，每行 {"text": "...", "label": "search" 或 "direct"}
+"""
+
+import os
+import re
+import json
+import math
+from collections import Counter
+from datetime import datetime, timedelta
+
+from instrumentation import get_metrics
+from structured_logging import get_logger
+
+logger = get_logger("pre_router")
+
+# 实时信息的关键词，出现时更可能需要搜索（"最近邻""2025年工作总结"这类容易误判的泛化写法不算）
+_REALTIME = re.compile(
+    r"今天|今日|明天|昨天|本周|这周|最新|新闻|热搜|黄历|万年历|日历|天气|气温|股价|股票|汇率|金价|油价|"
+    r"比分|赛程|票房|排行榜|发布会|上映|"
+    r"\b(today|tomorrow|yesterday|latest|news|weather|stock price|this week)\b",
+    re.I,
+)
+# 指代上文的词，追问时搜索词需要结合上下文
+_REFERENCE = re.compile(r"它|他们|她们|这个|那个|这些|那些|上面|刚才|前面|\b(it|they|this|that|these|those)\b", re.I)
+_NOISE = re.compile(r"[\s\W_]+")
+_DATE_WORDS = {"今天": 0, "今日": 0, "明天": 1, "昨天": -1}
+
+# 内置训练数据：search 需要联网搜索，direct 模型自己就能回答
+SEED_EXAMPLES = [
+    ("search", "crawl4ai是什么"),
+    ("search", "langgraph最新版本有哪些新功能"),
+    ("search", "OpenAI最近发布了什么模型"),
+    ("search", "deepseek的官网地址"),
+    ("search", "Qwen2.5有哪些尺寸的模型"),
+    ("search", "硅基流动支持哪些模型"),
+    ("search", "tavily搜索API怎么收费"),
+    ("search", "北京到上海的高铁票价"),
+    ("search", "上海迪士尼门票多少钱"),
+    ("search", "华为Mate70什么时候发布"),
+    ("search", "苹果公司现在的市值"),
+    ("search", "iPhone最新款的价格"),
+    ("search", "杭州有哪些好吃的餐厅推荐"),
+    ("search", "特斯拉在中国的销量"),
+    ("search", "某某公司的联系电话"),
+    ("search", "英伟达最新显卡参数"),
+    ("search", "2024年诺贝尔文学奖得主是谁"),
+    ("search", "GitHub上star最多的Python项目"),
+    ("search", "知乎上关于大模型的讨论"),
+    ("search", "哪里可以下载crawl4ai的文档"),
+    ("search", "这部电影的豆瓣评分是多少"),
+    ("search", "查一下深圳的房价"),
+    ("search", "帮我搜索langchain的教程"),
+    ("search", "查询最近的航班信息"),
+    ("search", "what is the latest version of python"),
+    ("search", "who won the world cup"),
+    ("search", "search for langgraph examples"),
+    ("search", "price of bitcoin"),
+    ("direct", "你好"),
+    ("direct", "你好呀，你是谁"),
+    ("direct", "谢谢你的帮助"),
+    ("direct", "帮我写一首关于春天的诗"),
+    ("direct", "把这句话翻译成英文：我爱编程"),
+    ("direct", "翻译一下 hello world"),
+    ("direct", "用python写一个快速排序"),
+    ("direct", "写一个二分查找的函数"),
+    ("direct", "解释一下什么是递归"),
+    ("direct", "1加1等于几"),
+    ("direct", "计算123乘以456"),
+    ("direct", "帮我润色这段文字"),
+    ("direct", "给我讲个笑话"),
+    ("direct", "总结一下上面的内容"),
+    ("direct", "帮我起一个公司名字"),
+    ("direct", "如何提高写作水平"),
+    ("direct", "什么是面向对象编程"),
+    ("direct", "python的列表和元组有什么区别"),
+    ("direct", "写一封请假邮件"),
+    ("direct", "勾股定理是什么"),
+    ("direct", "帮我改一下这段代码的bug"),
+    ("direct", "给我一些学习英语的建议"),
+    ("direct", "hello"),
+    ("direct", "thank you"),
+    ("direct", "write a poem about the sea"),
+    ("direct", "explain recursion"),
+    ("direct", "translate this sentence into chinese"),
+]
+
+
+def char_ngrams(text: str, n_range: tuple = (1, 3)) -> set[str]:
+    """
+    字符n-gram特征：去掉空白和标点后按字切，英文转小写
+
+    Args:
+        text: 文本
+        n_range: n的最小值和最大值
+
+    Returns:
+        set[str]: 出现过的n-gram（只看有没有，不看次数）
+    """
+    text = _NOISE.sub(" ", text.lower()).strip()
+    grams = set()
+    for n in range(n_range[0], n_range[1] + 1):
+        grams.update(text[i:i + n] for i in range(len(text) - n + 1))
+    grams.discard(" ")
+    return grams
+
+
+class NgramClassifier:
+    """
+    字符n-gram（只看有没有出现）的朴素贝叶斯，训练和预测都是纯Python计数，单次预测不到1毫秒
+
+    朴素贝叶斯给出的概率偏极端，阈值要设得高一些
+
+    Args:
+        n_range: n-gram的长度范围
+    """
+
+    def __init__(self, n_range: tuple = (1, 3)):
+        self.n_range = n_range
+        self.doc_counts = Counter()  # label -> 样本数
+        self.feature_counts = {}  # label -> Counter(n-gram -> 包含它的样本数)
+        self.vocabulary = set()
+
+    def fit(self, examples: list[tuple[str, str]]):
+        """
+        追加训练样本
+
+        Args:
+            examples: (label, text) 列表
+        """
+        for label, text in examples:
+            grams = char_ngrams(text, self.n_range)
+            self.doc_counts[label] += 1
+            self.feature_counts.setdefault(label, Counter()).update(grams)
+            self.vocabulary.update(grams)
+        return self
+
+    def predict_proba(self, text: str) -> dict[str, float]:
+        """
+        各类别的概率
+
+        只用训练时见过的n-gram，没见过的字不影响结果
+
+        Returns:
+            dict[str, float]: label -> 概率
+        """
+        grams = char_ngrams(text, self.n_range) & self.vocabulary
+        total = sum(self.doc_counts.values())
+        scores = {}
+        for label, docs in self.doc_counts.items():
+            counts = self.feature_counts[label]
+            score = math.log(docs / total)
+            for gram in grams:
+                score += math.log((counts[gram] + 1) / (docs + 2))
+            scores[label] = score
+        top = max(scores.values())
+        exp_scores = {label: math.exp(score - top) for label, score in scores.items()}
+        norm = sum(exp_scores.values())
+        return {label: value / norm for label, value in exp_scores.items()}
+
+
+def load_examples(path: str) -> list[tuple[str, str]]:
+    """读取JSONL格式的训练数据，格式不对的行跳过"""
+    examples = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                item = json.loads(line)
+                examples.append((item["label"], item["text"]))
+            except (ValueError, KeyError, TypeError):
+                continue
+    return examples
+
+
+def search_query(question: str, today: datetime = None) -> str:
+    """
+    预路由直接搜索时用的搜索词：今天/明天/昨天换成具体日期，去掉结尾的问号；
+    只用于已经判为需要搜索的问题，不要用来改写其他文本
+
+    Args:
+        question: 用户问题
+        today: 当天日期，默认现在
+
+    Returns:
+        str: 搜索词
+    """
+    today = today or datetime.now()
+    query = question.strip().rstrip("?？。!！")
+    for word, offset in _DATE_WORDS.items():
+        if word in query:
+            query = query.replace(word, (today + timedelta(days=offset)).strftime("%Y-%m-%d"))
+    return query
+
+
+class PreRouter:
+    """
+    对话模型之前的本地路由
+
+    Args:
+        classifier: 训练好的分类器
+        threshold: 判为需要搜索的最低概率
+        rule_odds: 命中实时关键词时，需要搜索的几率（p/(1-p)）放大的倍数
+    """
+
+    def __init__(self, classifier: NgramClassifier, threshold: float = 0.99, rule_odds: float = 1000):
+        self.classifier = classifier
+        self.threshold = threshold
+        self.rule_odds = rule_odds
+
+    def route(self, question: str, has_history: bool = False) -> tuple[str, str, float]:
+        """
+        判断问题是否需要搜索
+
+        Args:
+            question: 用户问题
+            has_history: 是否有之前的对话轮次，有时指代上文的问题交给对话模型
+
+        Returns:
+            tuple[str, str, float]: (route, decided_by, 需要搜索的概率)，route为"search"或"llm"；
+                                    命中实时关键词且因此改变结果时decided_by为"rule"
+        """
+        if has_history and _REFERENCE.search(question):
+            return "llm", "reference", 1.0
+        proba = self.classifier.predict_proba(question).get("search", 0.0)
+        decided_by = "classifier"
+        if _REALTIME.search(question) and proba < 1.0:
+            boosted = proba * self.rule_odds / (proba * self.rule_odds + 1 - proba)
+            if boosted >= self.threshold > proba:
+                decided_by = "rule"
+            proba = boosted
+        return ("search" if proba >= self.threshold else "llm"), decided_by, proba
+
+    def decide(self, question: str, has_history: bool = False):
+        """
+        判断并记录指标
+
+        Returns:
+            str | None: 需要直接搜索时返回搜索词，交给对话模型时返回None
+        """
+        route, decided_by, confidence = self.route(question, has_history)
+        get_metrics().pre_routes.inc(route=route, decided_by=decided_by)
+        logger.info("预路由: %s（%s，%.2f）", route, decided_by, confidence)
+        return search_query(question) if route == "search" else None
+
+
+_router = None
+
+
+def get_pre_router() -> PreRouter:
+    """
+    获取进程内共享的预路由，首次调用时训练分类器
+
+    Returns:
+        PreRouter: 共享的预路由
+    """
+    global _router
+    if _router is None:
+        classifier = NgramClassifier().fit(SEED_EXAMPLES)
+        data_path = os.getenv('PRE_ROUTER_DATA')
+        if data_path:
+            classifier.fit(load_examples(data_path))
+        _router = PreRouter(
+            classifier,
+            threshold=float(os.getenv('PRE_ROUTER_THRESHOLD', '0.99')),
+            rule_odds=float(os.getenv('PRE_ROUTER_RULE_ODDS', '1000')),
+        )
+    return _router
@@ -0,0 +1,381 @@
+"""
+上游调用的限流、重试和熔断：搜索服务商、SiliconFlow模型接口
+
+1. 令牌桶限流：每个上游一个桶，所有会话共享，突发请求排队而不是一起打到上游触发429
+2. 重试：429、5xx、超时、连接错误按带随机抖动的指数退避重试，响应里有Retry-After时按它等待
+3. 熔断：某个上游连续失败达到阈值后熔断一段时间，期间直接失败，
+   调用方（多服务商搜索、模型备选）立即切换到其他上游，不再等超时
+4. 令牌桶用线程锁计算等待时间，异步调用和同步调用（学习3的LangChain工具）共用同一个桶
+
+环境变量（<KEY>为上游名转大写，非字母数字替换为下划线，如 TAVILY、SILICONFLOW）:
+    RATE_LIMIT_<KEY>: "每秒请求数/突发数"，如 "5/10"，0表示不限流
+    RETRY_MAX: 最多重试次数，默认2
+    RETRY_BASE_DELAY: 退避的基础秒数，默认0.5
+    RETRY_MAX_DELAY: 单次等待的最大秒数，Retry-After超过它时不再重试，默认20
+    BREAKER_FAILURES: 连续失败多少次后熔断，默认5
+    BREAKER_RESET: 熔断多少秒后放行一个试探请求，默认30
+"""
+
+import os
+import re
+import time
+import random
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+
+from instrumentation import get_metrics, observe_queue_wait
+from structured_logging import get_logger
+
+logger = get_logger("resilience")
+
+# 默认限流：DuckDuckGo对频繁请求很敏感
+DEFAULT_RATE_LIMITS = {
+    "tavily": "5/10",
+    "duckduckgo": "1/2",
+    "siliconflow": "10/20",
+}
+
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+# 第三方库的超时、连接、限流异常按类名识别，不依赖具体的库
+_RETRYABLE_NAME = re.compile(r"Timeout|Connect|Transport|Protocol|RateLimit|Ratelimit")
+
+
+class CircuitOpenError(Exception):
+    """上游处于熔断状态，请求未发出"""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"{name} 已熔断，{retry_in:.1f}秒后重试")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class TokenBucket:
+    """
+    令牌桶：以rate个/秒的速度补充令牌，最多攒burst个
+
+    acquire时先预订一个令牌（令牌数可以为负），再按欠下的令牌数计算需要等待的时间，
+    等待的请求按预订顺序依次放行
+
+    Args:
+        rate: 每秒补充的令牌数，<=0表示不限流
+        burst: 桶容量
+    """
+
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = rate
+        self.burst = max(burst or rate, 1)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """预订一个令牌，返回需要等待的秒数"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+    def refund(self):
+        """退还一个预订了但没有用上的令牌"""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + 1)
+
+    async def acquire(self) -> float:
+        """异步等待一个令牌，返回等待的秒数；等待期间被取消时退还预订的令牌"""
+        wait = self.reserve()
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                self.refund()
+                raise
+        return wait
+
+    def acquire_sync(self) -> float:
+        """同步等待一个令牌，返回等待的秒数"""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class CircuitBreaker:
+    """
+    熔断器：closed（正常）→ 连续失败failure_threshold次 → open（直接拒绝）
+    → reset_timeout秒后 half_open（放行一个试探请求）→ 成功则closed，失败则重新open
+
+    Args:
+        name: 上游名
+        failure_threshold: 连续失败多少次后熔断
+        reset_timeout: 熔断多少秒后放行试探请求
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """请求前检查，熔断中时抛出CircuitOpenError"""
+        with self._lock:
+            if self.state == "closed":
+                return
+            retry_in = self._opened_at + self.reset_timeout - time.monotonic()
+            if self.state == "open" and retry_in <= 0:
+                self._set_state("half_open")
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return
+            raise CircuitOpenError(self.name, max(retry_in, 0.0))
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            if self.state != "closed":
+                self._set_state("closed")
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                if self.state != "open":
+                    self._set_state("open")
+
+    def release(self):
+        """请求既不算成功也不算失败（如被取消、参数错误）时释放试探名额"""
+        with self._lock:
+            self._probing = False
+
+    def _set_state(self, state: str):
+        self.state = state
+        logger.warning("上游 %s 熔断器状态: %s", self.name, state)
+        get_metrics().circuit_state.set({"closed": 0, "half_open": 1, "open": 2}[state], upstream=self.name)
+
+
+def status_code(exc: BaseException):
+    """从异常里取HTTP状态码（httpx.HTTPStatusError、openai.APIStatusError等）"""
+    code = getattr(exc, "status_code", None)
+    if code is None:
+        code = getattr(getattr(exc, "response", None), "status_code", None)
+    return code if isinstance(code, int) else None
+
+
+def retry_after(exc: BaseException):
+    """
+    从异常的响应头里读取Retry-After
+
+    Returns:
+        float | None: 需要等待的秒数，没有该响应头时返回None
+    """
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """429、5xx、超时和连接错误可以重试；其他错误（参数错误、鉴权失败等）重试也没用"""
+    code = status_code(exc)
+    if code is not None:
+        return code in RETRYABLE_STATUS
+    if isinstance(exc, (TimeoutError, ConnectionError, asyncio.TimeoutError)):
+        return True
+    return bool(_RETRYABLE_NAME.search(type(exc).__name__))
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """第attempt次重试前的等待秒数：full jitter指数退避"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def _env_key(name: str) -> str:
+    return re.sub(r"[^0-9A-Za-z]", "_", name).upper()
+
+
+class Upstream:
+    """
+    一个上游：令牌桶 + 熔断器 + 重试策略
+
+    Args:
+        name: 上游名，用于日志和指标
+        limiter: 令牌桶，多个上游可以共用（如同一个模型接口下的不同模型）
+        breaker: 熔断器
+        max_retries: 最多重试次数
+        base_delay: 退避的基础秒数
+        max_delay: 单次等待的最大秒数
+    """
+
+    def __init__(self, name: str, limiter: TokenBucket, breaker: CircuitBreaker,
+                 max_retries: int = 2, base_delay: float = 0.5, max_delay: float = 20.0):
+        self.name = name
+        self.limiter = limiter
+        self.breaker = breaker
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def _next_delay(self, exc: BaseException, attempt: int):
+        """失败后决定是否重试，返回等待秒数，不重试时返回None"""
+        if attempt >= self.max_retries or not is_retryable(exc):
+            return None
+        delay = retry_after(exc)
+        if delay is None:
+            return backoff_delay(attempt, self.base_delay, self.max_delay)
+        # Retry-After太长时不等，交给调用方切换到其他上游
+        return delay + random.uniform(0, self.base_delay) if delay <= self.max_delay else None
+
+    def _record(self, exc: BaseException = None):
+        if exc is None:
+            self.breaker.record_success()
+        elif is_retryable(exc):
+            self.breaker.record_failure()
+        else:
+            self.breaker.release()
+
+    async def call(self, fn, *args, **kwargs):
+        """
+        限流、重试、熔断保护下调用异步函数
+
+        Args:
+            fn: 返回awaitable的函数，每次重试重新调用
+            *args, **kwargs: 传给fn的参数
+
+        Returns:
+            fn的返回值
+
+        Raises:
+            CircuitOpenError: 上游熔断中
+            Exception: 重试用尽后的最后一个错误
+        """
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            try:
+                # 等令牌时被取消也要释放before_call拿到的试探名额，否则熔断器一直停在half_open
+                waited = await self.limiter.acquire()
+                if waited > 0:
+                    observe_queue_wait(f"rate_limit:{self.name}", waited)
+                result = await fn(*args, **kwargs)
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            except Exception as e:
+                self._record(e)
+                delay = self._next_delay(e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                get_metrics().upstream_retries.inc(upstream=self.name)
+                logger.info("上游 %s 调用失败（%s），%.2f秒后第%d次重试", self.name, e, delay, attempt)
+                await asyncio.sleep(delay)
+                continue
+            self._record()
+            return result
+
+    def call_sync(self, fn, *args, **kwargs):
+        """call的同步版本，供同步的LangChain工具使用"""
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            self.limiter.acquire_sync()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                self._record(e)
+                delay = self._next_delay(e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                get_metrics().upstream_retries.inc(upstream=self.name)
+                logger.info("上游 %s 调用失败（%s），%.2f秒后第%d次重试", self.name, e, delay, attempt)
+                time.sleep(delay)
+                continue
+            self._record()
+            return result
+
+
+# 令牌桶、熔断器、上游都是进程级共享的，所有会话共用
+_limiters = {}
+_breakers = {}
+_upstreams = {}
+_registry_lock = threading.Lock()
+
+
+def get_rate_limiter(key: str) -> TokenBucket:
+    """
+    获取共享的令牌桶，首次调用时按 RATE_LIMIT_<KEY> 创建
+
+    key形如 "kind:xxx" 时，按冒号前的部分读取配置，同一类上游的多个桶共用一份配置
+
+    Args:
+        key: 限流的键，如 "tavily"、"siliconflow"
+
+    Returns:
+        TokenBucket: 令牌桶
+    """
+    with _registry_lock:
+        if key not in _limiters:
+            kind = key.split(":", 1)[0]
+            spec = os.getenv(f'RATE_LIMIT_{_env_key(kind)}', DEFAULT_RATE_LIMITS.get(kind, "0"))
+            rate, _, burst = spec.partition("/")
+            _limiters[key] = TokenBucket(float(rate), float(burst) if burst else None)
+        return _limiters[key]
+
+
+def get_upstream(name: str, limiter_key: str = None) -> Upstream:
+    """
+    获取共享的上游，熔断器按name区分，令牌桶按limiter_key区分
+
+    Args:
+        name: 上游名，如 "tavily"、"llm:Qwen/Qwen2.5-7B-Instruct"
+        limiter_key: 令牌桶的键，默认与name相同；同一接口下的多个模型可以共用一个桶
+
+    Returns:
+        Upstream: 上游
+    """
+    limiter = get_rate_limiter(limiter_key or name)
+    with _registry_lock:
+        if name not in _upstreams:
+            if name not in _breakers:
+                _breakers[name] = CircuitBreaker(
+                    name,
+                    failure_threshold=int(os.getenv('BREAKER_FAILURES', '5')),
+                    reset_timeout=float(os.getenv('BREAKER_RESET', '30')),
+                )
+            _upstreams[name] = Upstream(
+                name, limiter, _breakers[name],
+                max_retries=int(os.getenv('RETRY_MAX', '2')),
+                base_delay=float(os.getenv('RETRY_BASE_DELAY', '0.5')),
+                max_delay=float(os.getenv('RETRY_MAX_DELAY', '20')),
+            )
+        return _upstreams[name]
+
+
+def breaker_states() -> dict:
+    """所有熔断器的当前状态，供健康检查使用"""
+    return {name: breaker.state for name, breaker in _breakers.items()}
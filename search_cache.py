@@ -0,0 +1,336 @@
+"""
+搜索结果缓存：内存LRU + 可选的SQLite磁盘缓存
+
+相同或几乎相同的查询不再重复请求Tavily/DuckDuckGo：
+1. 查询归一化（全角转半角、大小写、空白、结尾标点），"crawl4ai是什么？" 与 "Crawl4AI 是什么" 命中同一条缓存
+2. 按服务商设置过期时间（TTL）
+3. 内存LRU未命中时再查SQLite，进程重启后仍可命中
+4. 同一个查询并发到达时只请求一次上游，其余请求等待共享结果（single-flight）；
+   发起请求的那一个被取消时，不连带取消等待者，由等待者之一重新请求
+5. 统计命中、未命中、淘汰次数
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import asyncio
+import threading
+import unicodedata
+from collections import OrderedDict
+from blocking import run_blocking
+
+# 各服务商的默认缓存时间（秒）
+DEFAULT_TTLS = {
+    "tavily": 3600,
+    "duckduckgo": 1800,
+}
+
+_TRAILING_PUNCTUATION = "?？!！。.,，;；~～ "
+
+
+def normalize_query(query: str) -> str:
+    """
+    查询归一化：全角转半角、转小写、合并空白、去掉结尾标点，
+    中文与英文之间的空格也去掉
+
+    Args:
+        query: 原始查询
+
+    Returns:
+        str: 归一化后的查询
+    """
+    query = unicodedata.normalize("NFKC", query or "").lower().strip()
+    query = re.sub(r"\s+", " ", query)
+    query = re.sub(r"(?<=[^\x00-\x7f]) (?=[\x00-\x7f])|(?<=[\x00-\x7f]) (?=[^\x00-\x7f])", "", query)
+    return query.rstrip(_TRAILING_PUNCTUATION)
+
+
+class LeaderCancelledError(Exception):
+    """single-flight里发起请求的调用被取消，等待者收到后重新查缓存或请求"""
+
+
+class SearchCache:
+    """
+    两级搜索结果缓存
+
+    Args:
+        max_entries: 内存LRU的最大条数
+        ttls: 各服务商的缓存时间（秒），未配置的服务商使用default_ttl
+        default_ttl: 默认缓存时间（秒）
+        db_path: SQLite文件路径，None表示不启用磁盘缓存
+    """
+
+    def __init__(self, max_entries: int = 1024, ttls: dict = None, default_ttl: float = 600, db_path: str = None):
+        self.max_entries = max_entries
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.default_ttl = default_ttl
+        self.db_path = db_path
+        self._memory = OrderedDict()  # key -> (expires_at, results)
+        self._lock = threading.Lock()
+        self._inflight = {}  # 异步请求的single-flight：key -> Future
+        self._inflight_sync = {}  # 同步请求的single-flight：key -> (Event, 结果槽)
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "evictions": 0,
+            "expired": 0,
+        }
+        if db_path:
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS search_cache ("
+                    "key TEXT PRIMARY KEY, provider TEXT, results TEXT, expires_at REAL)"
+                )
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    def make_key(self, provider: str, query: str, max_results: int) -> str:
+        return f"{provider.lower()}|{max_results}|{normalize_query(query)}"
+
+    def ttl_for(self, provider: str) -> float:
+        return self.ttls.get(provider.lower(), self.default_ttl)
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    # ---------- 内存层 ----------
+
+    def _memory_get(self, key: str):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            expires_at, results = entry
+            if expires_at < time.time():
+                del self._memory[key]
+                self.stats["expired"] += 1
+                return None
+            self._memory.move_to_end(key)
+            return results
+
+    def _memory_put(self, key: str, results, expires_at: float):
+        with self._lock:
+            self._memory[key] = (expires_at, results)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    # ---------- 磁盘层 ----------
+
+    def _disk_get(self, key: str):
+        if not self.db_path:
+            return None
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT results, expires_at FROM search_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        if row[1] < time.time():
+            self._count("expired")
+            return None
+        return json.loads(row[0]), row[1]
+
+    def _disk_put(self, key: str, provider: str, results, expires_at: float):
+        if not self.db_path:
+            return
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO search_cache (key, provider, results, expires_at) VALUES (?, ?, ?, ?)",
+                (key, provider, json.dumps(results, ensure_ascii=False), expires_at),
+            )
+            # 顺带清理过期记录
+            conn.execute("DELETE FROM search_cache WHERE expires_at < ?", (time.time(),))
+
+    # ---------- 读写 ----------
+
+    def lookup(self, key: str):
+        """
+        先查内存再查磁盘，磁盘命中时回填内存
+
+        Returns:
+            命中的结果，未命中返回None
+        """
+        results = self._memory_get(key)
+        if results is not None:
+            self._count("memory_hits")
+            return results
+        found = self._disk_get(key)
+        if found is not None:
+            results, expires_at = found
+            self._memory_put(key, results, expires_at)
+            self._count("disk_hits")
+            return results
+        return None
+
+    def store(self, key: str, provider: str, results):
+        """写入两级缓存，空结果不缓存"""
+        if not results:
+            return
+        expires_at = time.time() + self.ttl_for(provider)
+        self._memory_put(key, results, expires_at)
+        self._disk_put(key, provider, results, expires_at)
+
+    async def get_or_fetch(self, provider: str, query: str, max_results: int, fetch):
+        """
+        异步读取缓存，未命中时调用fetch请求上游；并发的相同查询只请求一次
+
+        Args:
+            provider: 搜索服务商
+            query: 搜索查询
+            max_results: 最大结果数
+            fetch: 无参的异步函数，返回搜索结果
+
+        Returns:
+            tuple: (搜索结果, 是否来自缓存)
+        """
+        key = self.make_key(provider, query, max_results)
+        while True:
+            results = self._memory_get(key)
+            if results is not None:
+                self._count("memory_hits")
+                return results, True
+
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                break
+            try:
+                results = await asyncio.shield(inflight)
+            except LeaderCancelledError:
+                # 发起请求的调用被取消（如竞速模式下输掉的服务商），重新来过，由其中一个等待者请求；
+                # 这次等待没有拿到结果，不计入合并次数
+                continue
+            except Exception:
+                self._count("coalesced")
+                raise
+            # 每次调用最多计一次合并，重试多轮的等待者不会重复计数
+            self._count("coalesced")
+            return results, True
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            results = await run_blocking(self.lookup, key) if self.db_path else None
+            from_cache = results is not None
+            if not from_cache:
+                self._count("misses")
+                results = await fetch()
+                if self.db_path:
+                    await run_blocking(self.store, key, provider, results)
+                else:
+                    self.store(key, provider, results)
+            future.set_result(results)
+            return results, from_cache
+        except BaseException as e:
+            # 取消只属于发起请求的这次调用，等待者收到普通异常后重试，不会被连带取消
+            future.set_exception(LeaderCancelledError(key) if isinstance(e, asyncio.CancelledError) else e)
+            # 没有其他等待者时，避免"Future exception was never retrieved"警告
+            future.exception()
+            raise
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def get_or_fetch_sync(self, provider: str, query: str, max_results: int, fetch):
+        """
+        同步版本的get_or_fetch，多线程并发的相同查询只请求一次
+
+        Args:
+            provider: 搜索服务商
+            query: 搜索查询
+            max_results: 最大结果数
+            fetch: 无参的同步函数，返回搜索结果
+
+        Returns:
+            tuple: (搜索结果, 是否来自缓存)
+        """
+        key = self.make_key(provider, query, max_results)
+        results = self.lookup(key)
+        if results is not None:
+            return results, True
+
+        with self._lock:
+            waiting = self._inflight_sync.get(key)
+            if waiting is None:
+                waiting = (threading.Event(), {})
+                self._inflight_sync[key] = waiting
+                leader = True
+            else:
+                self.stats["coalesced"] += 1
+                leader = False
+        event, slot = waiting
+        if not leader:
+            event.wait()
+            if "error" in slot:
+                raise slot["error"]
+            return slot["results"], True
+
+        try:
+            self._count("misses")
+            results = fetch()
+            self.store(key, provider, results)
+            slot["results"] = results
+            return results, False
+        except BaseException as e:
+            slot["error"] = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight_sync.pop(key, None)
+            event.set()
+
+    def get_stats(self) -> dict:
+        """
+        缓存统计
+
+        Returns:
+            dict: 命中/未命中/合并/淘汰/过期次数，以及命中率和当前条数
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_entries"] = len(self._memory)
+        hits = stats["memory_hits"] + stats["disk_hits"] + stats["coalesced"]
+        total = hits + stats["misses"]
+        stats["hit_rate"] = hits / total if total else 0.0
+        return stats
+
+    def clear(self):
+        """清空内存缓存"""
+        with self._lock:
+            self._memory.clear()
+
+
+_cache = None
+
+
+def get_search_cache() -> SearchCache:
+    """
+    获取进程内共享的搜索缓存，首次调用时按环境变量创建
+
+    环境变量:
+        SEARCH_CACHE_SIZE: 内存LRU条数，默认1024
+        SEARCH_CACHE_DB: SQLite文件路径，不设置则只使用内存缓存
+        SEARCH_CACHE_TTL_TAVILY / SEARCH_CACHE_TTL_DUCKDUCKGO: 各服务商缓存秒数
+
+    Returns:
+        SearchCache: 共享的搜索缓存
+    """
+    global _cache
+    if _cache is None:
+        ttls = {
+            provider: float(os.getenv(f"SEARCH_CACHE_TTL_{provider.upper()}", ttl))
+            for provider, ttl in DEFAULT_TTLS.items()
+        }
+        _cache = SearchCache(
+            max_entries=int(os.getenv('SEARCH_CACHE_SIZE', '1024')),
+            ttls=ttls,
+            db_path=os.getenv('SEARCH_CACHE_DB') or None,
+        )
+    return _cache
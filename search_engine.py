@@ -0,0 +1,334 @@
+"""
+多服务商搜索：并发查询多个搜索服务商
+
+1. race（竞速）：按预估延迟从快到慢依次发起请求，每隔stagger秒再加一个服务商，
+   谁先返回非空结果就用谁，其余请求取消；stagger=0时所有服务商同时发起
+2. fuse（融合）：所有服务商同时查询，结果按URL去重，用倒数排名融合（RRF）重新排序；
+   每个服务商一返回就可以通过on_results回调交出结果，抓取不必等最慢的服务商
+3. 每个服务商的延迟（指数滑动平均）和失败率都会记录，决定race时先试哪个服务商
+4. 各服务商结果统一成 title/url/content/score/provider 的格式
+   （DuckDuckGo的link/snippet、JSON字符串形式的结果都在这里处理）
+"""
+
+import os
+import json
+import time
+import asyncio
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from search_cache import get_search_cache
+from web_search import get_search_client
+from resilience import get_upstream, CircuitOpenError
+from structured_logging import get_logger
+
+logger = get_logger("search_engine")
+
+# RRF的平滑常数
+RRF_K = 60
+
+
+def normalize_results(results, provider: str) -> list[dict]:
+    """
+    把服务商返回的结果统一成 title/url/content/score/provider/rank
+
+    Args:
+        results: 搜索结果，列表或JSON字符串
+        provider: 服务商名
+
+    Returns:
+        list[dict]: 统一格式的结果，没有URL的条目会被丢弃
+    """
+    if isinstance(results, str):
+        try:
+            results = json.loads(results)
+        except ValueError:
+            return []
+    if isinstance(results, dict):
+        results = results.get("results", [])
+    normalized = []
+    for item in results or []:
+        if not isinstance(item, dict):
+            continue
+        url = item.get("url") or item.get("link") or item.get("href") or ""
+        if not url:
+            continue
+        normalized.append({
+            "title": item.get("title", ""),
+            "url": url,
+            "content": item.get("content") or item.get("snippet") or item.get("body") or "",
+            "score": item.get("score"),
+            "provider": provider,
+            "rank": len(normalized) + 1,
+        })
+    return normalized
+
+
+def canonical_url(url: str) -> str:
+    """
+    用于去重的URL：协议和域名转小写，去掉fragment、utm参数和结尾的斜杠
+
+    Args:
+        url: 原始URL
+
+    Returns:
+        str: 归一化后的URL
+    """
+    parts = urlsplit(url.strip())
+    query = urlencode([(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not k.startswith("utm_")])
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, query, ""))
+
+
+def fuse_results(result_lists: list[list[dict]], max_results: int = 5) -> list[dict]:
+    """
+    倒数排名融合：每个服务商里排第r的结果得分 1/(RRF_K + r)，同一URL的得分相加
+
+    Args:
+        result_lists: 各服务商统一格式后的结果
+        max_results: 返回的结果数
+
+    Returns:
+        list[dict]: 融合后的结果，providers字段列出返回过该URL的服务商
+    """
+    merged = {}
+    for results in result_lists:
+        for item in results:
+            key = canonical_url(item["url"])
+            entry = merged.get(key)
+            if entry is None:
+                entry = merged[key] = {**item, "providers": [], "fused_score": 0.0}
+            entry["fused_score"] += 1 / (RRF_K + item["rank"])
+            entry["providers"].append(item["provider"])
+            # 保留更长的摘要
+            if len(item["content"]) > len(entry["content"]):
+                entry["content"] = item["content"]
+    ranked = sorted(merged.values(), key=lambda entry: -entry["fused_score"])[:max_results]
+    for rank, entry in enumerate(ranked, 1):
+        entry["rank"] = rank
+    return ranked
+
+
+class ProviderStats:
+    """
+    每个服务商的延迟和失败情况，用于决定竞速时的先后顺序
+
+    Args:
+        alpha: 延迟滑动平均的权重
+        failure_penalty: 失败率对预估延迟的惩罚（秒）
+    """
+
+    def __init__(self, alpha: float = 0.3, failure_penalty: float = 5.0):
+        self.alpha = alpha
+        self.failure_penalty = failure_penalty
+        self._stats = {}  # provider -> {"latency": 滑动平均, "calls": 次数, "failures": 失败率滑动平均}
+
+    def record(self, provider: str, latency: float, ok: bool):
+        stats = self._stats.setdefault(provider, {"latency": latency, "calls": 0, "failures": 0.0})
+        stats["calls"] += 1
+        if ok:
+            stats["latency"] += self.alpha * (latency - stats["latency"])
+        stats["failures"] += self.alpha * ((0.0 if ok else 1.0) - stats["failures"])
+
+    def record_cancelled(self, provider: str, elapsed: float):
+        """
+        竞速中被取消的请求：不算成功也不算失败，不计入调用次数；
+        真实延迟至少是elapsed，只在已知延迟比它小时把延迟往elapsed调整
+        """
+        stats = self._stats.get(provider)
+        if stats is None:
+            self._stats[provider] = {"latency": elapsed, "calls": 0, "failures": 0.0}
+        elif stats["latency"] < elapsed:
+            stats["latency"] += self.alpha * (elapsed - stats["latency"])
+
+    def expected_latency(self, provider: str) -> float:
+        """预估延迟；还没有数据的服务商返回0，保证会被尝试"""
+        stats = self._stats.get(provider)
+        if stats is None:
+            return 0.0
+        return stats["latency"] + stats["failures"] * self.failure_penalty
+
+    def order(self, providers: list[str]) -> list[str]:
+        """按预估延迟从快到慢排序，相同时保持配置顺序"""
+        return sorted(providers, key=lambda provider: (self.expected_latency(provider), providers.index(provider)))
+
+    def snapshot(self) -> dict:
+        return {provider: dict(stats) for provider, stats in self._stats.items()}
+
+
+class SearchEngine:
+    """
+    多服务商搜索
+
+    Args:
+        providers: 服务商列表，如 ["tavily", "duckduckgo"]
+        mode: "race" 或 "fuse"
+        stagger: race模式下，每隔多少秒加入下一个服务商，0表示同时发起
+        timeout: fuse模式下等待所有服务商的最长秒数
+        use_cache: 是否使用搜索缓存
+    """
+
+    def __init__(self, providers: list[str], mode: str = "race", stagger: float = 1.0,
+                 timeout: float = 20.0, use_cache: bool = True):
+        if mode not in ("race", "fuse"):
+            raise ValueError(f"不支持的搜索模式: {mode}")
+        self.providers = [provider.lower() for provider in providers]
+        self.mode = mode
+        self.stagger = stagger
+        self.timeout = timeout
+        self.use_cache = use_cache
+        self.stats = ProviderStats()
+
+    async def search_provider(self, provider: str, query: str, max_results: int) -> list[dict]:
+        """
+        查询单个服务商并统一结果格式，记录延迟（缓存命中不计入）
+
+        Returns:
+            list[dict]: 统一格式的结果
+        """
+        start = time.perf_counter()
+        try:
+            client = get_search_client(provider)
+            upstream = get_upstream(provider)
+            fetch = lambda: upstream.call(client.search, query, max_results=max_results)
+            if self.use_cache:
+                results, from_cache = await get_search_cache().get_or_fetch(provider, query, max_results, fetch)
+            else:
+                results, from_cache = await fetch(), False
+        except asyncio.CancelledError:
+            self.stats.record_cancelled(provider, time.perf_counter() - start)
+            raise
+        except CircuitOpenError:
+            # 熔断中的服务商没有发出请求，不计入延迟统计
+            raise
+        except Exception:
+            self.stats.record(provider, time.perf_counter() - start, ok=False)
+            raise
+        if not from_cache:
+            self.stats.record(provider, time.perf_counter() - start, ok=bool(results))
+        return normalize_results(results, provider)
+
+    async def race(self, query: str, max_results: int = 5) -> list[dict]:
+        """
+        竞速：先返回非空结果的服务商胜出，其余请求取消
+
+        Returns:
+            list[dict]: 胜出服务商的结果，全部失败或为空时返回空列表
+        """
+        pending_providers = self.stats.order(self.providers)
+        tasks = {}
+        errors = []
+        try:
+            while pending_providers or tasks:
+                if pending_providers:
+                    provider = pending_providers.pop(0)
+                    tasks[asyncio.create_task(self.search_provider(provider, query, max_results))] = provider
+                # 还有服务商没发起时，最多等stagger秒就加入下一个
+                timeout = self.stagger if pending_providers else None
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    provider = tasks.pop(task)
+                    # 被取消的任务调用exception()会抛出CancelledError，先单独判断
+                    if task.cancelled():
+                        errors.append(f"{provider}: 已取消")
+                        continue
+                    if task.exception() is not None:
+                        errors.append(f"{provider}: {task.exception()}")
+                        continue
+                    results = task.result()
+                    if results:
+                        logger.debug("搜索竞速胜出: %s", provider)
+                        return results
+            if errors:
+                logger.warning("所有搜索服务商都失败: %s", errors)
+            return []
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def fuse(self, query: str, max_results: int = 5, on_results=None) -> list[dict]:
+        """
+        融合：同时查询所有服务商，按URL去重后用RRF重新排序
+
+        Args:
+            on_results: 每个服务商返回非空结果时立即调用的异步回调，参数为该服务商的结果，
+                        调用方可以不等最慢的服务商就开始处理
+
+        Returns:
+            list[dict]: 融合后的结果
+        """
+        tasks = {asyncio.create_task(self.search_provider(provider, query, max_results)): provider
+                 for provider in self.providers}
+        results_by_provider = {}
+        end_time = time.monotonic() + self.timeout
+        try:
+            while tasks:
+                done, _ = await asyncio.wait(tasks, timeout=end_time - time.monotonic(),
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break
+                for task in done:
+                    provider = tasks.pop(task)
+                    if task.cancelled():
+                        logger.warning("搜索服务商 %s 的请求被取消", provider)
+                        continue
+                    if task.exception() is not None:
+                        logger.warning("搜索服务商 %s 失败: %s", provider, task.exception())
+                        continue
+                    results_by_provider[provider] = task.result()
+                    if on_results is not None and task.result():
+                        await on_results(task.result())
+        finally:
+            for task in tasks:
+                task.cancel()
+        # 按配置的服务商顺序融合，得分相同时的先后与服务商返回的快慢无关
+        result_lists = [results_by_provider[provider] for provider in self.providers if provider in results_by_provider]
+        return fuse_results(result_lists, max_results)
+
+    async def search(self, query: str, max_results: int = 5, on_results=None) -> list[dict]:
+        """
+        按配置的模式搜索
+
+        Args:
+            query: 搜索查询
+            max_results: 最大结果数
+            on_results: 拿到结果时立即调用的异步回调；fuse模式下每个服务商返回时各调用一次，
+                        其他模式下用最终结果调用一次
+
+        Returns:
+            list[dict]: 统一格式的搜索结果
+        """
+        if self.mode == "fuse" and len(self.providers) > 1:
+            return await self.fuse(query, max_results, on_results)
+        if len(self.providers) == 1:
+            results = await self.search_provider(self.providers[0], query, max_results)
+        else:
+            results = await self.race(query, max_results)
+        if on_results is not None and results:
+            await on_results(results)
+        return results
+
+
+_engine = None
+
+
+def get_search_engine() -> SearchEngine:
+    """
+    获取进程内共享的多服务商搜索，首次调用时按环境变量创建
+
+    环境变量:
+        SEARCH_PROVIDERS: 逗号分隔的服务商列表，默认只用 "tavily"；写多个时才竞速或融合
+        SEARCH_MODE: race 或 fuse，默认race
+        SEARCH_STAGGER: race模式下加入下一个服务商的间隔秒数，默认1
+
+    Returns:
+        SearchEngine: 共享的多服务商搜索
+    """
+    global _engine
+    if _engine is None:
+        providers = [p.strip() for p in os.getenv('SEARCH_PROVIDERS', 'tavily').split(",") if p.strip()]
+        _engine = SearchEngine(
+            providers=providers,
+            mode=os.getenv('SEARCH_MODE', 'race'),
+            stagger=float(os.getenv('SEARCH_STAGGER', '1')),
+        )
+    return _engine
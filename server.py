@@ -0,0 +1,435 @@
+"""
+WebAgent的HTTP服务（ASGI）
+
+把 学习记录/Langgraph学习6 的图通过HTTP暴露出来，回答以Server-Sent Events流式返回：
+    POST /chat     请求体 {"question": "...", "thread_id": "可选，同一个thread_id可以多轮追问"}
+    GET  /healthz  服务状态和并发统计
+    GET  /metrics  Prometheus格式的指标
+
+1. 全局并发上限 + 有界等待队列：队列满时立即返回429，不无限堆积请求
+2. 每个客户端的并发上限（按X-Client-Id请求头区分，没有时按IP）
+3. 客户端断开连接时取消对应的图执行
+4. LLM客户端、浏览器池、搜索客户端、网页存储都是进程内共享的，不按请求创建
+5. 关闭时先拒绝新请求（503），等在途请求和后台爬取完成，再释放共享资源
+
+运行：uvicorn server:app --host 0.0.0.0 --port 8000
+"""
+
+import os
+import glob
+import json
+import uuid
+import asyncio
+import importlib.util
+from collections import Counter
+from contextlib import asynccontextmanager, AsyncExitStack
+
+from crawl_tool import drain_page_streams
+from crawler_pool import crawler_pool_lifespan
+from crawl_scheduler import close_crawl_scheduler
+from page_store import close_page_store
+from local_index import close_local_index
+from web_search import close_search_clients
+from session_memory import open_checkpointer
+from streaming import stream_answer, to_sse
+from resilience import breaker_states
+from instrumentation import render_metrics, observe_queue_wait, shutdown_tracing
+from structured_logging import get_logger
+
+logger = get_logger("server")
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 同时执行的图会话数
+SERVER_MAX_CONCURRENCY = int(os.getenv('SERVER_MAX_CONCURRENCY', '8'))
+# 等待执行的请求数上限，超过时返回429
+SERVER_MAX_QUEUE = int(os.getenv('SERVER_MAX_QUEUE', '32'))
+# 单个客户端同时执行和排队的请求数上限
+SERVER_PER_CLIENT = int(os.getenv('SERVER_PER_CLIENT', '2'))
+# 请求最长排队秒数，超时返回503
+SERVER_QUEUE_TIMEOUT = float(os.getenv('SERVER_QUEUE_TIMEOUT', '30'))
+# 关闭时等待在途请求和后台爬取完成的最长秒数
+SERVER_DRAIN_TIMEOUT = float(os.getenv('SERVER_DRAIN_TIMEOUT', '30'))
+# 请求体大小上限（字节）
+SERVER_MAX_BODY = int(os.getenv('SERVER_MAX_BODY', '65536'))
+# 启动时是否预先启动浏览器池里的浏览器
+SERVER_WARMUP = os.getenv('SERVER_WARMUP', '1') == '1'
+
+
+class RejectedError(Exception):
+    """
+    请求未被接纳
+
+    Args:
+        status: HTTP状态码（429或503）
+        reason: 原因
+        retry_after: 建议客户端多少秒后重试
+    """
+
+    def __init__(self, status: int, reason: str, retry_after: int = 1):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    请求准入控制：全局并发上限、有界等待队列、单客户端并发上限，以及关闭时的排空
+
+    Args:
+        max_concurrency: 同时执行的请求数
+        max_queue: 等待执行的请求数上限
+        per_client: 单个客户端同时执行和排队的请求数上限
+        queue_timeout: 最长排队秒数
+    """
+
+    def __init__(self, max_concurrency: int = 8, max_queue: int = 32, per_client: int = 2, queue_timeout: float = 30):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.per_client = per_client
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.queued = 0
+        self.draining = False
+        self._clients = Counter()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self.stats = {
+            "accepted": 0,
+            "completed": 0,
+            "rejected_queue_full": 0,
+            "rejected_per_client": 0,
+            "rejected_draining": 0,
+            "queue_timeouts": 0,
+        }
+
+    @asynccontextmanager
+    async def admit(self, client: str):
+        """
+        申请执行名额，没有空闲名额时排队
+
+        Args:
+            client: 客户端标识
+
+        Raises:
+            RejectedError: 服务正在关闭、队列已满、客户端超出并发上限或排队超时
+        """
+        if self.draining:
+            self.stats["rejected_draining"] += 1
+            raise RejectedError(503, "服务正在关闭", retry_after=5)
+        if self._clients[client] >= self.per_client:
+            self.stats["rejected_per_client"] += 1
+            raise RejectedError(429, "该客户端的并发请求过多")
+        # 执行中和排队中的请求总数有上限，超出时立即拒绝，不让请求无限堆积
+        if self.active + self.queued >= self.max_concurrency + self.max_queue:
+            self.stats["rejected_queue_full"] += 1
+            raise RejectedError(429, "服务繁忙，等待队列已满")
+
+        self._clients[client] += 1
+        self.queued += 1
+        self._idle.clear()
+        wait_start = asyncio.get_running_loop().time()
+        try:
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.stats["queue_timeouts"] += 1
+                raise RejectedError(503, "排队超时")
+            finally:
+                self.queued -= 1
+                observe_queue_wait("server", asyncio.get_running_loop().time() - wait_start)
+            self.active += 1
+            self.stats["accepted"] += 1
+            try:
+                yield
+            finally:
+                self.active -= 1
+                self.stats["completed"] += 1
+                self._semaphore.release()
+        finally:
+            self._clients[client] -= 1
+            if self._clients[client] <= 0:
+                del self._clients[client]
+            if self.active == 0 and self.queued == 0:
+                self._idle.set()
+
+    async def drain(self, timeout: float = None) -> bool:
+        """
+        停止接纳新请求，等待在途和排队的请求完成
+
+        Args:
+            timeout: 最长等待秒数，None表示一直等
+
+        Returns:
+            bool: 是否在超时前全部完成
+        """
+        self.draining = True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "active": self.active,
+            "queued": self.queued,
+            "clients": len(self._clients),
+            "draining": self.draining,
+        }
+
+
+def load_graph_module(number: int = 6):
+    """
+    加载 学习记录/Langgraph学习{number}：*.py（文件名含中文和全角冒号，不能直接import）
+
+    Args:
+        number: 学习记录编号
+
+    Returns:
+        module: 加载后的模块
+    """
+    paths = glob.glob(os.path.join(ROOT_DIR, "学习记录", f"Langgraph学习{number}：*.py"))
+    if not paths:
+        raise FileNotFoundError(f"找不到学习记录{number}")
+    spec = importlib.util.spec_from_file_location(f"langgraph_study_{number}", paths[0])
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class WebAgentApp:
+    """
+    WebAgent的ASGI应用
+
+    Args:
+        graph_number: 加载哪个学习记录里的图
+    """
+
+    def __init__(self, graph_number: int = 6):
+        self.graph_number = graph_number
+        self.module = None
+        self.graph = None  # 带checkpointer的图，请求带thread_id时使用
+        self.stateless_graph = None  # 不保存会话状态的图
+        self.admission = None
+        self._resources = None
+
+    # ---------- 生命周期 ----------
+
+    async def startup(self):
+        """加载图，打开checkpointer，预热浏览器池"""
+        self.admission = AdmissionController(
+            max_concurrency=SERVER_MAX_CONCURRENCY,
+            max_queue=SERVER_MAX_QUEUE,
+            per_client=SERVER_PER_CLIENT,
+            queue_timeout=SERVER_QUEUE_TIMEOUT,
+        )
+        self.module = load_graph_module(self.graph_number)
+        self._resources = AsyncExitStack()
+        checkpointer = await self._resources.enter_async_context(open_checkpointer())
+        self.graph = self.module.compile_graph(checkpointer)
+        self.stateless_graph = self.module.graph
+        await self._resources.enter_async_context(crawler_pool_lifespan(warmup=SERVER_WARMUP))
+        logger.info("已启动，并发上限 %d，队列上限 %d", SERVER_MAX_CONCURRENCY, SERVER_MAX_QUEUE)
+
+    async def shutdown(self):
+        """拒绝新请求，等在途请求和后台爬取完成后释放共享资源"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + SERVER_DRAIN_TIMEOUT
+        if self.admission is not None:
+            drained = await self.admission.drain(SERVER_DRAIN_TIMEOUT)
+            if not drained:
+                logger.warning("排空超时，仍有 %d 个请求在执行", self.admission.active)
+        cancelled = await drain_page_streams(max(0.0, deadline - loop.time()))
+        if cancelled:
+            logger.warning("取消了 %d 个未完成的后台爬取", cancelled)
+        try:
+            if self._resources is not None:
+                await self._resources.aclose()
+        finally:
+            await close_crawl_scheduler()
+            await close_search_clients()
+            await close_page_store()
+            await close_local_index()
+            shutdown_tracing()
+        logger.info("已关闭")
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await self.startup()
+                except Exception as e:
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    # ---------- 请求处理 ----------
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        method, path = scope["method"], scope["path"]
+        if path == "/chat" and method == "POST":
+            await self._chat(scope, receive, send)
+        elif path == "/healthz" and method == "GET":
+            status = "draining" if self.admission and self.admission.draining else "ok"
+            stats = self.admission.get_stats() if self.admission else {}
+            await send_json(send, 200 if status == "ok" else 503,
+                            {"status": status, "admission": stats, "upstreams": breaker_states()})
+        elif path == "/metrics" and method == "GET":
+            body = render_metrics().encode("utf-8")
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/plain; version=0.0.4; charset=utf-8"),
+                    (b"content-length", str(len(body)).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+        else:
+            await send_json(send, 404, {"error": "not found"})
+
+    def _client_id(self, scope) -> str:
+        for name, value in scope.get("headers", []):
+            if name == b"x-client-id":
+                return value.decode("latin-1")
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    async def _chat(self, scope, receive, send):
+        try:
+            payload = json.loads(await read_body(receive, SERVER_MAX_BODY) or b"{}")
+        except ValueError as e:
+            await send_json(send, 400, {"error": f"请求体不是合法的JSON: {e}"})
+            return
+        except OverflowError:
+            await send_json(send, 413, {"error": "请求体过大"})
+            return
+        question = payload.get("question") if isinstance(payload, dict) else None
+        if not isinstance(question, str) or not question.strip():
+            await send_json(send, 400, {"error": "缺少question"})
+            return
+        thread_id = payload.get("thread_id")
+
+        try:
+            async with self.admission.admit(self._client_id(scope)):
+                state, config, graph = await self._prepare(question, thread_id)
+                await self._stream(graph, state, config, receive, send)
+        except RejectedError as e:
+            await send_json(send, e.status, {"error": e.reason}, headers=[(b"retry-after", str(e.retry_after).encode())])
+
+    async def _prepare(self, question: str, thread_id: str = None):
+        """构造输入状态；有thread_id且已有历史时只传入新问题"""
+        human_message = self.module.HumanMessage(content=question)
+        if not thread_id:
+            state = {"messages": [self.module.build_system_message(), human_message]}
+            return state, {"configurable": {"thread_id": uuid.uuid4().hex}}, self.stateless_graph
+        config = {"configurable": {"thread_id": str(thread_id)}}
+        if self.graph.checkpointer is None:
+            return {"messages": [self.module.build_system_message(), human_message]}, config, self.stateless_graph
+        snapshot = await self.graph.aget_state(config)
+        if snapshot.values.get("messages"):
+            state = {"messages": [human_message]}
+        else:
+            state = {"messages": [self.module.build_system_message(), human_message]}
+        return state, config, self.graph
+
+    async def _stream(self, graph, state: dict, config: dict, receive, send):
+        """以SSE流式返回事件；客户端断开时取消图的执行"""
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream; charset=utf-8"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no"),
+            ],
+        })
+
+        async def pump():
+            try:
+                async for event in stream_answer(graph, state, config=config, answer_nodes=self.module.ANSWER_NODES):
+                    await send({"type": "http.response.body", "body": to_sse(event).encode("utf-8"), "more_body": True})
+            except Exception as e:
+                logger.exception("图执行出错: %s", e)
+                error = to_sse({"event": "error", "message": str(e)})
+                await send({"type": "http.response.body", "body": error.encode("utf-8"), "more_body": True})
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+        pump_task = asyncio.create_task(pump())
+        disconnect_task = asyncio.create_task(wait_disconnect(receive))
+        try:
+            await asyncio.wait({pump_task, disconnect_task}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in (pump_task, disconnect_task):
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(pump_task, disconnect_task, return_exceptions=True)
+
+
+async def read_body(receive, limit: int) -> bytes:
+    """
+    读取请求体
+
+    Raises:
+        OverflowError: 超过limit字节
+    """
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return body
+        body += message.get("body", b"")
+        if len(body) > limit:
+            raise OverflowError("request body too large")
+        if not message.get("more_body"):
+            return body
+
+
+async def wait_disconnect(receive):
+    """等到客户端断开连接"""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def send_json(send, status: int, payload: dict, headers: list = None):
+    """返回JSON响应"""
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json; charset=utf-8"),
+            (b"content-length", str(len(body)).encode()),
+            *(headers or []),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+app = WebAgentApp()
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(
+        app,
+        host=os.getenv('SERVER_HOST', '127.0.0.1'),
+        port=int(os.getenv('SERVER_PORT', '8000')),
+        timeout_graceful_shutdown=int(SERVER_DRAIN_TIMEOUT),
+    )
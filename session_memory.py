@@ -0,0 +1,254 @@
+"""
+会话记忆：可插拔的checkpointer，以及消息历史的裁剪策略
+
+1. open_checkpointer() 按配置返回内存或SQLite的checkpointer，同一个thread_id的多轮对话可以续接；
+   内存checkpointer的会话数和空闲时间有上限，长时间运行的服务不会无限保留每个thread_id
+2. conversation_view() 给对话模型的精简视图：历史轮次只保留用户问题和最终回答，
+   避免把上一轮的工具消息、网页原文原样发给模型
+3. crawled_pages() 找出状态里已经抓取过的网页，追问时不用重新抓取
+4. compact_messages() 按策略删除旧消息、去掉只在本轮有用的工具消息artifact，长会话的状态大小保持有界
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, ToolMessage, RemoveMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+
+class BoundedMemorySaver(MemorySaver):
+    """
+    会话数和空闲时间有上限的内存checkpointer
+
+    每次写入checkpoint时记录会话的最近写入时间；会话数超过max_threads时淘汰最久没有写入的会话，
+    空闲超过ttl秒的会话在之后的写入时淘汰
+
+    Args:
+        max_threads: 最多保留的会话数
+        ttl: 会话最长空闲秒数，0表示不按时间淘汰
+    """
+
+    def __init__(self, max_threads: int = 1000, ttl: float = 86400, **kwargs):
+        super().__init__(**kwargs)
+        self.max_threads = max_threads
+        self.ttl = ttl
+        self._touched = OrderedDict()  # thread_id -> 最近写入时间，最久没有写入的在前
+        self._touch_lock = threading.Lock()
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        result = super().put(config, checkpoint, metadata, new_versions)
+        self._touch(config["configurable"]["thread_id"])
+        return result
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        result = await super().aput(config, checkpoint, metadata, new_versions)
+        self._touch(config["configurable"]["thread_id"])
+        return result
+
+    def _touch(self, thread_id: str):
+        now = time.monotonic()
+        with self._touch_lock:
+            self._touched[thread_id] = now
+            self._touched.move_to_end(thread_id)
+            expired = []
+            for oldest, touched_at in self._touched.items():
+                if oldest == thread_id:
+                    break
+                if len(self._touched) - len(expired) > self.max_threads or (self.ttl and now - touched_at > self.ttl):
+                    expired.append(oldest)
+                else:
+                    break
+            for oldest in expired:
+                del self._touched[oldest]
+        for oldest in expired:
+            self._drop_thread(oldest)
+
+    def _drop_thread(self, thread_id: str):
+        """删除一个会话的所有checkpoint和中间写入"""
+        if hasattr(MemorySaver, "delete_thread"):
+            self.delete_thread(thread_id)
+            return
+        # 旧版本的MemorySaver没有delete_thread，直接清理内部存储
+        self.storage.pop(thread_id, None)
+        for key in [key for key in self.writes if key[0] == thread_id]:
+            del self.writes[key]
+        blobs = getattr(self, "blobs", None)
+        if blobs is not None:
+            for key in [key for key in blobs if key[0] == thread_id]:
+                del blobs[key]
+
+
+@asynccontextmanager
+async def open_checkpointer(kind: str = None, path: str = None):
+    """
+    打开checkpointer
+
+    Args:
+        kind: "memory"、"sqlite" 或 "none"，默认读取环境变量CHECKPOINTER，未设置时为memory；
+              memory的会话数上限和空闲时间见CHECKPOINT_MAX_THREADS、CHECKPOINT_THREAD_TTL
+        path: SQLite文件路径，默认读取环境变量CHECKPOINT_DB，未设置时为 checkpoints.db
+
+    Yields:
+        BaseCheckpointSaver | None: checkpointer，kind为none时为None
+    """
+    kind = (kind or os.getenv('CHECKPOINTER', 'memory')).lower()
+    if kind == "none":
+        yield None
+    elif kind == "memory":
+        yield BoundedMemorySaver(
+            max_threads=int(os.getenv('CHECKPOINT_MAX_THREADS', '1000')),
+            ttl=float(os.getenv('CHECKPOINT_THREAD_TTL', '86400')),
+        )
+    elif kind == "sqlite":
+        # 需要安装 langgraph-checkpoint-sqlite
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+        async with AsyncSqliteSaver.from_conn_string(path or os.getenv('CHECKPOINT_DB', 'checkpoints.db')) as saver:
+            yield saver
+    else:
+        raise ValueError(f"不支持的checkpointer类型: {kind}")
+
+
+def split_turns(messages: list) -> tuple[list, list[list]]:
+    """
+    把消息按轮次切分，每一轮从一条用户消息开始
+
+    Args:
+        messages: 消息列表
+
+    Returns:
+        tuple: (第一条用户消息之前的消息，如系统消息；每一轮的消息列表)
+    """
+    head, turns = [], []
+    for msg in messages:
+        if isinstance(msg, HumanMessage):
+            turns.append([msg])
+        elif turns:
+            turns[-1].append(msg)
+        else:
+            head.append(msg)
+    return head, turns
+
+
+def _final_answer(turn: list):
+    """一轮里最后一条不带工具调用的AI回答"""
+    for msg in reversed(turn):
+        if isinstance(msg, AIMessage) and not msg.tool_calls and msg.content:
+            return msg
+    return None
+
+
+def conversation_view(messages: list) -> list:
+    """
+    给对话模型的精简视图：系统消息 + 历史轮次的问题和最终回答 + 当前轮次的完整消息
+
+    Args:
+        messages: 状态里的完整消息列表
+
+    Returns:
+        list: 精简后的消息列表
+    """
+    head, turns = split_turns(messages)
+    view = [msg for msg in head if isinstance(msg, SystemMessage)]
+    for turn in turns[:-1]:
+        view.append(turn[0])
+        answer = _final_answer(turn)
+        if answer is not None:
+            view.append(answer)
+    if turns:
+        view.extend(turns[-1])
+    return view
+
+
+def crawled_pages(messages: list) -> dict:
+    """
+    找出状态里已经抓取成功的网页
+
+    Args:
+        messages: 状态里的消息列表
+
+    Returns:
+        dict: url -> 网页markdown，同一URL以最近一次为准
+    """
+    pages = {}
+    for msg in messages:
+        artifact = getattr(msg, 'artifact', None)
+        if isinstance(msg, ToolMessage) and isinstance(artifact, dict) and artifact.get("url") and artifact.get("success"):
+            pages[artifact["url"]] = msg.content
+    return pages
+
+
+# 工具消息artifact里追问时还要用的字段（crawled_pages按它们找出抓取过的网页）；
+# 其余字段（搜索摘要、本地索引片段、抓取结果流id等）只在本轮有用
+_KEPT_ARTIFACT_KEYS = ("url", "success")
+
+
+def _stripped_artifact(artifact):
+    """去掉只在本轮有用的字段，没有需要去掉的字段时返回原artifact"""
+    if not isinstance(artifact, dict) or set(artifact) <= set(_KEPT_ARTIFACT_KEYS):
+        return artifact
+    kept = {key: artifact[key] for key in _KEPT_ARTIFACT_KEYS if key in artifact}
+    return kept or None
+
+
+def message_size(msg) -> int:
+    """消息在checkpoint里大致占用的字符数：内容加artifact"""
+    size = len(str(msg.content))
+    artifact = getattr(msg, 'artifact', None)
+    if artifact is not None:
+        size += len(str(artifact))
+    return size
+
+
+def compact_messages(messages: list, keep_turns: int = 2, max_turns: int = 20, max_page_chars: int = 200_000) -> list:
+    """
+    消息历史的裁剪策略，返回需要删除和替换的消息
+
+    - 超过max_turns的最早轮次整轮删除
+    - 最近keep_turns轮之外的轮次，只保留用户问题和最终回答，工具消息和网页原文删除
+    - 保留下来的工具消息去掉只在本轮有用的artifact（搜索摘要、本地索引片段、抓取结果流id），
+      换成同id的新消息；每轮结束时调用，这些artifact已经用完
+    - 保留下来的工具消息（内容加artifact）总字数超过max_page_chars时，从最早的开始删除
+
+    Args:
+        messages: 状态里的消息列表
+        keep_turns: 保留完整工具结果的最近轮数
+        max_turns: 最多保留的轮数
+        max_page_chars: 保留的网页原文总字数上限
+
+    Returns:
+        list: 交给add_messages reducer执行的操作，RemoveMessage为删除，同id的ToolMessage为替换
+    """
+    _, turns = split_turns(messages)
+    remove = []
+    if len(turns) > max_turns:
+        for turn in turns[:len(turns) - max_turns]:
+            remove.extend(turn)
+        turns = turns[len(turns) - max_turns:]
+
+    for turn in turns[:-keep_turns] if keep_turns else turns:
+        answer = _final_answer(turn)
+        remove.extend(msg for msg in turn[1:] if msg is not answer)
+
+    removed_ids = {msg.id for msg in remove}
+    page_messages = []
+    replaced = {}
+    for turn in turns:
+        for msg in turn:
+            if not isinstance(msg, ToolMessage) or msg.id in removed_ids:
+                continue
+            artifact = _stripped_artifact(msg.artifact)
+            if artifact is not msg.artifact and msg.id:
+                msg = msg.model_copy(update={"artifact": artifact})
+                replaced[msg.id] = msg
+            page_messages.append(msg)
+    total = sum(message_size(msg) for msg in page_messages)
+    for msg in page_messages:
+        if total <= max_page_chars:
+            break
+        remove.append(msg)
+        replaced.pop(msg.id, None)
+        total -= message_size(msg)
+
+    return [RemoveMessage(id=msg.id) for msg in remove if msg.id] + list(replaced.values())
@@ -0,0 +1,172 @@
+"""
+搜索摘要快速通道：摘要已经能回答问题时不再抓取网页
+
+搜索服务商返回的结果里本来就带有content摘要，原来搜索节点只保留URL，每个问题都要等浏览器抓取。
+这里在搜索之后判断摘要是否覆盖了用户的问题：
+1. 本地打分：去掉疑问词后，问题里的词（中文按二元组）有多少出现在摘要里；摘要总字数太少、
+   或者问题在要详细内容（教程、步骤、对比……）时直接判为不够
+2. 分数不低于SNIPPET_MIN_SCORE时走快速通道；低于SNIPPET_JUDGE_MIN_SCORE时抓取网页；
+   介于两者之间时，配置了小模型就让它判断，没有配置就抓取网页
+3. 每次判断的结果计入指标snippet_routes_total；走快速通道时按最近抓取阶段耗时的滑动平均
+   估算节省的时间，计入snippet_saved_seconds_total
+
+环境变量:
+    SNIPPET_MIN_SCORE: 覆盖率不低于该值时不抓取网页，默认0.8
+    SNIPPET_JUDGE_MIN_SCORE: 覆盖率介于该值和SNIPPET_MIN_SCORE之间时交给小模型判断，默认0.5
+    SNIPPET_MIN_CHARS: 摘要总字数少于该值时抓取网页，默认200
+"""
+
+import os
+import re
+
+from context_packer import tokenize
+from instrumentation import get_metrics
+from streaming import astream_message
+from structured_logging import get_logger
+
+logger = get_logger("snippet_router")
+
+# 疑问词、代词等不表达问题内容的词，打分前从问题里去掉
+_QUESTION_WORDS = re.compile(
+    r"是什么|什么|怎么样|怎么|如何|哪些|哪个|哪里|为什么|多少|请问|一下|吗|呢|吧|"
+    r"它们|它|他们|他|她|这个|那个|是|的|了|？|\?|"
+    r"\b(what|which|who|why|how|is|are|was|does|do|the|a|an|of|to|in)\b",
+    re.I,
+)
+# 问题在要详细内容时，摘要一般不够用
+_DETAIL_HINTS = re.compile(
+    r"详细|教程|步骤|代码|示例|例子|对比|比较|区别|列出|列举|全部|所有|原理|源码|"
+    r"tutorial|step|example|code|compare|difference|list all",
+    re.I,
+)
+
+JUDGE_SYSTEM_PROMPT = """
+        ## 你是一个判断信息是否充分的助手。下面是用户的问题和搜索引擎返回的摘要。
+        - 如果只根据这些摘要就能准确、完整地回答问题，只回复：是
+        - 否则只回复：否
+    """
+
+
+def question_terms(question: str) -> set[str]:
+    """去掉疑问词后问题里的词"""
+    return set(tokenize(_QUESTION_WORDS.sub(" ", question)))
+
+
+def snippet_coverage(question: str, snippets: list[dict]) -> float:
+    """
+    问题里的词有多少出现在摘要（含标题）里
+
+    Args:
+        question: 用户问题
+        snippets: 搜索结果，包含title和content
+
+    Returns:
+        float: 0到1之间的覆盖率，问题去掉疑问词后没有剩下任何词时为0
+    """
+    terms = question_terms(question)
+    if not terms:
+        return 0.0
+    text = " ".join(f"{item.get('title', '')} {item.get('content', '')}" for item in snippets)
+    return len(terms & set(tokenize(text))) / len(terms)
+
+
+class SnippetRouter:
+    """
+    判断搜索摘要是否足够回答问题
+
+    Args:
+        min_score: 覆盖率不低于该值时直接使用摘要
+        judge_min_score: 覆盖率不低于该值（且低于min_score）时交给小模型判断
+        min_chars: 摘要总字数下限
+        alpha: 抓取阶段耗时滑动平均的权重
+    """
+
+    def __init__(self, min_score: float = 0.8, judge_min_score: float = 0.5, min_chars: int = 200,
+                 alpha: float = 0.3):
+        self.min_score = min_score
+        self.judge_min_score = judge_min_score
+        self.min_chars = min_chars
+        self.alpha = alpha
+        self.crawl_seconds = None
+
+    def record_crawl(self, seconds: float):
+        """记录一次抓取阶段（等待网页）的耗时，用于估算快速通道节省的时间"""
+        if self.crawl_seconds is None:
+            self.crawl_seconds = seconds
+        else:
+            self.crawl_seconds += self.alpha * (seconds - self.crawl_seconds)
+
+    def score(self, question: str, snippets: list[dict]) -> tuple[float, str]:
+        """
+        本地打分
+
+        Returns:
+            tuple[float, str]: 覆盖率和原因；摘要太少或问题要详细内容时覆盖率为0
+        """
+        if sum(len(item.get("content", "")) for item in snippets) < self.min_chars:
+            return 0.0, "too_short"
+        if _DETAIL_HINTS.search(question):
+            return 0.0, "needs_detail"
+        return snippet_coverage(question, snippets), "coverage"
+
+    async def judge(self, model, question: str, snippets: list[dict]) -> bool:
+        """让小模型判断摘要是否足够，调用失败时按不够处理"""
+        text = "\n\n".join(f"[{item.get('title', '')}]({item.get('url', '')})\n{item.get('content', '')}" for item in snippets)
+        try:
+            response = await astream_message(model, [
+                {"role": "system", "content": JUDGE_SYSTEM_PROMPT},
+                {"role": "user", "content": f"用户问题：{question}\n\n搜索摘要：\n{text}"},
+            ], stream=False)
+        except Exception as e:
+            logger.warning("摘要判断模型调用失败: %s", e)
+            return False
+        answer = str(response.content).strip()
+        return answer.startswith("是")
+
+    async def sufficient(self, question: str, snippets: list[dict], judge_model=None) -> bool:
+        """
+        判断摘要是否足够回答问题，并记录指标
+
+        Args:
+            question: 用户问题
+            snippets: 搜索结果
+            judge_model: 分数介于两个阈值之间时用来判断的小模型，None表示不用模型
+
+        Returns:
+            bool: True表示不需要抓取网页
+        """
+        score, reason = self.score(question, snippets)
+        decided_by = "heuristic"
+        if score >= self.min_score:
+            ok = True
+        elif score >= self.judge_min_score and judge_model is not None:
+            decided_by = "judge"
+            ok = await self.judge(judge_model, question, snippets)
+        else:
+            ok = False
+        metrics = get_metrics()
+        metrics.snippet_routes.inc(route="snippets" if ok else "crawl", decided_by=decided_by)
+        if ok and self.crawl_seconds is not None:
+            metrics.snippet_saved_seconds.inc(self.crawl_seconds)
+        logger.info("摘要覆盖率 %.2f（%s），%s", score, reason, "跳过抓取" if ok else "抓取网页")
+        return ok
+
+
+_router = None
+
+
+def get_snippet_router() -> SnippetRouter:
+    """
+    获取进程内共享的摘要判断，首次调用时按环境变量创建
+
+    Returns:
+        SnippetRouter: 共享的摘要判断
+    """
+    global _router
+    if _router is None:
+        _router = SnippetRouter(
+            min_score=float(os.getenv('SNIPPET_MIN_SCORE', '0.8')),
+            judge_min_score=float(os.getenv('SNIPPET_JUDGE_MIN_SCORE', '0.5')),
+            min_chars=int(os.getenv('SNIPPET_MIN_CHARS', '200')),
+        )
+    return _router
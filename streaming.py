@@ -0,0 +1,161 @@
+"""
+流式输出：模型token边生成边转发给调用方
+
+1. astream_message() 在节点里用astream调用模型，边收边拼接chunk：
+   文本token通过回调实时产生on_chat_model_stream事件，工具调用的参数片段拼接成完整的tool_calls
+2. stream_answer() 把图的astream_events转成统一的事件流（异步迭代器），
+   只转发回答token、工具调用和抓取进度，调用方拿到第一个token就能开始展示
+3. to_sse() 把事件编码成Server-Sent Events格式，供HTTP服务直接写给客户端
+4. 模型调用经过resilience的限流、重试和熔断，主模型不可用时切换到备选模型
+"""
+
+import os
+import json
+import time
+
+from instrumentation import instrument_events
+from resilience import get_upstream, is_retryable, CircuitOpenError
+from structured_logging import get_logger
+
+logger = get_logger("streaming")
+
+# 所有模型共用同一个接口的限流（RATE_LIMIT_SILICONFLOW），熔断按模型区分
+LLM_RATE_KEY = os.getenv('LLM_RATE_KEY', 'siliconflow')
+# 学习6的图里产生回答的节点：对话模型直接回答、单次总结、map-reduce总结
+ANSWER_NODES = ("chat_bot", "summary_bot", "map_reduce_summary")
+
+
+class PartialStreamError(Exception):
+    """已经有token转发给调用方后流式输出中断，重试或切换模型会让调用方收到重复内容，不再重试"""
+
+
+def model_name(model) -> str:
+    """取模型名，bind_tools、with_config之后的模型也能取到"""
+    while hasattr(model, "bound"):
+        model = model.bound
+    return getattr(model, "model_name", None) or type(model).__name__
+
+
+async def _call_model(model, messages: list, stream: bool, **kwargs):
+    """调用一次模型，流式时拼接chunk"""
+    if not stream:
+        return await model.ainvoke(messages, **kwargs)
+    response = None
+    try:
+        async for chunk in model.astream(messages, **kwargs):
+            # AIMessageChunk相加时会合并content，并按index拼接tool_call_chunks里的参数片段
+            response = chunk if response is None else response + chunk
+    except Exception as e:
+        if response is not None and response.content:
+            raise PartialStreamError(f"流式输出中断: {e}") from e
+        raise
+    if response is None:
+        return await model.ainvoke(messages, **kwargs)
+    return response
+
+
+async def astream_message(model, messages: list, stream: bool = True, fallbacks: tuple = (), **kwargs):
+    """
+    流式调用模型并拼接成完整消息
+
+    每个模型的调用都经过限流、重试和熔断；主模型熔断或重试用尽时依次换用fallbacks里的模型
+
+    Args:
+        model: 聊天模型（可以是bind_tools之后的模型）
+        messages: 消息列表
+        stream: False时退回ainvoke一次性返回
+        fallbacks: 备选模型，需要与model绑定相同的工具
+        **kwargs: 传给模型的其他参数
+
+    Returns:
+        AIMessage: 完整的模型回复，tool_calls由各个chunk的参数片段拼接而成
+    """
+    candidates = [model, *fallbacks]
+    for index, candidate in enumerate(candidates):
+        name = model_name(candidate)
+        upstream = get_upstream(f"llm:{name}", limiter_key=LLM_RATE_KEY)
+        try:
+            return await upstream.call(_call_model, candidate, messages, stream, **kwargs)
+        except Exception as e:
+            last = index == len(candidates) - 1
+            if last or not (isinstance(e, CircuitOpenError) or is_retryable(e)):
+                raise
+            logger.warning("模型 %s 不可用（%s），切换到 %s", name, e, model_name(candidates[index + 1]))
+
+
+async def stream_answer(graph, state: dict, config: dict = None,
+                        answer_nodes: tuple = ANSWER_NODES,
+                        skip_tags: tuple = ("map_summary",), graph_name: str = "webagent"):
+    """
+    运行图并以异步迭代器的形式产出事件
+
+    产出的事件都是dict，event字段为事件类型：
+        token: 回答的文本片段，node为产生token的节点
+        tool_call: 模型（或本地预路由）决定调用工具，包含工具名和参数
+        tool_start / tool_end: 工具开始、结束执行
+        crawl_page: 流式抓取时每个网页的抓取结果
+        done: 结束，包含首个token耗时(ttft)、总耗时(elapsed)和token片段数(tokens)
+
+    Args:
+        graph: 编译后的图
+        state: 输入状态
+        config: 运行配置，如 {"configurable": {"thread_id": "1"}}
+        answer_nodes: 转发哪些节点的token和工具调用，应与图里的节点名一致，默认为学习6的节点
+        skip_tags: 带这些标签的模型调用不转发token（如map阶段的中间结果）
+        graph_name: 指标和链路追踪里的图名
+
+    Yields:
+        dict: 事件
+    """
+    start = time.perf_counter()
+    first_token_at = None
+    tokens = 0
+    events = graph.astream_events(state, config=config, version="v2")
+    # 事件流同时交给instrumentation记录节点耗时、token数等指标
+    async for event in instrument_events(events, graph_name=graph_name):
+        event_type = event["event"]
+        node = event.get("metadata", {}).get("langgraph_node")
+        if event_type == "on_chat_model_stream":
+            if node not in answer_nodes or any(tag in skip_tags for tag in event.get("tags", [])):
+                continue
+            content = event["data"]["chunk"].content
+            if not content or not isinstance(content, str):
+                continue
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            tokens += 1
+            yield {"event": "token", "node": node, "content": content}
+        elif event_type == "on_chat_model_end" and node in answer_nodes:
+            output = event["data"].get("output")
+            for tool_call in getattr(output, "tool_calls", None) or []:
+                yield {"event": "tool_call", "node": node, "name": tool_call["name"], "args": tool_call["args"]}
+        elif event_type == "on_tool_start":
+            yield {"event": "tool_start", "name": event["name"], "input": event["data"].get("input")}
+        elif event_type == "on_tool_end":
+            yield {"event": "tool_end", "name": event["name"]}
+        elif event_type == "on_custom_event" and event["name"] == "crawl_page":
+            yield {"event": "crawl_page", **event["data"]}
+        elif event_type == "on_custom_event" and event["name"] == "tool_call":
+            # 本地预路由不经过模型直接生成的工具调用
+            yield {"event": "tool_call", "node": node, **event["data"]}
+    elapsed = time.perf_counter() - start
+    yield {
+        "event": "done",
+        "ttft": first_token_at - start if first_token_at is not None else None,
+        "elapsed": elapsed,
+        "tokens": tokens,
+    }
+
+
+def to_sse(event: dict) -> str:
+    """
+    把事件编码成一条Server-Sent Events消息
+
+    Args:
+        event: stream_answer产出的事件
+
+    Returns:
+        str: 形如 "event: token\\ndata: {...}\\n\\n" 的文本
+    """
+    data = json.dumps(event, ensure_ascii=False, default=str)
+    return f"event: {event['event']}\ndata: {data}\n\n"
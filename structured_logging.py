@@ -0,0 +1,194 @@
+"""
+结构化日志：按级别过滤、异步输出、大对象截断
+
+原来节点里用print输出完整的state、搜索结果和网页列表，state里带着网页原文时，
+每一步都要把整个state格式化成字符串再写stdout。这里改为：
+1. 标准logging按级别过滤：默认INFO，调试细节用DEBUG，关闭时参数完全不会被格式化
+2. preview() / describe_state() 是惰性对象，只有日志真正输出时才截断、格式化
+3. 日志记录先放进队列，由后台线程写出（QueueHandler + QueueListener），不阻塞事件循环：
+   消息参数在调用线程里合并成字符串（preview等惰性对象在这时才截断，之后对象再变化也不影响日志），
+   加时间和级别、转JSON以及写stdout在后台线程
+4. 可选JSON格式输出，extra={"fields": {...}} 里的字段会作为结构化字段输出
+5. 可对DEBUG日志按比例采样
+
+环境变量:
+    LOG_LEVEL: DEBUG / INFO / WARNING / ERROR，默认INFO
+    LOG_FORMAT: text / json，默认text
+    LOG_PREVIEW_CHARS: 大对象截断后保留的字符数，默认200
+    LOG_DEBUG_SAMPLE_RATE: DEBUG日志的采样比例，默认1（全部输出）
+"""
+
+import os
+import json
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+
+LOG_PREVIEW_CHARS = int(os.getenv('LOG_PREVIEW_CHARS', '200'))
+
+_listener = None
+
+
+class _Preview:
+    """惰性截断：只有被格式化时才把对象转成字符串并截断"""
+
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value, limit: int = None):
+        self.value = value
+        self.limit = LOG_PREVIEW_CHARS if limit is None else limit
+
+    def __str__(self):
+        text = self.value if isinstance(self.value, str) else repr(self.value)
+        if len(text) <= self.limit:
+            return text
+        return f"{text[:self.limit]}...(共{len(text)}字符)"
+
+    __repr__ = __str__
+
+
+class _StateSummary:
+    """惰性的state摘要：消息数、各类型消息数、最后一条消息的类型和工具调用数"""
+
+    __slots__ = ("state",)
+
+    def __init__(self, state):
+        self.state = state
+
+    def __str__(self):
+        messages = self.state.get("messages", []) if isinstance(self.state, dict) else []
+        counts = {}
+        for msg in messages:
+            name = type(msg).__name__
+            counts[name] = counts.get(name, 0) + 1
+        if not messages:
+            return "messages=0"
+        last = messages[-1]
+        tool_calls = len(getattr(last, "tool_calls", None) or [])
+        content = getattr(last, "content", "")
+        return (f"messages={len(messages)} {counts} last={type(last).__name__} "
+                f"tool_calls={tool_calls} content={_Preview(content, 80)}")
+
+    __repr__ = __str__
+
+
+def preview(value, limit: int = None) -> _Preview:
+    """
+    大对象的惰性截断，用作日志参数：logger.debug("搜索结果 %s", preview(observation))
+
+    Args:
+        value: 任意对象
+        limit: 保留的字符数，默认LOG_PREVIEW_CHARS
+
+    Returns:
+        _Preview: 格式化时才截断的包装对象
+    """
+    return _Preview(value, limit)
+
+
+def describe_state(state) -> _StateSummary:
+    """
+    图状态的惰性摘要，代替直接输出整个state
+
+    Args:
+        state: 图状态
+
+    Returns:
+        _StateSummary: 格式化时才计算的摘要对象
+    """
+    return _StateSummary(state)
+
+
+class JSONFormatter(logging.Formatter):
+    """每条日志输出为一行JSON"""
+
+    def format(self, record):
+        payload = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        payload.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """文本格式，structured fields附在消息后面"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s [%(name)s] %(message)s", "%H:%M:%S")
+
+    def format(self, record):
+        text = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            text += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return text
+
+
+class _DebugSampler(logging.Filter):
+    """按比例采样DEBUG日志"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or self.rate >= 1 or random.random() < self.rate
+
+
+def setup_logging(level: str = None, fmt: str = None):
+    """
+    配置webagent下所有logger，重复调用时按新参数重新配置
+
+    Args:
+        level: 日志级别，默认读取LOG_LEVEL
+        fmt: text或json，默认读取LOG_FORMAT
+    """
+    global _listener
+    level = (level or os.getenv('LOG_LEVEL', 'INFO')).upper()
+    fmt = (fmt or os.getenv('LOG_FORMAT', 'text')).lower()
+
+    if _listener is not None:
+        _listener.stop()
+    handler = logging.StreamHandler()
+    handler.setFormatter(JSONFormatter() if fmt == "json" else TextFormatter())
+    # 记录先放进队列：QueueHandler在调用线程里合并消息参数，后台线程用handler的格式化器加前缀并写出
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger("webagent")
+    root.handlers.clear()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(_DebugSampler(float(os.getenv('LOG_DEBUG_SAMPLE_RATE', '1'))))
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    root.propagate = False
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    获取webagent下的logger，首次调用时按环境变量完成配置
+
+    Args:
+        name: 模块名，如 "crawl_tool"
+
+    Returns:
+        logging.Logger: logger
+    """
+    if _listener is None:
+        setup_logging()
+    return logging.getLogger(f"webagent.{name}")
+
+
+@atexit.register
+def _stop_listener():
+    # 退出前把队列里剩余的日志写完
+    if _listener is not None:
+        _listener.stop()
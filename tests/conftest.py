@@ -0,0 +1,20 @@
+import importlib.util
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# 与学习记录里的脚本一样，从项目根目录导入模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def web_agent():
+    """学习6的WebAgent脚本（文件名不是合法的模块名，按路径加载），没有安装crawl4ai时跳过"""
+    pytest.importorskip("crawl4ai")
+    path = next((Path(__file__).resolve().parent.parent / "学习记录").glob("Langgraph学习6*.py"))
+    spec = importlib.util.spec_from_file_location("web_agent", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,90 @@
+from context_packer import BM25, estimate_tokens, pack_context, split_chunks, tokenize
+
+
+def _paragraph(word, count=40):
+    return " ".join(f"{word}{i}" for i in range(count))
+
+
+def test_tokenize_cjk_bigrams_and_words():
+    assert tokenize("Python 协程") == ["python", "协程"]
+    assert tokenize("事件循环") == ["事件", "件循", "循环"]
+    assert tokenize("好") == ["好"]
+
+
+def test_split_chunks_merges_short_paragraphs():
+    chunks = split_chunks("first\n\nsecond\n\n\n\nthird", chunk_tokens=300)
+    assert chunks == ["first\n\nsecond\n\nthird"]
+
+
+def test_split_chunks_respects_size():
+    text = "\n\n".join(_paragraph(f"p{i}_", 50) for i in range(6))
+    chunks = split_chunks(text, chunk_tokens=100)
+    assert len(chunks) == 6
+    assert all(estimate_tokens(chunk) <= 100 for chunk in chunks)
+
+
+def test_split_chunks_splits_long_paragraph_by_sentence():
+    paragraph = "".join(f"{_paragraph(f's{i}_', 20)}. " for i in range(10))
+    chunks = split_chunks(paragraph, chunk_tokens=60)
+    assert len(chunks) > 1
+    assert "".join(chunks).replace(" ", "") == paragraph.strip().replace(" ", "")
+
+
+def test_split_chunks_empty():
+    assert split_chunks("") == []
+    assert split_chunks(None) == []
+    assert split_chunks("\n\n  \n\n") == []
+
+
+def test_bm25_prefers_matching_documents():
+    bm25 = BM25([tokenize("asyncio event loop"), tokenize("weather forecast"), tokenize("event")])
+    query = tokenize("asyncio event")
+    scores = [bm25.score(query, i) for i in range(3)]
+    assert scores[0] > scores[2] > scores[1] == 0
+
+
+def test_bm25_empty():
+    bm25 = BM25([])
+    assert bm25.avg_len == 0.0
+
+
+def test_pack_context_respects_budget_and_keeps_order():
+    pages = [
+        {"url": "https://a.com", "markdown": "\n\n".join([_paragraph("noise", 60), "asyncio event loop " + _paragraph("x", 30)])},
+        {"url": "https://b.com", "markdown": "\n\n".join(["asyncio tutorial " + _paragraph("y", 30), _paragraph("filler", 60)])},
+    ]
+    text, stats = pack_context("asyncio event loop", pages, token_budget=110, chunk_tokens=60)
+    assert stats["tokens_out"] <= 110
+    assert stats["selected"] == 2
+    assert stats["chunks"] == 4
+    assert stats["sources"] == ["https://a.com", "https://b.com"]
+    # 按原网页、原顺序输出，每个网页前带来源
+    assert text.index("## 来源: https://a.com") < text.index("asyncio event loop") \
+        < text.index("## 来源: https://b.com") < text.index("asyncio tutorial")
+    assert "noise0" not in text and "filler0" not in text
+
+
+def test_pack_context_skips_chunks_larger_than_budget():
+    pages = [{"url": "https://a.com", "markdown": "\n\n".join([
+        "asyncio " + _paragraph("big", 200),
+        "small asyncio note",
+    ])}]
+    text, stats = pack_context("asyncio", pages, token_budget=50, chunk_tokens=264)
+    assert stats["chunks"] == 2
+    assert stats["selected"] == 1
+    assert "small asyncio note" in text
+    assert "big0" not in text
+
+
+def test_pack_context_empty_pages():
+    text, stats = pack_context("question", [])
+    assert text == ""
+    assert stats == {"tokens_in": 0, "tokens_out": 0, "chunks": 0, "selected": 0, "sources": []}
+    text, stats = pack_context("question", [{"url": "https://a.com", "markdown": ""}])
+    assert text == "" and stats["chunks"] == 0
+
+
+def test_pack_context_page_without_url():
+    text, stats = pack_context("asyncio", [{"url": None, "markdown": "asyncio basics"}])
+    assert text == "## 来源: 未知\n\nasyncio basics"
+    assert stats["sources"] == []
@@ -0,0 +1,141 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("httpx")
+
+from crawl_scheduler import CrawlScheduler, RobotsDisallowedError
+
+ROBOTS = b"User-agent: *\nDisallow: /private\nCrawl-delay: 1\n"
+
+
+class FakeClient:
+    """只回答robots.txt的网站替身，记录请求次数"""
+
+    def __init__(self, status_code=200, content=ROBOTS):
+        self.status_code = status_code
+        self.content = content
+        self.requests = []
+
+    async def get(self, url):
+        self.requests.append(url)
+        await asyncio.sleep(0.01)
+        return SimpleNamespace(status_code=self.status_code, content=self.content)
+
+    async def aclose(self):
+        pass
+
+
+def _scheduler(**kwargs):
+    options = {"max_active": 8, "per_host": 2, "host_delay": 0, "respect_robots": False}
+    options.update(kwargs)
+    scheduler = CrawlScheduler(**options)
+    scheduler._client = FakeClient()
+    return scheduler
+
+
+def test_per_host_concurrency_cap():
+    scheduler = _scheduler(per_host=2)
+    active = {"a.com": 0, "b.com": 0}
+    peak = {"a.com": 0, "b.com": 0}
+
+    async def fetch(url, host):
+        async with scheduler.slot(url):
+            active[host] += 1
+            peak[host] = max(peak[host], active[host])
+            await asyncio.sleep(0.02)
+            active[host] -= 1
+
+    async def run():
+        await asyncio.gather(
+            *(fetch(f"https://a.com/{i}", "a.com") for i in range(6)),
+            fetch("https://b.com/1", "b.com"),
+        )
+
+    asyncio.run(run())
+    assert peak == {"a.com": 2, "b.com": 1}
+    assert scheduler.stats()["active"] == 0
+
+
+def test_other_hosts_not_blocked_by_full_host():
+    scheduler = _scheduler(per_host=1)
+    order = []
+
+    async def fetch(url, hold):
+        async with scheduler.slot(url):
+            order.append(url)
+            await asyncio.sleep(hold)
+
+    async def run():
+        await asyncio.gather(
+            fetch("https://a.com/1", 0.1), fetch("https://a.com/2", 0), fetch("https://b.com/1", 0),
+        )
+
+    asyncio.run(run())
+    assert order == ["https://a.com/1", "https://b.com/1", "https://a.com/2"]
+
+
+def test_per_host_delay():
+    scheduler = _scheduler(per_host=4, host_delay=0.1)
+    starts = []
+
+    async def fetch(url):
+        async with scheduler.slot(url):
+            starts.append(time.monotonic())
+
+    async def run():
+        await asyncio.gather(*(fetch(f"https://a.com/{i}") for i in range(3)))
+
+    asyncio.run(run())
+    gaps = [b - a for a, b in zip(starts, starts[1:])]
+    assert all(gap >= 0.09 for gap in gaps)
+
+
+def test_interactive_before_background():
+    scheduler = _scheduler(max_active=1, per_host=1)
+    order = []
+
+    async def fetch(url, priority):
+        async with scheduler.slot(url, priority):
+            order.append(url)
+            await asyncio.sleep(0.02)
+
+    async def run():
+        first = asyncio.create_task(fetch("https://a.com/first", "background"))
+        await asyncio.sleep(0)
+        tasks = [asyncio.create_task(fetch(f"https://b.com/bg{i}", "background")) for i in range(2)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(fetch("https://c.com/user", "interactive")))
+        await asyncio.gather(first, *tasks)
+
+    asyncio.run(run())
+    assert order == ["https://a.com/first", "https://c.com/user", "https://b.com/bg0", "https://b.com/bg1"]
+
+
+def test_robots_cached_and_disallow():
+    scheduler = _scheduler(respect_robots=True)
+
+    async def run():
+        allowed = await asyncio.gather(
+            scheduler.allowed("https://a.com/public"),
+            scheduler.allowed("https://a.com/private/page"),
+            scheduler.allowed("https://a.com/other"),
+        )
+        with pytest.raises(RobotsDisallowedError):
+            async with scheduler.slot("https://a.com/private/x"):
+                pass
+        return allowed
+
+    assert asyncio.run(run()) == [True, False, True]
+    # 同一网站并发请求只获取一次robots.txt
+    assert scheduler._client.requests == ["https://a.com/robots.txt"]
+    # Crawl-delay比配置的间隔大时以它为准
+    assert scheduler._hosts["a.com"].delay == 1
+
+
+def test_robots_missing_allows_everything():
+    scheduler = _scheduler(respect_robots=True)
+    scheduler._client = FakeClient(status_code=404, content=b"")
+    assert asyncio.run(scheduler.allowed("https://a.com/private/page"))
@@ -0,0 +1,140 @@
+import asyncio
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("crawl4ai")
+
+import crawl_tool
+
+
+def _page(url, success=True):
+    return {"url": url, "success": success, "markdown": f"content of {url}" if success else "",
+            "error": "" if success else "boom", "dropped": False, "cached": False}
+
+
+class FakeStore:
+    def __init__(self, pages=()):
+        self.pages = {page["url"]: dict(page, cached=True) for page in pages}
+
+    async def get(self, url):
+        return self.pages.get(url)
+
+    async def put(self, page):
+        pass
+
+
+def _setup(monkeypatch, mirrors, failing=(), stored=()):
+    crawled = []
+
+    async def fake_iter(urls, priority="interactive"):
+        for url in urls:
+            crawled.append(url)
+            yield _page(url, url not in failing)
+
+    monkeypatch.setattr(crawl_tool, "PAGE_DEDUP", True)
+    monkeypatch.setattr(crawl_tool, "LOCAL_INDEX", False)
+    monkeypatch.setattr(crawl_tool, "known_mirrors", lambda urls, store=None: dict(mirrors))
+    monkeypatch.setattr(crawl_tool, "iter_crawl_pages", fake_iter)
+    monkeypatch.setattr(crawl_tool, "get_page_store", lambda: FakeStore([_page(url) for url in stored]))
+    return crawled
+
+
+async def _collect(urls):
+    return {page["url"]: page async for page in crawl_tool.crawl_pages(urls)}
+
+
+def test_mirror_skipped_when_original_succeeds(monkeypatch):
+    crawled = _setup(monkeypatch, {"https://b.com/x": "https://a.com/x"})
+    pages = asyncio.run(_collect(["https://a.com/x", "https://b.com/x"]))
+    assert crawled == ["https://a.com/x"]
+    assert pages["https://b.com/x"]["duplicate_of"] == "https://a.com/x"
+    assert not pages["https://b.com/x"]["error"]
+
+
+def test_mirror_skipped_when_original_in_store(monkeypatch):
+    crawled = _setup(monkeypatch, {"https://b.com/x": "https://a.com/x"}, stored=["https://a.com/x"])
+    pages = asyncio.run(_collect(["https://a.com/x", "https://b.com/x"]))
+    assert crawled == []
+    assert pages["https://a.com/x"]["cached"]
+    assert pages["https://b.com/x"]["duplicate_of"] == "https://a.com/x"
+
+
+def test_mirror_crawled_when_original_fails(monkeypatch):
+    crawled = _setup(monkeypatch, {"https://b.com/x": "https://a.com/x"}, failing={"https://a.com/x"})
+    pages = asyncio.run(_collect(["https://a.com/x", "https://b.com/x"]))
+    assert crawled == ["https://a.com/x", "https://b.com/x"]
+    assert pages["https://b.com/x"]["success"]
+    assert "duplicate_of" not in pages["https://b.com/x"]
+
+
+def test_quick_crawl_does_not_report_mirror_as_failure(monkeypatch):
+    _setup(monkeypatch, {"https://b.com/x": "https://a.com/x"})
+    result = asyncio.run(crawl_tool.quick_crawl_tool(["https://a.com/x", "https://b.com/x"]))
+    assert "content of https://a.com/x" in result
+    assert "https://b.com/x" not in result
+
+
+class FakeScheduler:
+    client = None
+
+    @asynccontextmanager
+    async def slot(self, url, priority="interactive"):
+        yield
+
+
+class FakeBrowserPool:
+    def __init__(self):
+        self.urls = []
+
+    @asynccontextmanager
+    async def acquire(self, pages=1):
+        yield self
+
+    async def arun(self, url, config=None):
+        self.urls.append(url)
+        return SimpleNamespace(success=True, url=url, markdown=SimpleNamespace(raw_markdown=f"rendered {url}"))
+
+
+def _setup_fetch(monkeypatch, http_page):
+    pool = FakeBrowserPool()
+    fetched = []
+
+    async def fake_fetch_http(url, client, config):
+        fetched.append(url)
+        return http_page
+
+    async def fake_get_pool():
+        return pool
+
+    monkeypatch.setattr(crawl_tool, "HTTP_FIRST", True)
+    monkeypatch.setattr(crawl_tool, "get_crawl_scheduler", FakeScheduler)
+    monkeypatch.setattr(crawl_tool, "fetch_http", fake_fetch_http)
+    monkeypatch.setattr(crawl_tool, "get_crawler_pool", fake_get_pool)
+    return pool, fetched
+
+
+def test_http_success_skips_browser(monkeypatch):
+    pool, fetched = _setup_fetch(monkeypatch, _page("https://a.com/x"))
+    page = asyncio.run(crawl_tool._fetch_one("https://a.com/x", None))
+    assert page["markdown"] == "content of https://a.com/x"
+    assert fetched == ["https://a.com/x"]
+    assert pool.urls == []
+
+
+def test_http_miss_falls_back_to_browser(monkeypatch):
+    pool, fetched = _setup_fetch(monkeypatch, None)
+    page = asyncio.run(crawl_tool._fetch_one("https://a.com/app", None))
+    assert page["success"]
+    assert page["markdown"] == "rendered https://a.com/app"
+    assert fetched == pool.urls == ["https://a.com/app"]
+
+
+def test_failed_document_not_sent_to_browser(monkeypatch):
+    failed = {"url": "https://a.com/r.pdf", "success": False, "markdown": "", "error": "文档下载失败",
+              "dropped": False, "cached": False, "document": "pdf"}
+    pool, _ = _setup_fetch(monkeypatch, failed)
+    page = asyncio.run(crawl_tool._fetch_one("https://a.com/r.pdf", None))
+    assert page is failed
+    assert pool.urls == []
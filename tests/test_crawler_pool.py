@@ -0,0 +1,115 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("crawl4ai")
+
+import crawler_pool
+from crawler_pool import CrawlerPool
+
+
+class FakeCrawler:
+    """不启动浏览器的爬虫，第一个实例的健康检查会失败"""
+
+    instances = []
+
+    def __init__(self, config=None):
+        self.closed = False
+        self.healthy = not FakeCrawler.instances
+        FakeCrawler.instances.append(self)
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        self.closed = True
+
+    async def arun(self, url, config=None):
+        await asyncio.sleep(0.05)
+        return SimpleNamespace(success=self.healthy)
+
+
+@pytest.fixture
+def fake_crawler(monkeypatch):
+    FakeCrawler.instances = []
+    monkeypatch.setattr(crawler_pool, "AsyncWebCrawler", FakeCrawler)
+    monkeypatch.setattr(crawler_pool, "observe_queue_wait", lambda queue, seconds: None)
+    return FakeCrawler
+
+
+def test_rebuild_does_not_close_browser_in_use(fake_crawler):
+    async def run():
+        pool = CrawlerPool(browser_config=object(), size=1, pages_per_browser=2, health_check_interval=0.01)
+        await pool.start()
+        fake_crawler.instances[0].healthy = False
+        await asyncio.sleep(0.02)
+        used = {}
+
+        async def borrow(name, hold):
+            async with pool.acquire() as crawler:
+                used[name] = crawler
+                await asyncio.sleep(hold)
+                # 持有租约期间浏览器不能被别人关掉
+                assert not crawler.closed
+
+        first = asyncio.create_task(borrow("first", 0.01))
+        await asyncio.sleep(0.01)  # 第一个请求正在做健康检查
+        second = asyncio.create_task(borrow("second", 0.05))
+        await asyncio.gather(first, second)
+        await pool.close()
+        return pool, used
+
+    pool, used = asyncio.run(run())
+    old, new = fake_crawler.instances[:2]
+    assert old.closed
+    # 健康检查期间到达的请求等重建完成后拿到新浏览器
+    assert used["first"] is new
+    assert used["second"] is new
+    assert pool.stats()["browsers"][0]["restarts"] == 1
+
+
+def test_leases_are_limited_per_browser(fake_crawler):
+    async def run():
+        pool = CrawlerPool(browser_config=object(), size=1, pages_per_browser=2, health_check_interval=0)
+        await pool.start()
+        active = []
+
+        async def borrow():
+            async with pool.acquire():
+                active.append(pool.stats()["browsers"][0]["active"])
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(borrow() for _ in range(5)))
+        await pool.close()
+        return active
+
+    assert max(asyncio.run(run())) == 2
+
+
+def test_close_wakes_waiters(fake_crawler):
+    async def run():
+        pool = CrawlerPool(browser_config=object(), size=1, pages_per_browser=1, health_check_interval=0)
+        await pool.start()
+        release = asyncio.Event()
+
+        async def hold():
+            async with pool.acquire():
+                await release.wait()
+
+        async def wait_for_browser():
+            async with pool.acquire():
+                pass
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(wait_for_browser())
+        await asyncio.sleep(0.01)
+        await pool.close()
+        # 关闭后排队的请求立即失败，不会等到有人归还后借到已关闭的浏览器
+        with pytest.raises(RuntimeError):
+            await asyncio.wait_for(waiter, 1)
+        release.set()
+        await holder
+
+    asyncio.run(run())
@@ -0,0 +1,59 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from document_extract import extract_document
+from http_fetch import fetch_http
+
+
+class FakeResponse:
+    """httpx流式响应的替身，chunks里的异常会在下载到该位置时抛出"""
+
+    def __init__(self, chunks, headers=None, status_code=200):
+        self.chunks = chunks
+        self.headers = headers or {}
+        self.status_code = status_code
+        self.charset_encoding = "utf-8"
+
+    async def aiter_bytes(self):
+        for chunk in self.chunks:
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+
+
+class FakeClient:
+    def __init__(self, response=None, error=None):
+        self.response = response
+        self.error = error
+
+    @asynccontextmanager
+    async def stream(self, method, url, **kwargs):
+        if self.error is not None:
+            raise self.error
+        yield self.response
+
+
+def test_extract_text_document():
+    response = FakeResponse([b"hello ", b"world"], {"content-type": "text/plain"})
+    page = asyncio.run(extract_document("https://a.com/readme.txt", response, "text"))
+    assert page["success"]
+    assert "hello world" in page["markdown"]
+
+
+def test_download_error_returns_failed_document():
+    response = FakeResponse([b"%PDF-1.7", ConnectionError("reset")], {"content-type": "application/pdf"})
+    page = asyncio.run(fetch_http("https://a.com/report.pdf", FakeClient(response), config=None))
+    assert page is not None
+    assert not page["success"]
+    assert page["document"] == "pdf"
+    assert "下载失败" in page["error"]
+
+
+def test_request_error_for_document_url_is_not_sent_to_browser():
+    page = asyncio.run(fetch_http("https://a.com/report.pdf", FakeClient(error=ConnectionError("refused")), config=None))
+    assert page is not None and page["document"] == "pdf"
+
+
+def test_request_error_for_html_falls_back_to_browser():
+    page = asyncio.run(fetch_http("https://a.com/index.html", FakeClient(error=ConnectionError("refused")), config=None))
+    assert page is None
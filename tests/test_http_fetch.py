@@ -0,0 +1,101 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import http_fetch
+from http_fetch import fetch_http, needs_browser
+
+ARTICLE = "<html><body><article>" + "<p>" + "正文内容" * 100 + "</p>" + "</article></body></html>"
+SPA_SHELL = (
+    "<html><head><script src='/app.js'></script></head>"
+    "<body><div id=\"root\"></div><noscript>Please enable JavaScript</noscript></body></html>"
+)
+
+
+class FakeResponse:
+    def __init__(self, body, content_type="text/html; charset=utf-8", status_code=200):
+        self.body = body.encode("utf-8") if isinstance(body, str) else body
+        self.headers = {"content-type": content_type}
+        self.status_code = status_code
+        self.charset_encoding = "utf-8" if "charset" in content_type else None
+
+    async def aiter_bytes(self):
+        yield self.body
+
+
+class FakeClient:
+    def __init__(self, response):
+        self.response = response
+        self.requests = []
+
+    @asynccontextmanager
+    async def stream(self, method, url, **kwargs):
+        self.requests.append(url)
+        yield self.response
+
+
+def _fake_markdown(monkeypatch):
+    converted = []
+
+    def fake_html_to_markdown(url, html, config):
+        converted.append(url)
+        return "# 标题\n\n" + "正文内容" * 100
+
+    monkeypatch.setattr(http_fetch, "html_to_markdown", fake_html_to_markdown)
+    return converted
+
+
+def test_needs_browser():
+    assert not needs_browser(ARTICLE)
+    assert needs_browser(SPA_SHELL)
+    assert needs_browser("<html><body><p>太短</p></body></html>")
+    # 有SPA挂载点但服务端已经渲染了足够多正文的页面不需要浏览器
+    assert not needs_browser("<div id=\"app\"></div>" + "<p>" + "正文" * 2000 + "</p>")
+
+
+def test_static_page_fetched_over_http(monkeypatch):
+    converted = _fake_markdown(monkeypatch)
+    page = asyncio.run(fetch_http("https://a.com/post", FakeClient(FakeResponse(ARTICLE)), config=None))
+    assert page["success"]
+    assert page["markdown"].startswith("# 标题")
+    assert converted == ["https://a.com/post"]
+
+
+def test_meta_charset_used_when_header_has_none(monkeypatch):
+    seen = []
+    monkeypatch.setattr(http_fetch, "html_to_markdown", lambda url, html, config: seen.append(html) or "ok")
+    html = "<html><head><meta charset=\"gbk\"></head><body><p>" + "中文正文" * 100 + "</p></body></html>"
+    response = FakeResponse(html.encode("gbk"), content_type="text/html")
+    page = asyncio.run(fetch_http("https://a.com/gbk", FakeClient(response), config=None))
+    assert page["success"]
+    assert "中文正文" in seen[0]
+
+
+def test_spa_shell_falls_back_to_browser(monkeypatch):
+    converted = _fake_markdown(monkeypatch)
+    page = asyncio.run(fetch_http("https://a.com/app", FakeClient(FakeResponse(SPA_SHELL)), config=None))
+    assert page is None
+    assert converted == []
+
+
+def test_non_html_and_errors_fall_back_to_browser(monkeypatch):
+    _fake_markdown(monkeypatch)
+    for response in (
+        FakeResponse(b"\x89PNG", content_type="image/png"),
+        FakeResponse(ARTICLE, status_code=403),
+    ):
+        assert asyncio.run(fetch_http("https://a.com/page", FakeClient(response), config=None)) is None
+
+
+def test_oversized_page_falls_back_to_browser(monkeypatch):
+    _fake_markdown(monkeypatch)
+    monkeypatch.setattr(http_fetch, "HTTP_FETCH_MAX_BYTES", 100)
+    assert asyncio.run(fetch_http("https://a.com/big", FakeClient(FakeResponse(ARTICLE)), config=None)) is None
+
+
+def test_document_extracted_locally(monkeypatch):
+    converted = _fake_markdown(monkeypatch)
+    response = FakeResponse("a,b\n1,2\n", content_type="text/csv")
+    page = asyncio.run(fetch_http("https://a.com/data.csv", FakeClient(response), config=None))
+    assert page["success"]
+    assert page["document"] == "csv"
+    assert converted == []
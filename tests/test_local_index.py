@@ -0,0 +1,83 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from local_index import LocalIndex
+
+CRAWL4AI_PAGE = "Crawl4AI 是一个开源的网页爬虫框架，专为大模型设计。\n\n它支持异步抓取和markdown输出。"
+
+
+def page(url, markdown, fetched_at=None):
+    return {"url": url, "success": True, "markdown": markdown, "fetched_at": fetched_at}
+
+
+def add_pages(index, *pages):
+    async def run():
+        for item in pages:
+            await index.add(item)
+        await index.close()
+    asyncio.run(run())
+
+
+@pytest.fixture
+def index(tmp_path):
+    return LocalIndex(str(tmp_path), use_vectors=False, flush_interval=0.01)
+
+
+def test_lookup_hit_and_miss(index):
+    add_pages(index, page("https://a.com/crawl4ai", CRAWL4AI_PAGE), page("https://b.com/weather", "上海今天天气晴朗。"))
+    pages = index.lookup_sync("crawl4ai是什么", max_age=1800, min_score=0.8)
+    assert [item["url"] for item in pages] == ["https://a.com/crawl4ai"]
+    assert index.lookup_sync("langgraph教程", max_age=1800, min_score=0.8) == []
+
+
+def test_stale_pages_are_not_used(index):
+    add_pages(index, page("https://a.com/crawl4ai", CRAWL4AI_PAGE, fetched_at=time.time() - 3600))
+    assert index.lookup_sync("crawl4ai是什么", max_age=1800, min_score=0.8) == []
+    assert index.lookup_sync("crawl4ai是什么", max_age=7200, min_score=0.8)
+
+
+def test_incremental_update(index):
+    add_pages(index, page("https://a.com/x", CRAWL4AI_PAGE, fetched_at=time.time() - 3600))
+    # 内容没变：只刷新时间，不重复写入片段
+    add_pages(index, page("https://a.com/x", CRAWL4AI_PAGE))
+    assert index.get_stats()["chunks"] == 1
+    assert index.lookup_sync("crawl4ai是什么", max_age=1800, min_score=0.8)
+    # 内容变了：旧片段被替换
+    add_pages(index, page("https://a.com/x", "LangGraph 是一个构建智能体的框架。"))
+    assert index.get_stats()["pages"] == 1
+    assert index.lookup_sync("crawl4ai是什么", max_age=1800, min_score=0.8) == []
+    assert index.lookup_sync("langgraph是什么", max_age=1800, min_score=0.8)
+
+
+def test_eviction_by_age_and_size(tmp_path):
+    index = LocalIndex(str(tmp_path), max_chunks=3, retention=600, use_vectors=False, flush_interval=0.01)
+    add_pages(index, page("https://old.com", "archive notes", fetched_at=time.time() - 3600))
+    add_pages(index, *(page(f"https://c.com/{i}", f"chapter{i} notes", fetched_at=time.time() + i) for i in range(4)))
+    assert index.get_stats()["pages"] == 3
+    # 超过保留时间的被淘汰
+    assert index.lookup_sync("archive", max_age=None, min_score=0.5) == []
+    # 超过片段上限时最早抓取的网页先被淘汰
+    assert index.lookup_sync("chapter0", max_age=None, min_score=0.5) == []
+    assert index.lookup_sync("chapter3", max_age=None, min_score=0.5)
+
+
+def test_vectors_survive_compaction(tmp_path):
+    pytest.importorskip("numpy")
+    index = LocalIndex(str(tmp_path), retention=600, dim=64, flush_interval=0.01, compact_min_rows=4)
+    add_pages(index, *(page(f"https://old.com/{i}", f"过期的内容{i}。", fetched_at=time.time() - 3600) for i in range(6)))
+    add_pages(index, page("https://a.com/crawl4ai", CRAWL4AI_PAGE))
+    files = [name for name in os.listdir(tmp_path) if name.startswith("vectors-")]
+    assert "vectors-1.f32" in files
+    assert index.get_stats()["vector_bytes"] == 64 * 4
+    pages = index.lookup_sync("crawl4ai是什么", max_age=1800, min_score=0.8)
+    assert [item["url"] for item in pages] == ["https://a.com/crawl4ai"]
+
+
+def test_search_returns_idf_separately(index):
+    add_pages(index, page("https://a.com/crawl4ai", CRAWL4AI_PAGE))
+    chunks, idf = index.search("crawl4ai是什么")
+    assert chunks and "idf" not in chunks[0]
+    assert set(idf) >= chunks[0]["matched"]
@@ -0,0 +1,122 @@
+import random
+
+from context_packer import estimate_tokens
+from page_dedup import FingerprintStore, PageDeduper, hamming, known_mirrors, paragraph_hash, simhash
+
+WORDS = [f"word{i}" for i in range(500)]
+
+
+def _text(seed, words=200):
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def _paragraphs(seed, count=4):
+    return [_text(seed * 100 + i, 40) for i in range(count)]
+
+
+def _page(url, markdown):
+    return {"url": url, "success": True, "markdown": markdown, "error": ""}
+
+
+def test_simhash_near_duplicates_are_close():
+    text = _text(1)
+    edited = text + " word1"
+    assert hamming(simhash(text), simhash(text)) == 0
+    assert hamming(simhash(text), simhash(edited)) <= 3
+    assert hamming(simhash(text), simhash(_text(2))) > 3
+
+
+def test_hamming():
+    assert hamming(0b1011, 0b0001) == 2
+    assert hamming(0, 2 ** 64 - 1) == 64
+
+
+def test_paragraph_hash_ignores_markdown_and_links():
+    assert paragraph_hash("## Hello [World](https://a.com)") == paragraph_hash("hello [world](https://b.com)")
+    assert paragraph_hash("** --- **") == ""
+
+
+def test_same_canonical_url_dropped():
+    deduper = PageDeduper()
+    markdown = "\n\n".join(_paragraphs(1))
+    assert deduper.add(_page("https://a.com/x?utm_source=feed", markdown)) is not None
+    assert deduper.add(_page("HTTPS://A.com/x#top", "\n\n".join(_paragraphs(2)))) is None
+    assert deduper.stats["duplicate_pages"] == 1
+
+
+def test_near_duplicate_dropped_and_counted():
+    deduper = PageDeduper()
+    markdown = "\n\n".join(_paragraphs(1))
+    mirror = markdown + " word1"
+    deduper.add(_page("https://a.com/x", markdown))
+    assert deduper.add(_page("https://mirror.com/x", mirror)) is None
+    assert deduper.stats["bytes_removed"] == len(mirror.encode("utf-8"))
+    assert deduper.stats["tokens_removed"] == estimate_tokens(mirror)
+
+
+def test_repeated_paragraphs_removed():
+    deduper = PageDeduper()
+    first = _paragraphs(1)
+    second = _paragraphs(2)
+    deduper.add(_page("https://a.com/x", "\n\n".join(first)))
+    page = deduper.add(_page("https://b.com/y", "\n\n".join(second + [first[0]])))
+    assert page["markdown"] == "\n\n".join(second)
+    assert deduper.stats["duplicate_paragraphs"] == 1
+    assert deduper.stats["bytes_removed"] == len(first[0].encode("utf-8"))
+    assert deduper.stats["tokens_removed"] == estimate_tokens(first[0])
+
+
+def test_page_with_only_repeated_paragraphs_dropped():
+    deduper = PageDeduper()
+    first = _paragraphs(1, count=6)
+    deduper.add(_page("https://a.com/x", "\n\n".join(first)))
+    assert deduper.add(_page("https://b.com/y", first[2])) is None
+    assert deduper.stats["pages_out"] == 1
+    assert deduper.stats["duplicate_pages"] == 1
+
+
+def test_failed_pages_passed_through():
+    deduper = PageDeduper()
+    failed = {"url": "https://a.com/x", "success": False, "markdown": "", "error": "boom"}
+    assert deduper.add(failed) is failed
+    assert deduper.stats["pages_in"] == 0
+
+
+def test_boilerplate_counted_per_host(tmp_path):
+    store = FingerprintStore(str(tmp_path / "fingerprints.db"))
+    footer = "Copyright example site, all rights reserved, contact us for more"
+    for i in range(2):
+        PageDeduper(store, boilerplate_pages=2).add(
+            _page(f"https://site.com/{i}", "\n\n".join(_paragraphs(10 + i) + [footer]))
+        )
+
+    page = PageDeduper(store, boilerplate_pages=2).add(
+        _page("https://site.com/new", "\n\n".join(_paragraphs(20) + [footer]))
+    )
+    assert footer not in page["markdown"]
+
+    deduper = PageDeduper(store, boilerplate_pages=2)
+    page = deduper.add(_page("https://other.com/new", "\n\n".join(_paragraphs(30) + [footer])))
+    assert footer in page["markdown"]
+    assert deduper.stats["boilerplate_paragraphs"] == 0
+
+
+def test_boilerplate_excludes_current_page(tmp_path):
+    store = FingerprintStore(str(tmp_path / "fingerprints.db"))
+    hashes = [paragraph_hash(p) for p in _paragraphs(1)]
+    store.record("https://site.com/a", 1, hashes)
+    store.record("https://site.com/b", 2, hashes)
+    assert store.boilerplate(hashes, "https://site.com/c", 2) == set(hashes)
+    assert store.boilerplate(hashes, "https://site.com/a", 2) == set()
+    assert store.boilerplate(hashes, "https://site.com/c", 0) == set()
+
+
+def test_known_mirrors(tmp_path):
+    store = FingerprintStore(str(tmp_path / "fingerprints.db"))
+    markdown = _text(1)
+    store.record("https://a.com/x", simhash(markdown), [])
+    store.record("https://mirror.com/x", simhash(markdown + " word1"), [])
+    store.record("https://b.com/y", simhash(_text(2)), [])
+    urls = ["https://a.com/x", "https://mirror.com/x", "https://b.com/y", "https://new.com/z"]
+    assert known_mirrors(urls, store) == {"https://mirror.com/x": "https://a.com/x"}
@@ -0,0 +1,78 @@
+import asyncio
+import os
+import time
+
+from page_store import PageStore
+
+
+def _page(url, markdown):
+    return {"url": url, "success": True, "markdown": markdown, "error": "", "dropped": False, "cached": False}
+
+
+def _fill(store, pages):
+    async def run():
+        for page in pages:
+            await store.put(page)
+            await store.flush()
+        await store.close()
+    asyncio.run(run())
+
+
+def _blob_files(root):
+    return sorted(
+        filename for _, _, filenames in os.walk(os.path.join(root, "objects")) for filename in filenames
+    )
+
+
+def test_evicts_oldest_pages_and_their_blobs(tmp_path):
+    store = PageStore(str(tmp_path), max_bytes=10 ** 9, flush_interval=0)
+    _fill(store, [_page(f"https://a.com/{i}", os.urandom(2000).hex()) for i in range(10)])
+    size = store.get_stats()["stored_bytes"]
+
+    store.max_bytes = size // 2
+    _fill(store, [_page("https://a.com/new", os.urandom(2000).hex())])
+
+    stats = store.get_stats()
+    assert stats["stored_bytes"] <= store.max_bytes
+    assert stats["evictions"] >= 5
+    assert len(_blob_files(tmp_path)) == stats["pages"]
+    assert asyncio.run(store.get("https://a.com/0")) is None
+    assert asyncio.run(store.get("https://a.com/new")) is not None
+
+
+def test_shared_blob_freed_only_with_last_reference(tmp_path):
+    store = PageStore(str(tmp_path), max_bytes=10 ** 9, flush_interval=0)
+    shared = os.urandom(2000).hex()
+    _fill(store, [_page("https://a.com/x", shared), _page("https://b.com/x", shared)])
+    assert store.get_stats()["stored_bytes"] > 0
+
+    store.max_bytes = 0
+    _fill(store, [_page("https://c.com/y", os.urandom(2000).hex())])
+    assert store.get_stats()["pages"] == 0
+    assert _blob_files(tmp_path) == []
+
+
+def test_orphan_blob_files_cleaned_at_startup(tmp_path):
+    store = PageStore(str(tmp_path), flush_interval=0)
+    _fill(store, [_page("https://a.com/x", "hello")])
+    orphan = os.path.join(tmp_path, "objects", "ff", "ff" * 32 + ".zz")
+    os.makedirs(os.path.dirname(orphan), exist_ok=True)
+    with open(orphan, "wb") as f:
+        f.write(b"x" * 100)
+    old = time.time() - 3600
+    os.utime(orphan, (old, old))
+
+    store = PageStore(str(tmp_path), flush_interval=0)
+    assert not os.path.exists(orphan)
+    assert asyncio.run(store.get("https://a.com/x"))["markdown"] == "hello"
+
+
+def test_blob_file_without_row_is_counted(tmp_path):
+    store = PageStore(str(tmp_path), flush_interval=0)
+    _fill(store, [_page("https://a.com/x", "hello")])
+    with store._connect() as conn:
+        conn.execute("DELETE FROM blobs")
+    assert store.get_stats()["stored_bytes"] == 0
+
+    _fill(store, [_page("https://b.com/x", "hello")])
+    assert store.get_stats()["stored_bytes"] > 0
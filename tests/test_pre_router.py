@@ -0,0 +1,49 @@
+from datetime import datetime
+
+import pytest
+
+from pre_router import NgramClassifier, PreRouter, SEED_EXAMPLES, search_query
+
+
+@pytest.fixture(scope="module")
+def router():
+    return PreRouter(NgramClassifier().fit(SEED_EXAMPLES))
+
+
+@pytest.mark.parametrize("question", [
+    "帮我翻译这句话：今天天气很好",
+    "帮我写一篇2025年工作总结",
+    "最近邻算法是什么",
+    "写一首关于今天的诗",
+    "你好",
+])
+def test_not_routed_to_search(router, question):
+    route, _, _ = router.route(question)
+    assert route == "llm"
+
+
+@pytest.mark.parametrize("question", [
+    "今天的黄历",
+    "上海明天天气怎么样",
+    "最近有什么新闻",
+    "crawl4ai是什么",
+])
+def test_routed_to_search(router, question):
+    route, _, _ = router.route(question)
+    assert route == "search"
+
+
+def test_rule_only_raises_classifier_score(router):
+    proba = router.classifier.predict_proba("今天的黄历")["search"]
+    route, decided_by, boosted = router.route("今天的黄历")
+    assert boosted > proba
+    assert (route, decided_by) == ("search", "rule")
+
+
+def test_reference_in_follow_up_goes_to_llm(router):
+    assert router.route("它支持哪些输出格式", has_history=True)[:2] == ("llm", "reference")
+
+
+def test_decide_rewrites_dates_only_for_search(router):
+    assert router.decide("帮我翻译这句话：今天天气很好") is None
+    assert search_query("今天的黄历？", today=datetime(2026, 10, 17)) == "2026-10-17的黄历"
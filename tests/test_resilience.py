@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+
+from resilience import CircuitBreaker, TokenBucket, Upstream
+
+
+def test_cancelled_waiter_refunds_token():
+    bucket = TokenBucket(rate=1, burst=1)
+
+    async def run():
+        assert await bucket.acquire() == 0
+        waiter = asyncio.create_task(bucket.acquire())
+        await asyncio.sleep(0.05)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        # 被取消的等待者退还了令牌，下一个请求只需要等第一个令牌补回来
+        return bucket.reserve()
+
+    assert asyncio.run(run()) < 1.0
+
+
+def test_refund_does_not_exceed_burst():
+    bucket = TokenBucket(rate=1, burst=2)
+    bucket.refund()
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() > 0
+
+
+def test_cancel_while_waiting_for_token_releases_half_open_probe():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    upstream = Upstream("test", TokenBucket(rate=1, burst=1), breaker, max_retries=0)
+    upstream.limiter.reserve()  # 桶已空，下一个调用要等令牌
+
+    async def ok():
+        return "ok"
+
+    async def run():
+        waiter = asyncio.create_task(upstream.call(ok))
+        await asyncio.sleep(0.05)
+        assert breaker.state == "half_open"
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        # 试探名额已释放，下一个调用可以作为试探请求放行
+        return await upstream.call(ok)
+
+    assert asyncio.run(run()) == "ok"
+    assert breaker.state == "closed"
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from search_cache import SearchCache, normalize_query
+
+
+def test_normalize_query():
+    assert normalize_query("Crawl4AI 是什么？") == normalize_query("crawl4ai是什么")
+
+
+def test_concurrent_queries_fetch_once():
+    cache = SearchCache()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return [{"url": "https://a.com"}]
+
+    async def run():
+        return await asyncio.gather(*(cache.get_or_fetch("tavily", "q", 5, fetch) for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert all(items == [{"url": "https://a.com"}] for items, _ in results)
+
+
+def test_leader_cancellation_does_not_cancel_followers():
+    cache = SearchCache()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return [{"url": "https://a.com"}]
+
+    async def run():
+        leader = asyncio.create_task(cache.get_or_fetch("tavily", "q", 5, fetch))
+        await asyncio.sleep(0)
+        followers = [asyncio.create_task(cache.get_or_fetch("tavily", "q", 5, fetch)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.gather(*followers)
+
+    results = asyncio.run(run())
+    # 其中一个等待者重新请求，其余的共享它的结果
+    assert len(calls) == 2
+    assert [items for items, _ in results] == [[{"url": "https://a.com"}]] * 3
+    # 重新请求的那个计为未命中，另外两个各计一次合并
+    stats = cache.get_stats()
+    assert stats["misses"] == 2
+    assert stats["coalesced"] == 2
+
+
+def test_fetch_error_reaches_followers():
+    cache = SearchCache()
+
+    async def fetch():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def run():
+        return await asyncio.gather(
+            *(cache.get_or_fetch("tavily", "q", 5, fetch) for _ in range(3)), return_exceptions=True
+        )
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, RuntimeError) for result in results)
@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("httpx")
+
+from search_engine import ProviderStats, SearchEngine
+
+
+class FakeEngine(SearchEngine):
+    """按服务商返回预设的行为，不发出真实请求"""
+
+    def __init__(self, behaviors, **kwargs):
+        super().__init__(list(behaviors), use_cache=False, **kwargs)
+        self.behaviors = behaviors
+
+    async def search_provider(self, provider, query, max_results):
+        delay, outcome = self.behaviors[provider]
+        await asyncio.sleep(delay)
+        if outcome == "cancel":
+            raise asyncio.CancelledError()
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def test_race_skips_cancelled_provider():
+    engine = FakeEngine({
+        "tavily": (0.0, "cancel"),
+        "duckduckgo": (0.01, [{"url": "https://a.com", "provider": "duckduckgo"}]),
+    }, stagger=0)
+    assert asyncio.run(engine.race("q")) == [{"url": "https://a.com", "provider": "duckduckgo"}]
+
+
+def test_fuse_skips_cancelled_provider():
+    engine = FakeEngine({
+        "tavily": (0.0, "cancel"),
+        "duckduckgo": (0.01, [{"url": "https://a.com", "title": "", "content": "", "provider": "duckduckgo", "rank": 1}]),
+    }, mode="fuse")
+    assert [item["url"] for item in asyncio.run(engine.fuse("q"))] == ["https://a.com"]
+
+
+def test_cancelled_request_is_not_a_success():
+    stats = ProviderStats()
+    stats.record("tavily", 1.0, ok=False)
+    failures = stats.snapshot()["tavily"]["failures"]
+    stats.record_cancelled("tavily", 3.0)
+    snapshot = stats.snapshot()["tavily"]
+    assert snapshot["calls"] == 1
+    assert snapshot["failures"] == failures
+    assert snapshot["latency"] > 1.0
@@ -0,0 +1,78 @@
+import pytest
+
+pytest.importorskip("langgraph")
+
+from langgraph.checkpoint.base import empty_checkpoint
+
+from session_memory import BoundedMemorySaver
+
+
+def thread_config(thread_id):
+    return {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+
+
+def put(saver, thread_id):
+    saver.put(thread_config(thread_id), empty_checkpoint(), {}, {})
+
+
+def test_least_recently_written_thread_is_evicted():
+    saver = BoundedMemorySaver(max_threads=2, ttl=0)
+    put(saver, "a")
+    put(saver, "b")
+    put(saver, "a")
+    put(saver, "c")
+    assert saver.get_tuple(thread_config("b")) is None
+    assert saver.get_tuple(thread_config("a")) is not None
+    assert saver.get_tuple(thread_config("c")) is not None
+
+
+def test_idle_thread_expires(monkeypatch):
+    saver = BoundedMemorySaver(max_threads=10, ttl=60)
+    clock = [1000.0]
+    monkeypatch.setattr("session_memory.time.monotonic", lambda: clock[0])
+    put(saver, "a")
+    clock[0] += 61
+    put(saver, "b")
+    assert saver.get_tuple(thread_config("a")) is None
+    assert saver.get_tuple(thread_config("b")) is not None
+
+
+def turn(index, artifact=None, answer=True):
+    from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+    call = {"name": "search_tool", "args": {"query": f"q{index}"}, "id": f"call{index}"}
+    messages = [
+        HumanMessage(content=f"问题{index}", id=f"h{index}"),
+        AIMessage(content="", tool_calls=[call], id=f"a{index}"),
+        ToolMessage(content="网页", tool_call_id=f"call{index}", artifact=artifact, id=f"t{index}"),
+    ]
+    if answer:
+        messages.append(AIMessage(content=f"回答{index}", id=f"r{index}"))
+    return messages
+
+
+def test_compact_strips_turn_only_artifacts():
+    from langchain_core.messages import RemoveMessage, ToolMessage
+
+    from session_memory import compact_messages
+
+    messages = turn(0, {"url": "https://a.com", "success": True, "page_stream": "s0"}) + \
+        turn(1, {"local_pages": [{"markdown": "x" * 1000}]})
+    ops = compact_messages(messages, keep_turns=2)
+    assert not any(isinstance(op, RemoveMessage) for op in ops)
+    replaced = {op.id: op.artifact for op in ops if isinstance(op, ToolMessage)}
+    assert replaced == {"t0": {"url": "https://a.com", "success": True}, "t1": None}
+
+
+def test_compact_counts_artifact_size():
+    from langchain_core.messages import RemoveMessage
+
+    from session_memory import compact_messages
+
+    messages = turn(0, {"snippets": [{"content": "x" * 5000}]}) + turn(1, {"url": "https://b.com", "success": True})
+    # 内容很短，但artifact很大：去掉artifact后就不再超过上限
+    ops = compact_messages(messages, keep_turns=2, max_page_chars=1000)
+    assert not any(isinstance(op, RemoveMessage) for op in ops)
+    # 两条工具消息的内容一共只有4个字，保留下来的url artifact也计入总字数
+    ops = compact_messages(messages, keep_turns=2, max_page_chars=20)
+    assert "t1" in {op.id for op in ops if isinstance(op, RemoveMessage)}
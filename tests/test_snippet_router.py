@@ -0,0 +1,95 @@
+import asyncio
+from types import SimpleNamespace
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+import snippet_router
+from snippet_router import SnippetRouter, snippet_coverage
+
+FILLER = " " + "x" * 300
+
+COVERED = [{"title": "asyncio event loop", "url": "https://a.com", "content": "python asyncio event loop guide" + FILLER}]
+HALF = [{"title": "asyncio", "url": "https://a.com", "content": "python asyncio" + FILLER}]
+UNRELATED = [{"title": "weather", "url": "https://b.com", "content": "sunny tomorrow" + FILLER}]
+
+QUESTION = "python asyncio event loop"
+
+
+def test_score_too_short():
+    router = SnippetRouter(min_chars=200)
+    short = [{"title": "asyncio event loop", "content": "python asyncio event loop"}]
+    assert router.score(QUESTION, short) == (0.0, "too_short")
+
+
+def test_score_needs_detail():
+    router = SnippetRouter()
+    assert router.score("python asyncio event loop 详细教程", COVERED) == (0.0, "needs_detail")
+
+
+def test_score_coverage():
+    router = SnippetRouter()
+    score, reason = router.score(QUESTION, COVERED)
+    assert reason == "coverage"
+    assert score == 1.0
+    assert router.score(QUESTION, UNRELATED)[0] == 0.0
+    assert 0 < router.score(QUESTION, HALF)[0] < 1
+
+
+def test_coverage_ignores_question_words():
+    assert snippet_coverage("什么是", COVERED) == 0.0
+    assert snippet_coverage("what is python", COVERED) == 1.0
+
+
+def test_sufficient_above_min_score():
+    router = SnippetRouter(min_score=0.8, judge_min_score=0.3)
+    assert asyncio.run(router.sufficient(QUESTION, COVERED))
+    assert not asyncio.run(router.sufficient(QUESTION, UNRELATED))
+
+
+def test_sufficient_between_thresholds_uses_judge(monkeypatch):
+    router = SnippetRouter(min_score=0.8, judge_min_score=0.3)
+    calls = []
+
+    async def fake_message(model, messages, stream=True, **kwargs):
+        calls.append(model)
+        return SimpleNamespace(content=model)
+
+    monkeypatch.setattr(snippet_router, "astream_message", fake_message)
+    # 没有配置判断模型时按不够处理，抓取网页
+    assert not asyncio.run(router.sufficient(QUESTION, HALF))
+    assert asyncio.run(router.sufficient(QUESTION, HALF, judge_model="是"))
+    assert not asyncio.run(router.sufficient(QUESTION, HALF, judge_model="否"))
+    assert calls == ["是", "否"]
+    # 低于judge_min_score时不调用模型
+    assert not asyncio.run(router.sufficient(QUESTION, UNRELATED, judge_model="是"))
+    assert calls == ["是", "否"]
+
+
+def test_judge_failure_falls_back_to_crawl(monkeypatch):
+    router = SnippetRouter(min_score=0.8, judge_min_score=0.3)
+
+    async def failing_message(model, messages, stream=True, **kwargs):
+        raise RuntimeError("judge down")
+
+    monkeypatch.setattr(snippet_router, "astream_message", failing_message)
+    assert not asyncio.run(router.sufficient(QUESTION, HALF, judge_model="model"))
+
+
+def _after_search(snippets):
+    return {"messages": [
+        HumanMessage(content=QUESTION),
+        AIMessage(content="", tool_calls=[{"name": "search_tool", "args": {"query": QUESTION}, "id": "call-0"}]),
+        ToolMessage(content=[item["url"] for item in snippets], tool_call_id="call-0", artifact={"snippets": snippets}),
+    ]}
+
+
+def test_route_after_search(web_agent, monkeypatch):
+    monkeypatch.setattr(web_agent, "SNIPPET_FAST_PATH", True)
+    monkeypatch.setattr(web_agent, "snippet_judge_llm", None)
+    monkeypatch.setattr(web_agent, "get_snippet_router", lambda: SnippetRouter(min_score=0.8))
+    assert asyncio.run(web_agent.route_after_search(_after_search(COVERED))) == "summary_bot"
+    assert asyncio.run(web_agent.route_after_search(_after_search(UNRELATED))) == "crawl4ai_tool"
+    assert asyncio.run(web_agent.route_after_search(_after_search([]))) == "crawl4ai_tool"
+
+    monkeypatch.setattr(web_agent, "SNIPPET_FAST_PATH", False)
+    assert asyncio.run(web_agent.route_after_search(_after_search(COVERED))) == "crawl4ai_tool"
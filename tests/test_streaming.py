@@ -0,0 +1,68 @@
+import re
+import asyncio
+from pathlib import Path
+from types import SimpleNamespace
+
+from streaming import ANSWER_NODES, stream_answer
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+class FakeGraph:
+    """按顺序产出给定的astream_events事件"""
+
+    def __init__(self, events):
+        self.events = events
+
+    async def astream_events(self, state, config=None, version="v2"):
+        for event in self.events:
+            yield event
+
+
+def model_event(event_type, node, data, run_id="llm"):
+    return {
+        "event": event_type, "name": "ChatOpenAI", "run_id": run_id, "parent_ids": ["root"],
+        "metadata": {"langgraph_node": node}, "tags": [], "data": data,
+    }
+
+
+def collect(graph, **kwargs):
+    async def run():
+        return [event async for event in stream_answer(graph, {"messages": []}, **kwargs)]
+    return asyncio.run(run())
+
+
+def test_direct_answer_streams_tokens():
+    graph = FakeGraph([
+        model_event("on_chat_model_start", "chat_bot", {}),
+        model_event("on_chat_model_stream", "chat_bot", {"chunk": SimpleNamespace(content="你")}),
+        model_event("on_chat_model_stream", "chat_bot", {"chunk": SimpleNamespace(content="好")}),
+        model_event("on_chat_model_end", "chat_bot", {"output": SimpleNamespace(tool_calls=[])}),
+    ])
+    events = collect(graph)
+    assert [event["content"] for event in events if event["event"] == "token"] == ["你", "好"]
+    assert events[-1]["event"] == "done"
+    assert events[-1]["ttft"] is not None
+
+
+def test_chat_model_tool_calls_are_forwarded():
+    tool_call = {"name": "search_tool", "args": {"query": "crawl4ai"}, "id": "call_1"}
+    graph = FakeGraph([
+        model_event("on_chat_model_end", "chat_bot", {"output": SimpleNamespace(tool_calls=[tool_call])}),
+    ])
+    events = collect(graph)
+    assert events[0] == {"event": "tool_call", "node": "chat_bot", "name": "search_tool", "args": {"query": "crawl4ai"}}
+
+
+def test_other_nodes_are_not_forwarded():
+    graph = FakeGraph([
+        model_event("on_chat_model_stream", "judge", {"chunk": SimpleNamespace(content="是")}),
+    ])
+    events = collect(graph, answer_nodes=("chat_bot",))
+    assert [event["event"] for event in events] == ["done"]
+
+
+def test_answer_nodes_exist_in_study6_graph():
+    source = next((ROOT / "学习记录").glob("Langgraph学习6*.py")).read_text(encoding="utf-8")
+    nodes = set(re.findall(r'add_node\("(\w+)"', source))
+    assert set(ANSWER_NODES) <= nodes
@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+
+class FakeStream:
+    def __init__(self, urls):
+        self.id = "stream-1"
+        self.urls = urls
+        self.sealed = False
+
+    def seal(self):
+        self.sealed = True
+
+
+class FakeSearchTool:
+    """按查询返回固定结果的搜索工具，结果是异常时抛出"""
+
+    def __init__(self, results):
+        self.results = results
+
+    async def ainvoke(self, args):
+        result = self.results[args["query"]]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def _search_state(*queries):
+    tool_calls = [{"name": "search_tool", "args": {"query": query}, "id": f"call-{i}"} for i, query in enumerate(queries)]
+    return {"messages": [HumanMessage(content="问题"), AIMessage(content="", tool_calls=tool_calls)]}
+
+
+@pytest.fixture
+def pipeline(web_agent, monkeypatch):
+    stream = FakeStream(["https://a.com/x"])
+    cancelled = []
+    monkeypatch.setattr(web_agent, "STREAM_CRAWL", True)
+    monkeypatch.setattr(web_agent, "PIPELINE_CRAWL", True)
+    monkeypatch.setattr(web_agent, "start_page_stream", lambda **kwargs: stream)
+    monkeypatch.setattr(web_agent, "cancel_page_stream", cancelled.append)
+    return stream, cancelled
+
+
+def test_stream_id_on_every_search_message(web_agent, pipeline, monkeypatch):
+    monkeypatch.setattr(web_agent, "tools_by_name", {"search_tool": FakeSearchTool({
+        "q1": [{"url": "https://a.com/x", "title": "A", "content": "a"}],
+        "q2": [],
+    })})
+    messages = asyncio.run(web_agent.search_tool_node(_search_state("q1", "q2")))["messages"]
+    assert messages[-1].content == []
+    assert all(msg.artifact["page_stream"] == "stream-1" for msg in messages)
+    state = _search_state("q1", "q2")["messages"] + messages
+    assert web_agent.search_page_stream(state) == "stream-1"
+
+
+def test_search_failure_cancels_stream(web_agent, pipeline, monkeypatch):
+    stream, cancelled = pipeline
+    monkeypatch.setattr(web_agent, "tools_by_name", {"search_tool": FakeSearchTool({"q1": RuntimeError("boom")})})
+    with pytest.raises(RuntimeError):
+        asyncio.run(web_agent.search_tool_node(_search_state("q1")))
+    assert cancelled == ["stream-1"]
+    assert stream.sealed
+
+
+def test_snippet_fast_path_cancels_stream_when_last_search_is_empty(web_agent, pipeline):
+    _, cancelled = pipeline
+    messages = _search_state("q1", "q2")["messages"] + [
+        ToolMessage(content=["https://a.com/x"], tool_call_id="call-0", artifact={
+            "snippets": [{"url": "https://a.com/x", "title": "A", "content": "a"}],
+        }),
+        # 结果流的id只在内容为空的那条上，也要能找到
+        ToolMessage(content=[], tool_call_id="call-1", artifact={
+            "snippets": [], "page_stream": "stream-1", "urls": ["https://a.com/x"],
+        }),
+    ]
+    results = asyncio.run(web_agent.collect_crawl_results(messages))
+    assert cancelled == ["stream-1"]
+    assert [page["url"] for page in results["pages"]] == ["https://a.com/x"]
@@ -0,0 +1,168 @@
+"""
+异步搜索层：每个搜索服务商一个共享的HTTP客户端
+
+原来每次搜索都新建一个TavilySearchResults/DuckDuckGoSearchResults并同步调用invoke，
+在async节点里会阻塞整个事件循环。这里改为：
+1. Tavily直接用共享的httpx.AsyncClient请求搜索接口，连接复用
+2. DuckDuckGo复用同一个DDGS实例（内部有连接池），放到有界线程池里执行，不阻塞事件循环
+3. 返回结果的格式与原来的LangChain工具保持一致（Tavily为url/content，DuckDuckGo为link/snippet）
+"""
+
+import os
+import asyncio
+import httpx
+from blocking import run_blocking
+from search_cache import get_search_cache
+from resilience import get_upstream
+
+TAVILY_SEARCH_URL = "https://api.tavily.com/search"
+
+
+class TavilyAsyncClient:
+    """
+    Tavily搜索的异步客户端，进程内共享一个连接池
+
+    Args:
+        api_key: Tavily API密钥，默认读取TAVILY_API_KEY
+        timeout: 单次请求超时秒数
+        max_connections: 连接池最大连接数
+    """
+
+    name = "tavily"
+
+    def __init__(self, api_key: str = None, timeout: float = 20.0, max_connections: int = 20):
+        self.api_key = api_key or os.getenv('TAVILY_API_KEY', '')
+        self.search_url = os.getenv('TAVILY_SEARCH_URL', TAVILY_SEARCH_URL)
+        self._client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    async def search(self, query: str, max_results: int = 5) -> list[dict]:
+        """
+        执行一次搜索
+
+        Args:
+            query: 搜索查询
+            max_results: 最大结果数
+
+        Returns:
+            list[dict]: 搜索结果，每项包含title、url、content、score
+        """
+        if not self.api_key:
+            raise ValueError("未设置Tavily API密钥，无法使用Tavily搜索")
+        response = await self._client.post(
+            self.search_url,
+            json={"api_key": self.api_key, "query": query, "max_results": max_results},
+            headers={"Authorization": f"Bearer {self.api_key}"},
+        )
+        response.raise_for_status()
+        return [
+            {
+                "title": item.get("title", ""),
+                "url": item.get("url", ""),
+                "content": item.get("content", ""),
+                "score": item.get("score"),
+            }
+            for item in response.json().get("results", [])
+        ]
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+class DuckDuckGoAsyncClient:
+    """
+    DuckDuckGo搜索的异步封装
+
+    duckduckgo_search只提供同步接口，这里复用同一个DDGS实例并放到有界线程池里执行。
+    """
+
+    name = "duckduckgo"
+
+    def __init__(self, timeout: float = 20.0):
+        from duckduckgo_search import DDGS
+        self._ddgs = DDGS(timeout=int(timeout))
+
+    async def search(self, query: str, max_results: int = 5) -> list[dict]:
+        """
+        执行一次搜索
+
+        Args:
+            query: 搜索查询
+            max_results: 最大结果数
+
+        Returns:
+            list[dict]: 搜索结果，每项包含title、link、snippet（与DuckDuckGoSearchResults一致）
+        """
+        results = await run_blocking(self._ddgs.text, query, max_results=max_results)
+        return [
+            {"snippet": item.get("body", ""), "title": item.get("title", ""), "link": item.get("href", "")}
+            for item in results or []
+        ]
+
+    async def aclose(self):
+        pass
+
+
+SEARCH_CLIENTS = {
+    "tavily": TavilyAsyncClient,
+    "duckduckgo": DuckDuckGoAsyncClient,
+}
+
+# 每个服务商一个共享客户端；httpx的连接绑定在事件循环上，换了循环就重建
+_clients = {}
+_clients_loop = None
+
+
+def get_search_client(provider: str):
+    """
+    获取服务商对应的共享搜索客户端
+
+    Args:
+        provider: 搜索服务商，"tavily" 或 "duckduckgo"
+
+    Returns:
+        TavilyAsyncClient | DuckDuckGoAsyncClient: 共享的客户端
+    """
+    global _clients, _clients_loop
+    provider = provider.lower()
+    if provider not in SEARCH_CLIENTS:
+        raise ValueError(f"不支持的搜索工具类型: {provider}")
+    loop = asyncio.get_running_loop()
+    if _clients_loop is not loop:
+        _clients, _clients_loop = {}, loop
+    if provider not in _clients:
+        _clients[provider] = SEARCH_CLIENTS[provider]()
+    return _clients[provider]
+
+
+async def asearch(query: str, provider: str = "tavily", max_results: int = 5, use_cache: bool = True) -> list[dict]:
+    """
+    用共享客户端异步搜索，默认先查搜索缓存
+
+    Args:
+        query: 搜索查询
+        provider: 搜索服务商，"tavily" 或 "duckduckgo"
+        max_results: 最大结果数
+        use_cache: 是否使用搜索缓存
+
+    Returns:
+        list[dict]: 搜索结果
+    """
+    client = get_search_client(provider)
+    # 限流、重试和熔断按服务商区分，所有会话共享
+    upstream = get_upstream(provider.lower())
+    fetch = lambda: upstream.call(client.search, query, max_results=max_results)
+    if not use_cache:
+        return await fetch()
+    results, _ = await get_search_cache().get_or_fetch(provider, query, max_results, fetch)
+    return results
+
+
+async def close_search_clients():
+    """关闭所有共享的搜索客户端，程序退出前调用"""
+    global _clients
+    clients, _clients = _clients, {}
+    for client in clients.values():
+        await client.aclose()
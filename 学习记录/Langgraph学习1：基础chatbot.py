@@ -20,7 +20,7 @@ llm = ChatOpenAI(
     #THUDM/glm-4-9b-chat
     #Qwen/Qwen2.5-7B-Instruct
     model="THUDM/glm-4-9b-chat",
-    streaming=False,  # 启用流式输出
+    streaming=True,  # 启用流式输出，ainvoke时也会逐token产生流式事件
     api_key=os.getenv('SILICONFLOW_API_KEY', ''), 
     base_url=os.getenv('SILICONFLOW_BASE_URL', ''),
     temperature=0.1,
@@ -88,7 +88,8 @@ async def run_streaming_chain():
         if isinstance(event, tuple):
             chunk: AIMessageChunk = event[0]
             if chunk.type == 'AIMessageChunk':
-                print('event里监听到的流式输出------>',chunk.content,'\n\n')
+                # 每个chunk是模型新生成的一小段文本，收到就输出
+                print(chunk.content, end='', flush=True)
     
     # print("\n回复完成")
     
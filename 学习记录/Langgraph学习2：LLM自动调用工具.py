@@ -10,6 +10,13 @@ from langgraph.prebuilt import ToolNode
 import asyncio
 from langchain_core.runnables.graph import MermaidDrawMethod
 from langchain_core.utils.function_calling import convert_to_openai_function
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from structured_logging import get_logger, describe_state, preview
+
+logger = get_logger("study2")
 
 # 百度千帆的调用方式
 # llm = QianfanChatEndpoint(
@@ -24,7 +31,7 @@ llm = ChatOpenAI(
     #THUDM/glm-4-9b-chat
     #Qwen/Qwen2.5-7B-Instruct
     model="THUDM/glm-4-9b-chat",
-    streaming=False,  # 启用流式输出
+    streaming=True,  # 启用流式输出，ainvoke时也会逐token产生流式事件
     api_key=os.getenv('SILICONFLOW_API_KEY', ''), 
     base_url=os.getenv('SILICONFLOW_BASE_URL', ''),
     temperature=0.1,
@@ -58,11 +65,11 @@ async def chat_bot(state: MessagesState):
 
 # 4.定义边的逻辑判断（条件边），判断是否继续
 def tool_router(state: MessagesState) -> Literal["tools", "__end__"]: #Literal用于限制返回的值的可选值
-    print('state------>',state,'\n')
     messages = state['messages']
     last_message = messages[-1]
-    print('last_message------>',last_message,'\n')
-    print('last_message.tool_calls------>',last_message.tool_calls,'\n')
+    # 只在DEBUG级别输出state摘要，默认级别下参数不会被格式化
+    logger.debug("tool_router state: %s", describe_state(state))
+    logger.debug("tool_router tool_calls: %s", preview(last_message.tool_calls))
     if last_message.tool_calls: #判断models是否返回tools调用，有则告诉调用tools节点，否则结束
         return "tools"
     return END
@@ -129,7 +136,8 @@ async def run_streaming_chain():
         if isinstance(event, tuple):
             chunk: AIMessageChunk = event[0]
             if chunk.type == 'AIMessageChunk':
-                print('event里监听到的流式输出------>',chunk.content,'\n\n')
+                # 每个chunk是模型新生成的一小段文本，收到就输出
+                print(chunk.content, end='', flush=True)
     
     # print("\n回复完成")
     
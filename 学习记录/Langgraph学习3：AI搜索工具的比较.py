@@ -9,11 +9,18 @@
 """
 
 import os
+import sys
 import time
-import json
+from concurrent.futures import ThreadPoolExecutor
 from langchain_community.tools.tavily_search import TavilySearchResults
 from langchain_community.tools.ddg_search.tool import DuckDuckGoSearchResults
 
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from search_cache import get_search_cache
+from search_engine import normalize_results, canonical_url
+from resilience import get_upstream
+
 # 设置Tavily API密钥（如果存在）
 tavily_api_key = os.getenv('TAVILY_API_KEY', '')
 if tavily_api_key:
@@ -33,28 +40,17 @@ def format_results(results, tool_name):
     """
     formatted_output = f"{tool_name} 搜索结果:\n"
     
-    # 如果结果是字符串，尝试解析JSON
-    if isinstance(results, str) and tool_name == "DuckDuckGo":
-        try:
-            parsed_results = json.loads(results)
-            results = parsed_results
-        except:
+    # 统一格式：DuckDuckGo的link/snippet和JSON字符串形式的结果在normalize_results里处理
+    items = normalize_results(results, tool_name.lower())
+    if not items:
+        if isinstance(results, str):
             return formatted_output + results
+        return formatted_output + "无法解析搜索结果格式\n"
     
-    # 根据不同的工具格式化结果
-    if tool_name == "Tavily":
-        for i, result in enumerate(results, 1):
-            formatted_output += f"{i}. 标题: {result.get('title', 'N/A')}\n"
-            formatted_output += f"   链接: {result.get('url', 'N/A')}\n"
-            formatted_output += f"   内容: {result.get('content', 'N/A')[:150]}...\n\n"
-    else:  # DuckDuckGo
-        if isinstance(results, list):
-            for i, result in enumerate(results, 1):
-                formatted_output += f"{i}. 标题: {result.get('title', 'N/A')}\n"
-                formatted_output += f"   链接: {result.get('link', 'N/A')}\n" 
-                formatted_output += f"   摘要: {result.get('snippet', 'N/A')}\n\n"
-        else:
-            formatted_output += "无法解析搜索结果格式\n"
+    for i, result in enumerate(items, 1):
+        formatted_output += f"{i}. 标题: {result['title'] or 'N/A'}\n"
+        formatted_output += f"   链接: {result['url']}\n"
+        formatted_output += f"   内容: {result['content'][:150]}...\n\n"
             
     return formatted_output
 
@@ -95,8 +91,12 @@ def search_with_tool(query, tool_type, max_results):
         # 计时开始
         start_time = time.time()
         
-        # 调用搜索工具
-        results = search_tool.invoke({"query": query})
+        # 调用搜索工具，相同查询优先使用缓存结果；未命中时经过限流、重试和熔断再请求
+        upstream = get_upstream(tool_type.lower())
+        results, from_cache = get_search_cache().get_or_fetch_sync(
+            tool_type.lower(), query, max_results,
+            lambda: upstream.call_sync(search_tool.invoke, {"query": query}),
+        )
         
         # 计时结束
         end_time = time.time()
@@ -121,7 +121,8 @@ def search_with_tool(query, tool_type, max_results):
             "results": results,
             "formatted_results": formatted_results,
             "tool_name": tool_name,
-            "search_time": search_time
+            "search_time": search_time,
+            "from_cache": from_cache
         }
         
     except Exception as e:
@@ -145,13 +146,13 @@ def compare_search_tools(query, max_results=3):
     print(f"搜索查询: '{query}'")
     print("=" * 60)
     
-    # 使用DuckDuckGo搜索
-    print("\n[1] 使用DuckDuckGo搜索...")
-    ddg_result = search_with_tool(query, "duckduckgo", max_results)
-    
-    # 使用Tavily搜索 (如果有API密钥)
-    print("\n[2] 使用Tavily搜索...")
-    tavily_result = search_with_tool(query, "tavily", max_results)
+    # 两个搜索工具同时查询，总耗时取决于较慢的一个，而不是两者之和
+    print("\n同时使用DuckDuckGo和Tavily搜索...")
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        ddg_future = executor.submit(search_with_tool, query, "duckduckgo", max_results)
+        tavily_future = executor.submit(search_with_tool, query, "tavily", max_results)
+        ddg_result = ddg_future.result()
+        tavily_result = tavily_future.result()
     
     # 打印结果比较
     print("\n" + "=" * 60)
@@ -160,14 +161,16 @@ def compare_search_tools(query, max_results=3):
     
     # DuckDuckGo结果
     if ddg_result["success"]:
-        print(f"\nDuckDuckGo 搜索时间: {ddg_result.get('search_time', 'N/A'):.2f} 秒")
+        cache_note = "（缓存命中）" if ddg_result.get("from_cache") else ""
+        print(f"\nDuckDuckGo 搜索时间: {ddg_result.get('search_time', 'N/A'):.2f} 秒{cache_note}")
         print(ddg_result["formatted_results"])
     else:
         print(f"\nDuckDuckGo 搜索失败: {ddg_result['message']}")
     
     # Tavily结果
     if tavily_result["success"]:
-        print(f"\nTavily 搜索时间: {tavily_result.get('search_time', 'N/A'):.2f} 秒")
+        cache_note = "（缓存命中）" if tavily_result.get("from_cache") else ""
+        print(f"\nTavily 搜索时间: {tavily_result.get('search_time', 'N/A'):.2f} 秒{cache_note}")
         print(tavily_result["formatted_results"])
     else:
         print(f"\nTavily 搜索失败: {tavily_result['message']}")
@@ -182,20 +185,18 @@ def compare_search_tools(query, max_results=3):
         ddg_results = ddg_result["results"]
         tavily_results = tavily_result["results"]
         
-        # 处理DuckDuckGo的结果数量
-        if isinstance(ddg_results, str):
-            try:
-                import json
-                ddg_results = json.loads(ddg_results)
-            except:
-                ddg_results = []
-                
-        ddg_count = len(ddg_results) if isinstance(ddg_results, list) else 0
-        tavily_count = len(tavily_results)
+        ddg_items = normalize_results(ddg_results, "duckduckgo")
+        tavily_items = normalize_results(tavily_results, "tavily")
+        ddg_count = len(ddg_items)
+        tavily_count = len(tavily_items)
         
         print(f"DuckDuckGo 返回结果数量: {ddg_count}")
         print(f"Tavily 返回结果数量: {tavily_count}")
         
+        # 比较结果重合度
+        common = {canonical_url(item["url"]) for item in ddg_items} & {canonical_url(item["url"]) for item in tavily_items}
+        print(f"两者共同返回的链接数量: {len(common)}")
+        
         # 比较响应时间
         if "search_time" in ddg_result and "search_time" in tavily_result:
             ddg_time = ddg_result["search_time"]
@@ -217,9 +218,11 @@ def main():
     for query in queries:
         compare_search_tools(query)
         print("\n\n" + "=" * 70 + "\n")
-        
-        # 暂停一下，避免搜索频率过高
-        time.sleep(2)
+        # 不再固定暂停：每个服务商的请求频率由令牌桶控制（RATE_LIMIT_DUCKDUCKGO等），
+        # 遇到429时按Retry-After退避重试
+
+    # 搜索缓存统计
+    print("搜索缓存统计:", get_search_cache().get_stats())
 
 
 if __name__ == "__main__":
@@ -13,19 +13,34 @@ from langchain_core.utils.function_calling import convert_to_openai_function
 from langchain_core.runnables.graph import MermaidDrawMethod
 from langchain_core.messages import ToolMessage
 from langchain_core.tools import tool
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from web_search import asearch, close_search_clients
+from streaming import astream_message
+from instrumentation import instrument_events, write_metrics, shutdown_tracing
+from structured_logging import get_logger, describe_state, preview
+
+logger = get_logger("study4")
 
 # 创建图构建器
 graph_builder = StateGraph(MessagesState)
 
 os.environ['TAVILY_API_KEY'] = os.getenv('TAVILY_API_KEY', '')
+# 搜索服务商，"duckduckgo" 或 "tavily"
+SEARCH_PROVIDER = os.getenv('SEARCH_PROVIDER', 'duckduckgo')
+# 模型流式输出：逐token返回，设为0时一次性返回完整结果
+LLM_STREAMING = os.getenv('LLM_STREAMING', '1') == '1'
 
 # 创建工具
 @tool
-def search(query: str):
+async def search(query: str):
     """用于浏览网络进行搜索。"""
+    # 复用共享的DuckDuckGo客户端，异步执行，不阻塞事件循环
     # search_tool = TavilySearchResults(max_results=3)
-    search_tool = DuckDuckGoSearchResults(num_results=3, output_format="list") # output_format="list"
-    return search_tool.invoke(query)
+    # search_tool = DuckDuckGoSearchResults(num_results=3, output_format="list") # output_format="list"
+    return await asearch(query, provider=SEARCH_PROVIDER, max_results=3)
 tools = [search]
 
 # llm = QianfanChatEndpoint(
@@ -38,7 +53,9 @@ llm = ChatOpenAI(
     #THUDM/glm-4-9b-chat
     #Qwen/Qwen2.5-7B-Instruct
     model="Qwen/Qwen2.5-7B-Instruct",
-    streaming=False,  # 启用流式输出
+    streaming=LLM_STREAMING,  # 启用流式输出
+    stream_usage=True,  # 流式输出时也返回token用量，供指标统计
+    max_retries=0,  # 重试由resilience统一处理（限流、Retry-After、熔断）
     api_key=os.getenv('SILICONFLOW_API_KEY', ''), 
     base_url=os.getenv('SILICONFLOW_BASE_URL', ''),
     temperature=0.1,
@@ -50,29 +67,32 @@ functions = [convert_to_openai_function(t) for t in tools]
 
 tools_by_name = {tool.name: tool for tool in tools}
 
-# 定义工具节点函数
-def search_tool_node(state: dict):
-    result = []
-    for tool_call in state["messages"][-1].tool_calls:
+# 定义工具节点函数，多个工具调用并发执行
+async def search_tool_node(state: dict):
+    async def run_tool(tool_call):
         tool = tools_by_name[tool_call["name"]]
-        observation = tool.invoke(tool_call["args"])
-        print('工具搜索结果的完整输出------>',observation,'\n')
+        observation = await tool.ainvoke(tool_call["args"])
+        logger.debug("搜索结果: %s", preview(observation))
         # 直接转为字符串
         search_result = str(observation)
-        result.append(ToolMessage(content=search_result, tool_call_id=tool_call["id"]))
-    return {"messages": result}
+        return ToolMessage(content=search_result, tool_call_id=tool_call["id"])
+
+    result = await asyncio.gather(*(run_tool(tool_call) for tool_call in state["messages"][-1].tool_calls))
+    return {"messages": list(result)}
 
 # 定义流式节点函数
 async def chatbot_stream(state: MessagesState):
     """生成流式回复的节点函数"""
-    print('chatbot_stream收到的完整输入------>',state,'\n')
+    logger.debug("chatbot_stream输入: %s", describe_state(state))
     messages = state["messages"]
     # streamed_output = []
     # tool_calls_detected = []  # 新增：保存检测到的工具调用
     
-    # 使用非流式方式接收完整返回
-    response = llm_with_tools.invoke(
+    # 流式接收：文本token实时产生on_chat_model_stream事件，工具调用参数边收边拼接
+    response = await astream_message(
+        llm_with_tools,
         messages,
+        stream=LLM_STREAMING,
         functions=functions,
         function_call="auto"
     )
@@ -163,7 +183,9 @@ async def run_demo():
     on_chat_model_stream_list = []
     try:
         # 异步执行流式输出
-        async for event in graph.astream_events(initial_state, config={"configurable": {"thread_id": "1"}}, version="v2"):
+        events = graph.astream_events(initial_state, config={"configurable": {"thread_id": "1"}}, version="v2")
+        # 事件流同时交给instrumentation记录节点耗时、token数等指标
+        async for event in instrument_events(events, graph_name="study4"):
             # 定义一个变量接收所有on_chat_model_stream的值
             # print('event------>',event,'\n\n')
             event_type = event['event']
@@ -172,10 +194,15 @@ async def run_demo():
             elif event_type == 'on_tool_end' and event['data']:
                 print('工具查询结束',event['data'],'\n\n')
             elif event_type == 'on_chat_model_stream':
-                print('on_chat_model_stream事件------>',event["data"]["chunk"].content,'\n\n')
+                print(event["data"]["chunk"].content, end='', flush=True)
                 on_chat_model_stream_list.append(event["data"]["chunk"].content)
     except Exception as e:
         print(f"graph.astream_events执行出错: {e}")
+    finally:
+        await close_search_clients()
+        if os.getenv('METRICS_FILE'):
+            write_metrics(os.getenv('METRICS_FILE'))
+        shutdown_tracing()
     
     print("\n生成完成！","".join(on_chat_model_stream_list),'\n\n')
     # 展示图形
@@ -1,7 +1,12 @@
-from crawl4ai import AsyncWebCrawler, CrawlerRunConfig, CacheMode, BrowserConfig
+from crawl4ai import CrawlerRunConfig, CacheMode
 import os
+import sys
 import asyncio
-from datetime import datetime
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from crawler_pool import get_crawler_pool, shutdown_crawler_pool
+from page_store import get_page_store, close_page_store
 
 urls = [
     "https://www.huangli.com/huangli/2025/04_12.html",
@@ -13,12 +18,8 @@ async def quick_crawl_tool(urls: list[str]):
     print('urls------>',urls)
     
 
-    # 浏览器配置
-    browser_config = BrowserConfig(
-        headless=True,  # 启用无头模式
-        user_agent_mode="random", # 随机生成user_agent
-        text_mode=True, # 只返回文本内容
-    )
+    # 浏览器配置（headless、随机user_agent、text_mode）见crawler_pool.default_browser_config，
+    # 浏览器从进程内共享的浏览器池借出，不再每次调用都冷启动
 
     # 爬虫配置
     run_conf = CrawlerRunConfig(
@@ -31,39 +32,44 @@ async def quick_crawl_tool(urls: list[str]):
         exclude_external_images=True, # 是否排除外部图片
     )
 
-    async with AsyncWebCrawler(config=browser_config) as crawler:
+    # 之前每次爬取都写一个新的crawl_results_{timestamp}.md，文件只写不读；
+    # 现在爬取结果保存到按内容寻址的网页存储，最近抓取过的URL直接从存储读取
+    store = get_page_store()
+    search_results = ''
+    crawl_urls = []
+    for url in urls:
+        page = await store.get(url)
+        if page:
+            search_results += f"{page['markdown']}\n\n"
+        else:
+            crawl_urls.append(url)
+    if not crawl_urls:
+        return search_results
+
+    pool = await get_crawler_pool()
+    async with pool.acquire(pages=len(crawl_urls)) as crawler:
         # 或者一次性获取所有结果(默认行为)
-        results = await crawler.arun_many(urls, config=run_conf)
+        results = await crawler.arun_many(crawl_urls, config=run_conf)
         
-        # 获取当前工作目录
-        current_dir = os.getcwd()
-        print('current_dir------>',current_dir)
+        async for res in results:
+            if res.success:
+                print(f"[OK] {res.url}, length: {len(res.markdown.raw_markdown)}")
+                # 放进网页存储的写入队列，后台批量落盘
+                await store.put({"url": res.url, "success": True, "markdown": res.markdown.raw_markdown})
+                search_results += f"{res.markdown.raw_markdown}\n\n"
+            else:
+                print(f"[ERROR] {res.url} => {res.error_message}")
         
-        # 生成文件名 (使用时间戳确保唯一性)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_file = os.path.join(current_dir, f"crawl_results_{timestamp}.md")
-        
-        search_results = ''
-        # 创建或打开文件用于写入
-        with open(output_file, 'w', encoding='utf-8') as f:
-           async for res in results:
-                if res.success:
-                    print(f"[OK] {res.url}, length: {len(res.markdown.raw_markdown)}")
-                    # 写入URL和内容到文件
-                    f.write(f"# URL: {res.url}\n\n")
-                    f.write(f"{res.markdown.raw_markdown}\n\n")
-                    f.write("---\n\n")  # 分隔符
-                    search_results += f"{res.markdown.raw_markdown}\n\n"
-                else:
-                    print(f"[ERROR] {res.url} => {res.error_message}")
-                    # 写入错误信息到文件
-                    f.write(f"# ERROR URL: {res.url}\n")
-                    f.write(f"Error: {res.error_message}\n\n")
-                    f.write("---\n\n")
-        
-        print(f"所有结果已保存到文件: {output_file}")
         return search_results
 
+async def _debug():
+    try:
+        await quick_crawl_tool(urls)
+    finally:
+        # 关闭浏览器池，避免残留浏览器进程；把网页存储里没落盘的写完
+        await shutdown_crawler_pool()
+        await close_page_store()
+
 # 单独调试时打开注释
 # if __name__ == "__main__":
-#    asyncio.run(quick_crawl_tool(urls))
\ No newline at end of file
+#    asyncio.run(_debug())
\ No newline at end of file
@@ -3,7 +3,10 @@ import os
 import sys
 from dotenv import load_dotenv
 load_dotenv()
+import time
 import asyncio
+import uuid
+import contextvars
 from langchain_openai import ChatOpenAI
 from langchain_community.chat_models import QianfanChatEndpoint
 from langchain_community.tools.tavily_search import TavilySearchResults
@@ -14,30 +17,106 @@ from langchain_core.utils.function_calling import convert_to_openai_function
 from langchain_core.runnables.graph import MermaidDrawMethod
 from langchain_core.messages import ToolMessage
 from langchain_core.tools import tool
+from langchain_core.callbacks.manager import adispatch_custom_event
 
 # 添加项目根目录到Python路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from crawl_tool import quick_crawl_tool
+from crawl_tool import quick_crawl_tool, start_page_stream, get_page_stream, release_page_stream, cancel_page_stream, collect_pages, format_dropped_urls, format_failed_documents, DROPPED_URLS_HEADER, FAILED_DOCUMENTS_HEADER
+from context_packer import pack_context, split_chunks
+from page_dedup import PAGE_DEDUP, new_deduper
+from blocking import run_blocking
+from crawler_pool import shutdown_crawler_pool
+from crawl_scheduler import close_crawl_scheduler
+from page_store import close_page_store
+from web_search import close_search_clients
+from search_engine import get_search_engine
+from snippet_router import get_snippet_router
+from pre_router import get_pre_router
+from local_index import LOCAL_INDEX, get_local_index, close_local_index
+from session_memory import open_checkpointer, conversation_view, crawled_pages, compact_messages
+from streaming import astream_message, stream_answer
+from instrumentation import write_metrics, shutdown_tracing
+from structured_logging import get_logger, preview
+
+logger = get_logger("study6")
+
+# 模型流式输出：逐token返回，首个token的等待时间不再等于整段生成时间；设为0时一次性返回
+LLM_STREAMING = os.getenv('LLM_STREAMING', '1') == '1'
+# 流式抓取：爬取节点在后台开始爬取后立即返回，总结节点边收网页边推送进度，不等整批网页拼成一个大字符串
+STREAM_CRAWL = os.getenv('STREAM_CRAWL', '1') == '1'
+# 搜索和抓取流水线（需要STREAM_CRAWL）：每个搜索结果一返回就开始抓取它的网页，不等全部搜索结束
+PIPELINE_CRAWL = os.getenv('PIPELINE_CRAWL', '1') == '1'
+# 本地预路由：明显需要搜索的问题不等对话模型，直接发起搜索（规则和分类器见pre_router）
+PRE_ROUTER = os.getenv('PRE_ROUTER', '1') == '1'
+# 搜索摘要快速通道：摘要已经覆盖问题时跳过抓取，直接总结（阈值见snippet_router）
+SNIPPET_FAST_PATH = os.getenv('SNIPPET_FAST_PATH', '1') == '1'
+# 本地打分拿不准时用来判断摘要是否足够的小模型，空字符串表示不用模型
+SNIPPET_JUDGE_MODEL = os.getenv('SNIPPET_JUDGE_MODEL', '')
+# 本地索引：之前抓取过的网页里有足够新、覆盖问题的内容时，不搜索不抓取，直接用索引里的片段总结
+LOCAL_INDEX_MAX_AGE = float(os.getenv('LOCAL_INDEX_MAX_AGE', '1800'))
+LOCAL_INDEX_MIN_SCORE = float(os.getenv('LOCAL_INDEX_MIN_SCORE', '0.8'))
+LOCAL_INDEX_TOP_K = int(os.getenv('LOCAL_INDEX_TOP_K', '8'))
+# 至少收到几个网页后，总结就可以不再等待慢网页
+SUMMARY_MIN_PAGES = int(os.getenv('SUMMARY_MIN_PAGES', '1'))
+# 收到SUMMARY_MIN_PAGES个网页后，每个后续网页最多再等多少秒
+SUMMARY_STRAGGLER_WAIT = float(os.getenv('SUMMARY_STRAGGLER_WAIT', '5'))
+# 整批网页的抓取时间预算（秒），到时只返回已完成的网页，0表示不限制
+CRAWL_DEADLINE = float(os.getenv('CRAWL_DEADLINE', '30')) or None
+# 单个网页的抓取超时（秒）
+CRAWL_URL_TIMEOUT = float(os.getenv('CRAWL_URL_TIMEOUT', '15'))
+# 单个网页超过多少秒未返回时，再发一次对冲请求，0表示不对冲
+CRAWL_HEDGE_AFTER = float(os.getenv('CRAWL_HEDGE_AFTER', '8')) or None
+CRAWL_OPTIONS = {
+    "deadline": CRAWL_DEADLINE,
+    "per_url_timeout": CRAWL_URL_TIMEOUT,
+    "hedge_after": CRAWL_HEDGE_AFTER,
+}
+# 上下文打包：只把与问题最相关的网页片段发给总结模型
+SUMMARY_PACK_CONTEXT = os.getenv('SUMMARY_PACK_CONTEXT', '1') == '1'
+# 发给总结模型的网页内容的token预算
+SUMMARY_TOKEN_BUDGET = int(os.getenv('SUMMARY_TOKEN_BUDGET', '6000'))
+# 总结方式："single" 把所有网页内容一次发给总结模型；"map_reduce" 先逐个网页提取要点再合并
+SUMMARY_MODE = os.getenv('SUMMARY_MODE', 'single')
+# map阶段同时进行的模型调用数
+MAP_CONCURRENCY = int(os.getenv('MAP_CONCURRENCY', '4'))
+# map阶段每个网页发给模型的token预算
+MAP_TOKEN_BUDGET = int(os.getenv('MAP_TOKEN_BUDGET', '2000'))
+# 会话记忆的裁剪策略：保留完整工具结果的最近轮数、最多保留的轮数、保留的网页原文总字数上限
+MEMORY_KEEP_TURNS = int(os.getenv('MEMORY_KEEP_TURNS', '2'))
+MEMORY_MAX_TURNS = int(os.getenv('MEMORY_MAX_TURNS', '20'))
+MEMORY_MAX_PAGE_CHARS = int(os.getenv('MEMORY_MAX_PAGE_CHARS', '200000'))
 
 # 创建图构建器
 graph_builder = StateGraph(MessagesState)
 
 os.environ['TAVILY_API_KEY'] = os.getenv('TAVILY_API_KEY', '')
 
+# 搜索和抓取流水线：搜索节点把结果流放在这里，search_tool拿到结果后立即把URL加入抓取
+pipeline_stream = contextvars.ContextVar("pipeline_stream", default=None)
+
 # 创建工具
 @tool
-def search_tool(query: str):
+async def search_tool(query: str):
     """用于浏览网络进行搜索。"""
-    search_tool = TavilySearchResults(max_results=1)
+    # 使用共享的异步HTTP客户端，不再每次新建TavilySearchResults并同步调用
+    # search_tool = TavilySearchResults(max_results=1)
     # search_tool = DuckDuckGoSearchResults(num_results=1, output_format="list") # output_format="list"
-    return search_tool.invoke(query)
+    # 多个服务商竞速或融合（SEARCH_PROVIDERS / SEARCH_MODE），结果统一为title/url/content格式
+    stream = pipeline_stream.get()
+    on_results = None
+    if stream is not None:
+        # 融合模式下每个服务商返回时各加入一次，URL在结果流里去重
+        async def on_results(results):
+            await stream.add_urls([item["url"] for item in results if item.get("url")])
+    return await get_search_engine().search(query, max_results=1, on_results=on_results)
 
 @tool
 async def crawl4ai_tool(query: list[str]):
     """用于爬取网页内容。接收URL列表，返回对应网页的内容。"""
-    print('crawl4ai_tool收到的完整输入------>',query,'\n')
+    logger.debug("crawl4ai_tool输入: %s", preview(query))
     urls = query
-    result = await quick_crawl_tool(urls)
+    # 浏览器从共享浏览器池借出，多次调用不会重复冷启动
+    result = await quick_crawl_tool(urls, **CRAWL_OPTIONS)
     return {"result": result}
 
 tools = [search_tool, crawl4ai_tool]
@@ -47,7 +126,9 @@ llm = ChatOpenAI(
     #THUDM/glm-4-9b-chat
     #Qwen/Qwen2.5-7B-Instruct
     model="Qwen/Qwen2.5-7B-Instruct",
-    streaming=False,  # 启用流式输出
+    streaming=LLM_STREAMING,  # 启用流式输出
+    stream_usage=True,  # 流式输出时也返回token用量，供指标统计
+    max_retries=0,  # 重试由resilience统一处理（限流、Retry-After、熔断），不在客户端里再重试
     api_key=os.getenv('SILICONFLOW_API_KEY', ''), 
     base_url=os.getenv('SILICONFLOW_BASE_URL', ''),
     temperature=0.1,
@@ -57,12 +138,35 @@ llm_with_tools = llm.bind_tools(tools)
 # 创建总结llm，需要使用支持FunctionCalling的模型
 summary_llm = ChatOpenAI(
     model="THUDM/glm-4-9b-chat",
-    streaming=False,
+    streaming=LLM_STREAMING,
+    stream_usage=True,
+    max_retries=0,
     api_key=os.getenv('SILICONFLOW_API_KEY', ''), 
     base_url=os.getenv('SILICONFLOW_BASE_URL', ''),
     temperature=0.1,
 )
 
+# 备选模型：主模型熔断或重试用尽时切换，设为空字符串表示不切换
+LLM_FALLBACK_MODEL = os.getenv('LLM_FALLBACK_MODEL', 'THUDM/glm-4-9b-chat')
+SUMMARY_FALLBACK_MODEL = os.getenv('SUMMARY_FALLBACK_MODEL', 'Qwen/Qwen2.5-7B-Instruct')
+
+def build_fallback_llm(model: str):
+    """创建与主模型参数相同的备选模型"""
+    return ChatOpenAI(
+        model=model,
+        streaming=LLM_STREAMING,
+        stream_usage=True,
+        max_retries=0,
+        api_key=os.getenv('SILICONFLOW_API_KEY', ''),
+        base_url=os.getenv('SILICONFLOW_BASE_URL', ''),
+        temperature=0.1,
+    )
+
+llm_fallbacks = (build_fallback_llm(LLM_FALLBACK_MODEL).bind_tools(tools),) if LLM_FALLBACK_MODEL else ()
+summary_fallbacks = (build_fallback_llm(SUMMARY_FALLBACK_MODEL),) if SUMMARY_FALLBACK_MODEL else ()
+# 摘要判断的调用打上标签，和回答的模型调用区分开
+snippet_judge_llm = build_fallback_llm(SNIPPET_JUDGE_MODEL).with_config(tags=["snippet_judge"]) if SNIPPET_JUDGE_MODEL else None
+
 # 创建工具列表的函数版本
 functions = [convert_to_openai_function(t) for t in tools]
 
@@ -70,23 +174,64 @@ tools_by_name = {tool.name: tool for tool in tools}
 
 # 定义搜索工具节点函数
 async def search_tool_node(state: dict):
-    """搜索工具节点"""
-    result = []
-    for tool_call in state["messages"][-1].tool_calls:
-        if tool_call["name"] == "search_tool":
-            tool = tools_by_name[tool_call["name"]]
-            observation = tool.invoke(tool_call["args"])
-            print('搜索工具结果的完整输出------>',observation,'\n')
+    """
+    搜索工具节点，多个搜索调用并发执行
+
+    流水线模式下先开一个开放的抓取结果流，每个搜索调用（融合模式下每个服务商）一返回，
+    它的URL就加入抓取；这一轮的每条ToolMessage都带上结果流的id，爬取节点和总结节点直接沿用
+    """
+    stream = None
+    if STREAM_CRAWL and PIPELINE_CRAWL:
+        # 同一会话里之前已经抓取过的网页，直接复用状态里的内容
+        known = crawled_pages(state["messages"])
+        known_pages = [
+            {"url": url, "success": True, "markdown": markdown, "error": "", "dropped": False, "cached": True}
+            for url, markdown in known.items()
+        ]
+        stream = start_page_stream(known_pages=known_pages, open=True, **CRAWL_OPTIONS)
+
+    async def run_search(tool_call):
+        if stream is not None:
+            # gather为每个调用单独建任务，各自的上下文里设置结果流，不会互相影响
+            pipeline_stream.set(stream)
+        tool = tools_by_name[tool_call["name"]]
+        observation = await tool.ainvoke(tool_call["args"])
+        logger.debug("搜索结果: %s", preview(observation))
+        
+        if isinstance(observation, list):
+            # 如果是数组，直接提取每个对象的URL；摘要放在artifact里，供判断是否需要抓取
+            items = [item for item in observation if isinstance(item, dict)]
+            search_result = [item.get('url', '') for item in items]
+            snippets = [
+                {"title": item.get('title', ''), "url": item.get('url', ''), "content": item.get('content', '')}
+                for item in items
+            ]
+        else:
+            # 如果不是数组，将整个observation作为结果
+            search_result = str(observation)
+            snippets = []
             
-            if isinstance(observation, list):
-                # 如果是数组，直接提取每个对象的URL
-                urls = [item.get('url', '') for item in observation if isinstance(item, dict)]
-                search_result = urls
-            else:
-                # 如果不是数组，将整个observation作为结果
-                search_result = str(observation)
-                
-            result.append(ToolMessage(content=search_result, tool_call_id=tool_call["id"]))
+        return ToolMessage(content=search_result, tool_call_id=tool_call["id"], artifact={"snippets": snippets})
+
+    search_calls = [tool_call for tool_call in state["messages"][-1].tool_calls if tool_call["name"] == "search_tool"]
+    try:
+        result = list(await asyncio.gather(*(run_search(tool_call) for tool_call in search_calls)))
+    except BaseException:
+        # 搜索出错时没有节点会再读这个结果流，已经开始的抓取要取消掉
+        if stream is not None:
+            cancel_page_stream(stream.id)
+        raise
+    finally:
+        if stream is not None:
+            stream.seal()
+    if stream is not None:
+        if stream.urls:
+            # 最后一次搜索可能没有返回URL（content为空），每条都带上，读取时不依赖是哪一条
+            for msg in result:
+                msg.artifact = {**msg.artifact, "page_stream": stream.id, "urls": stream.urls}
+        else:
+            # 没有搜到URL，照旧交给爬取节点处理
+            release_page_stream(stream.id)
     return {"messages": result}
 
 # 爬取网页内容工具节点
@@ -94,40 +239,161 @@ async def crawl4ai_tool_node(state: MessagesState):
     """爬取网页内容工具节点"""
     last_message = state["messages"][-1]
     urls = last_message.content
+    artifact = getattr(last_message, 'artifact', None)
+    if isinstance(artifact, dict) and artifact.get("page_stream"):
+        # 流水线模式：搜索节点已经边搜索边开始抓取了所有搜索调用的URL，这里只把结果流交给总结节点
+        urls = artifact["urls"]
+        return {"messages": [ToolMessage(
+            content=f"正在抓取{len(urls)}个网页",
+            tool_call_id=last_message.id,
+            artifact={"page_stream": artifact["page_stream"], "urls": urls},
+        )]}
+
+    # 同一会话里之前已经抓取过的网页，直接复用状态里的内容
+    known = crawled_pages(state["messages"])
+
+    if STREAM_CRAWL and isinstance(urls, list):
+        # 流式模式：后台开始爬取，只把结果流的id交给总结节点
+        known_pages = [
+            {"url": url, "success": True, "markdown": known[url], "error": "", "dropped": False, "cached": True}
+            for url in urls if url in known
+        ]
+        stream = start_page_stream(urls, known_pages=known_pages, **CRAWL_OPTIONS)
+        return {"messages": [ToolMessage(
+            content=f"正在抓取{len(urls)}个网页",
+            tool_call_id=last_message.id,
+            artifact={"page_stream": stream.id, "urls": urls},
+        )]}
     
-    # 调用爬虫工具获取结果
-    tool_response = await crawl4ai_tool.ainvoke({"query": urls})
+    # 调用爬虫工具获取结果，已经抓取过的网页不再重复抓取
+    if isinstance(urls, list):
+        reused = "".join(f"{known[url]}\n\n" for url in urls if url in known)
+        urls = [url for url in urls if url not in known]
+    else:
+        reused = ""
+    result = ""
+    if urls:
+        start = time.perf_counter()
+        tool_response = await crawl4ai_tool.ainvoke({"query": urls})
+        result = tool_response.get('result', tool_response)
+        get_snippet_router().record_crawl(time.perf_counter() - start)
     
     messages = []
     # 创建ToolMessage并添加到列表
     messages.append(ToolMessage(
-        content=tool_response.get('result', tool_response), 
+        content=reused + result, 
         tool_call_id=last_message.id
     ))
     
     return {"messages": messages}
 
+async def pre_router_node(state: MessagesState):
+    """
+    本地预路由节点：有把握需要搜索时直接生成搜索工具调用，省掉一次对话模型调用；
+    拿不准时不改动状态，交给对话模型
+    """
+    if not PRE_ROUTER:
+        return {"messages": []}
+    messages = state["messages"]
+    last_message = messages[-1]
+    if not isinstance(last_message, HumanMessage) or not isinstance(last_message.content, str):
+        return {"messages": []}
+    has_history = sum(isinstance(msg, HumanMessage) for msg in messages) > 1
+    query = get_pre_router().decide(last_message.content, has_history=has_history)
+    if query is None:
+        return {"messages": []}
+    tool_call = {"name": "search_tool", "args": {"query": query}, "id": f"call_{uuid.uuid4().hex[:24]}"}
+    # 和对话模型决定调用工具时一样，对外产出tool_call事件
+    await adispatch_custom_event("tool_call", {"name": tool_call["name"], "args": tool_call["args"]})
+    return {"messages": [AIMessage(content="", tool_calls=[tool_call])]}
+
+def route_pre_router(state: MessagesState):
+    """
+    在条件边中使用，预路由已经生成搜索工具调用时直接搜索，否则交给对话模型
+    """
+    last_message = state['messages'][-1]
+    if isinstance(last_message, AIMessage) and last_message.tool_calls:
+        return "search_tool"
+    return "chat_bot"
+
+async def local_index_node(state: MessagesState):
+    """
+    本地索引节点：要搜索之前先查本地索引，最近抓取过的网页已经覆盖搜索词时，
+    为每个搜索工具调用直接返回工具消息（索引片段放在最后一条的artifact里），不改动时交给搜索节点
+    """
+    if not LOCAL_INDEX:
+        return {"messages": []}
+    last_message = state["messages"][-1]
+    search_calls = [tool_call for tool_call in last_message.tool_calls if tool_call["name"] == "search_tool"]
+    query = " ".join(tool_call["args"].get("query", "") for tool_call in search_calls)
+    if not query.strip():
+        return {"messages": []}
+    try:
+        pages = await get_local_index().lookup(
+            query, max_age=LOCAL_INDEX_MAX_AGE, min_score=LOCAL_INDEX_MIN_SCORE, top_k=LOCAL_INDEX_TOP_K
+        )
+    except Exception as e:
+        # 索引只是加速手段，读取出错时按未命中处理，照常搜索
+        logger.warning("本地索引查询失败，照常搜索: %s", e)
+        pages = []
+    if not pages:
+        return {"messages": []}
+    urls = [page["url"] for page in pages]
+    messages = [ToolMessage(content=urls, tool_call_id=tool_call["id"]) for tool_call in search_calls[:-1]]
+    messages.append(ToolMessage(content=urls, tool_call_id=search_calls[-1]["id"], artifact={"local_pages": pages}))
+    return {"messages": messages}
+
+def route_local_index(state: MessagesState):
+    """
+    在条件边中使用，本地索引命中时直接总结，否则照常搜索
+    """
+    artifact = getattr(state['messages'][-1], 'artifact', None)
+    if isinstance(artifact, dict) and artifact.get("local_pages"):
+        return "summary_bot"
+    return "search_tool"
+
 # 定义流式节点函数
 async def chatbot_node(state: MessagesState):
     """生成回复的节点函数"""
-    messages = state["messages"]
+    # 历史轮次只保留问题和最终回答，不把上一轮的工具消息和网页原文发给模型
+    messages = conversation_view(state["messages"])
     
-    # 使用非流式方式接收完整返回
-    response = await llm_with_tools.ainvoke(
+    # 流式接收：直接回答时token实时产生on_chat_model_stream事件，工具调用参数边收边拼接
+    response = await astream_message(
+        llm_with_tools,
         messages,
+        stream=LLM_STREAMING,
+        fallbacks=llm_fallbacks,
         functions=functions,
         function_call="auto"
     )
     return {"messages": [response]}
 
-# 总结bot节点
-async def summary_bot_node(state: MessagesState):
-    """总结网页内容的节点"""
-    messages = state["messages"]
-    
-    # 找出用户的原始问题
+# 总结模型的系统提示
+SUMMARY_SYSTEM_PROMPT = """
+        ## 你是一个擅长信息整理并总结的AI助手，请根据用户的问题，并结合工具给出的信息把回复总结出来。
+        - 如果有工具信息，正常执行总结；在线PDF等文档的文本已经提取出来（按页标注），和网页内容一样总结，引用时注明页码。
+        - 如果工具信息里提示文档无法提取（如超过大小上限、扫描件），请把文档的url输出出来，告知用户来源自行查看。
+        - 如果工具信息里列出了未纳入总结的网页，请在回答末尾列出这些链接，告知用户可自行查看。
+        - 如果发现工具没有返回信息，如【工具执行异常，无返回结果】，请根据用户的问题，给出简要回答，但必须带上说明，说明你无法生成详细总结的原因。并让用户再次自行尝试。
+        - 风格：排版按照markdown格式输出。热情，专业，有亲和力。
+    """
+
+async def collect_crawl_results(messages: list, on_page=None):
+    """
+    从消息里找出用户的原始问题和抓取结果；流式抓取时边到达边推送进度事件
+
+    Args:
+        messages: 图状态里的消息列表
+        on_page: 每收到一个网页时额外调用的异步回调（流式抓取时有效）
+
+    Returns:
+        dict: human_message、last_tool_message、pages（抓取成功、去重后的网页）、
+              dropped_note（提取失败的文档和未纳入的URL说明）、page_messages（每个网页一条ToolMessage）
+    """
+    # 找出用户的原始问题（多轮对话时为最近一轮的问题）
     human_messages = [msg for msg in messages if isinstance(msg, HumanMessage)]
-    human_message = human_messages[0] if human_messages else None
+    human_message = human_messages[-1] if human_messages else None
     
     # 找出最后一个工具消息（包含抓取的网页内容）
     tool_messages = [msg for msg in messages if isinstance(msg, ToolMessage)]
@@ -136,42 +402,295 @@ async def summary_bot_node(state: MessagesState):
         if msg.content:
             last_tool_message = msg
             break
+
+    page_messages = []
+    pages = []
+    dropped_note = ""
+    artifact = getattr(last_tool_message, 'artifact', None)
+    if isinstance(artifact, dict) and "local_pages" in artifact:
+        # 本地索引命中：没有搜索和抓取，用索引里相关的片段总结
+        pages = artifact["local_pages"]
+        for page in pages:
+            await adispatch_custom_event("crawl_page", {
+                "url": page["url"],
+                "success": True,
+                "length": len(page["markdown"]),
+                "error": "",
+                "cached": True,
+            })
+        return {
+            "human_message": human_message,
+            "last_tool_message": last_tool_message,
+            "pages": pages,
+            "dropped_note": "",
+            "page_messages": [],
+        }
+    if isinstance(artifact, dict) and "snippets" in artifact:
+        # 摘要快速通道：没有经过爬取节点，直接用这一轮所有搜索结果的摘要；流水线已经开始的抓取取消掉
+        stream_id = search_page_stream(messages)
+        if stream_id:
+            cancel_page_stream(stream_id)
+        pages = [
+            {"url": item["url"], "success": True, "markdown": f"## {item['title']}\n来源: {item['url']}\n\n{item['content']}"}
+            for item in search_snippets(messages) if item.get("content")
+        ]
+        return {
+            "human_message": human_message,
+            "last_tool_message": last_tool_message,
+            "pages": pages,
+            "dropped_note": "",
+            "page_messages": [],
+        }
+
+    if last_tool_message and isinstance(last_tool_message.content, str):
+        # 非流式抓取时，工具结果是所有网页拼接的文本，提取失败的文档和未纳入的URL说明附在末尾，
+        # 单独拿出来，压缩上下文时不会被当成网页内容删掉
+        content = last_tool_message.content
+        positions = [content.find(header) for header in (FAILED_DOCUMENTS_HEADER, DROPPED_URLS_HEADER)]
+        cut = min((position for position in positions if position >= 0), default=len(content))
+        pages = [{"url": None, "success": True, "markdown": content[:cut]}]
+        dropped_note = content[cut:].strip()
+
+    # 流式抓取的结果流，边到达边推送进度事件
+    stream = get_page_stream(artifact.get("page_stream")) if isinstance(artifact, dict) else None
+    if stream:
+        # 按到达顺序去重，重复的网页和段落不交给总结；状态里保存的仍然是原文，供追问时复用
+        deduper = new_deduper() if PAGE_DEDUP else None
+        unique_pages = []
+
+        async def handle_page(page):
+            await adispatch_custom_event("crawl_page", {
+                "url": page["url"],
+                "success": page["success"],
+                "length": len(page["markdown"]),
+                "error": page["error"],
+                "cached": page.get("cached", False),
+                "duplicate_of": page.get("duplicate_of"),
+            })
+            if deduper is not None:
+                page = await run_blocking(deduper.add, page)
+                if page is None:
+                    return
+            unique_pages.append(page)
+            if on_page is not None:
+                await on_page(page)
+
+        start = time.perf_counter()
+        pages, pending_urls = await collect_pages(
+            stream,
+            min_pages=SUMMARY_MIN_PAGES,
+            straggler_wait=SUMMARY_STRAGGLER_WAIT,
+            on_page=handle_page,
+        )
+        # 流式抓取时爬取节点立即返回，等网页的时间都在这里
+        get_snippet_router().record_crawl(time.perf_counter() - start)
+        if stream.done:
+            release_page_stream(stream.id)
+        for page in pages:
+            if page.get("duplicate_of"):
+                # 与原网页内容重复而跳过的镜像，不是抓取失败，也没有内容要保存
+                continue
+            page_messages.append(ToolMessage(
+                content=page["markdown"] if page["success"] else f"抓取失败: {page['error']}",
+                tool_call_id=last_tool_message.tool_call_id,
+                artifact={"url": page["url"], "success": page["success"]},
+            ))
+        # 超过抓取截止时间被放弃的网页，和总结开始时还没返回的网页，都告知用户
+        dropped_urls = [page["url"] for page in pages if page["dropped"]] + pending_urls
+        dropped_note = format_dropped_urls(dropped_urls) if dropped_urls else ""
+        # 提取失败的文档（超过大小上限、扫描件等）也告知用户链接
+        failed_note = format_failed_documents(pages)
+        if failed_note:
+            dropped_note = f"{failed_note}\n\n{dropped_note}" if dropped_note else failed_note
+        if deduper is not None:
+            deduper.report()
+        pages = [page for page in unique_pages if page["success"]]
+
+    return {
+        "human_message": human_message,
+        "last_tool_message": last_tool_message,
+        "pages": pages,
+        "dropped_note": dropped_note,
+        "page_messages": page_messages,
+    }
+
+# 总结bot节点
+async def summary_bot_node(state: MessagesState):
+    """总结网页内容的节点"""
+    results = await collect_crawl_results(state["messages"])
+    human_message = results["human_message"]
+    last_tool_message = results["last_tool_message"]
+    pages = results["pages"]
+    dropped_note = results["dropped_note"]
     
     # 创建系统消息
-    system_message = SystemMessage(content="""
-        ## 你是一个擅长信息整理并总结的AI助手，请根据用户的问题，并结合工具给出的信息把回复总结出来。
-        - 如果有工具信息，正常执行总结；如果工具信息里是一些在线pdf，请把pdf的url和标题输出出来，告知用户来源自行查看。
-        - 如果发现工具没有返回信息，如【工具执行异常，无返回结果】，请根据用户的问题，给出简要回答，但必须带上说明，说明你无法生成详细总结的原因。并让用户再次自行尝试。
-        - 风格：排版按照markdown格式输出。热情，专业，有亲和力。
-    """)
+    system_message = SystemMessage(content=SUMMARY_SYSTEM_PROMPT)
     
     # 构建消息列表
     summary_messages = [system_message]
     
     if human_message:
         summary_messages.append(human_message)
-    
-    if last_tool_message:
+
+    if SUMMARY_PACK_CONTEXT and pages:
+        # 按token预算挑选与问题最相关的片段，而不是把网页原文整段发给模型
+        question = human_message.content if human_message else ""
+        tool_content, pack_stats = pack_context(question, pages, token_budget=SUMMARY_TOKEN_BUDGET)
+        logger.info("上下文打包: %d -> %d tokens，选中片段 %d/%d", pack_stats['tokens_in'],
+                    pack_stats['tokens_out'], pack_stats['selected'], pack_stats['chunks'])
+    else:
+        tool_content = "".join(f"{page['markdown']}\n\n" for page in pages)
+    if dropped_note:
+        tool_content = f"{tool_content}\n\n{dropped_note}" if tool_content else dropped_note
+
+    if tool_content:
         tool_result_message = ToolMessage(
-            content=f"以下是搜索和网页抓取工具返回的详细结果:\n\n{last_tool_message.content}", 
+            content=f"以下是搜索和网页抓取工具返回的详细结果:\n\n{tool_content}", 
             tool_call_id=last_tool_message.id
         )
         summary_messages.append(tool_result_message)
     
     # 调用摘要模型
     if len(summary_messages) > 1:
-        response = await summary_llm.ainvoke(summary_messages)
+        response = await astream_message(summary_llm, summary_messages, stream=LLM_STREAMING, fallbacks=summary_fallbacks)
     else:
         response = ToolMessage(
             content="工具执行异常，无返回结果。", 
             tool_call_id=last_tool_message.id if last_tool_message else "error"
         )
     
-    return {"messages": [response]}
+    return {"messages": results["page_messages"] + [response]}
+
+# map阶段的系统提示
+MAP_SYSTEM_PROMPT = """
+        ## 你是一个擅长信息提取的AI助手。请从下面的网页内容中，提取与用户问题相关的要点。
+        - 只输出要点列表，简洁准确，保留关键数据和结论。
+        - 如果网页内容与问题无关，只回复：无相关内容。
+    """
+
+# map阶段的调用打上标签，run_demo只输出最终总结的流式内容
+map_llm = summary_llm.with_config(tags=["map_summary"])
+map_fallbacks = tuple(model.with_config(tags=["map_summary"]) for model in summary_fallbacks)
+
+async def map_reduce_summary_node(state: MessagesState):
+    """
+    map-reduce总结节点：每个网页到达后立即单独提取要点（map，受信号量限制并发），
+    全部要点提取完后再合并成最终回答（reduce）
+    """
+    messages = state["messages"]
+    human_messages = [msg for msg in messages if isinstance(msg, HumanMessage)]
+    question = human_messages[-1].content if human_messages else ""
+    semaphore = asyncio.Semaphore(MAP_CONCURRENCY)
+    map_tasks = []
+
+    async def map_page(page):
+        # 每个网页先按预算打包，保证单次调用足够小
+        content, _ = pack_context(question, [page], token_budget=MAP_TOKEN_BUDGET)
+        if not content:
+            return None
+        async with semaphore:
+            response = await astream_message(map_llm, [
+                SystemMessage(content=MAP_SYSTEM_PROMPT),
+                HumanMessage(content=f"用户问题：{question}\n\n网页内容：\n{content}"),
+            ], stream=False, fallbacks=map_fallbacks)
+        return page.get("url"), response.content
+
+    async def on_page(page):
+        if page["success"]:
+            map_tasks.append(asyncio.create_task(map_page(page)))
+
+    # 流式抓取时网页一到达就开始map；非流式抓取时拿到全部内容后再开始
+    results = await collect_crawl_results(messages, on_page=on_page)
+    if not map_tasks:
+        for page in results["pages"]:
+            # 非流式抓取的结果是一整段文本，先切成若干份再map
+            for chunk in split_chunks(page["markdown"], MAP_TOKEN_BUDGET):
+                map_tasks.append(asyncio.create_task(map_page({"url": page["url"], "markdown": chunk})))
+
+    notes = []
+    for result in await asyncio.gather(*map_tasks, return_exceptions=True):
+        # 单个网页提取失败不影响其他网页
+        if isinstance(result, Exception):
+            logger.warning("map阶段出错: %s", result)
+            continue
+        if not result:
+            continue
+        url, note = result
+        if note and "无相关内容" not in note[:10]:
+            notes.append(f"## 来源: {url}\n{note}" if url else note)
+
+    tool_content = "\n\n".join(notes)
+    if results["dropped_note"]:
+        tool_content = f"{tool_content}\n\n{results['dropped_note']}" if tool_content else results["dropped_note"]
+    if not tool_content:
+        tool_content = "工具执行异常，无返回结果。"
+
+    # reduce：合并各网页的要点
+    reduce_messages = [SystemMessage(content=SUMMARY_SYSTEM_PROMPT)]
+    if human_messages:
+        reduce_messages.append(human_messages[-1])
+    reduce_messages.append(HumanMessage(content=f"以下是从各网页中提取的与问题相关的要点:\n\n{tool_content}"))
+    response = await astream_message(summary_llm, reduce_messages, stream=LLM_STREAMING, fallbacks=summary_fallbacks)
+    return {"messages": results["page_messages"] + [response]}
+
+async def compact_memory_node(state: MessagesState):
+    """每轮结束后（包括直接回答的轮次）按裁剪策略删除旧消息、去掉用完的artifact，保持会话状态大小有界"""
+    remove = compact_messages(
+        state["messages"],
+        keep_turns=MEMORY_KEEP_TURNS,
+        max_turns=MEMORY_MAX_TURNS,
+        max_page_chars=MEMORY_MAX_PAGE_CHARS,
+    )
+    return {"messages": remove}
+
+def route_summary(state: MessagesState):
+    """
+    在条件边中使用，按SUMMARY_MODE选择单次总结还是map-reduce总结
+    """
+    if SUMMARY_MODE == "map_reduce":
+        return "map_reduce_summary"
+    return "summary_bot"
+
+def search_snippets(messages: list) -> list[dict]:
+    """这一轮搜索节点返回的所有摘要（最后一条AI消息之后的搜索结果）"""
+    snippets = []
+    for msg in reversed(messages):
+        if not isinstance(msg, ToolMessage):
+            break
+        artifact = getattr(msg, 'artifact', None)
+        if isinstance(artifact, dict):
+            snippets[:0] = artifact.get("snippets") or []
+    return snippets
+
+def search_page_stream(messages: list):
+    """这一轮搜索节点开始的抓取结果流id（最后一条AI消息之后的搜索结果里带的），没有时返回None"""
+    for msg in reversed(messages):
+        if not isinstance(msg, ToolMessage):
+            break
+        artifact = getattr(msg, 'artifact', None)
+        if isinstance(artifact, dict) and artifact.get("page_stream"):
+            return artifact["page_stream"]
+    return None
+
+async def route_after_search(state: MessagesState):
+    """
+    在条件边中使用，搜索摘要已经足够回答问题时直接总结，否则抓取网页
+    """
+    if not SNIPPET_FAST_PATH:
+        return "crawl4ai_tool"
+    messages = state['messages']
+    snippets = search_snippets(messages)
+    human_messages = [msg for msg in messages if isinstance(msg, HumanMessage)]
+    if not snippets or not human_messages:
+        return "crawl4ai_tool"
+    if await get_snippet_router().sufficient(human_messages[-1].content, snippets, snippet_judge_llm):
+        return "summary_bot"
+    return "crawl4ai_tool"
 
 def route_search_tool(state: MessagesState):
     """
-    在条件边中使用,如果最后一条消息包含搜索工具调用,则路由到搜索工具节点,否则路由到结束节点。
+    在条件边中使用,如果最后一条消息包含搜索工具调用,则路由到搜索工具节点,
+    否则（直接回答）经过会话记忆裁剪节点后结束。
     """
     messages = state['messages']
     last_message = messages[-1]
@@ -182,31 +701,85 @@ def route_search_tool(state: MessagesState):
             if tool_call["name"] == "search_tool":
                 return "search_tool"
     
-    return END
+    return "compact_memory"
 
 # 添加节点到图
+graph_builder.add_node("pre_router", pre_router_node)
 graph_builder.add_node("chat_bot", chatbot_node)
+graph_builder.add_node("local_index", local_index_node)
 graph_builder.add_node("search_tool", search_tool_node)
 graph_builder.add_node("crawl4ai_tool", crawl4ai_tool_node)
 graph_builder.add_node("summary_bot", summary_bot_node)
+graph_builder.add_node("map_reduce_summary", map_reduce_summary_node)
+graph_builder.add_node("compact_memory", compact_memory_node)
+
+# 产生回答的节点，stream_answer只转发这些节点的token
+ANSWER_NODES = ("chat_bot", "summary_bot", "map_reduce_summary")
 
 # 设置入口点
-graph_builder.set_entry_point("chat_bot")
+graph_builder.set_entry_point("pre_router")
 
-# 添加条件边
+# 添加条件边：决定搜索时都先经过本地索引
+graph_builder.add_conditional_edges(
+    "pre_router",
+    route_pre_router,
+    path_map={"search_tool": "local_index", "chat_bot": "chat_bot"}
+)
 graph_builder.add_conditional_edges(
     "chat_bot",
     route_search_tool,
-    path_map={"search_tool": "search_tool", "END": END}
+    path_map={"search_tool": "local_index", "compact_memory": "compact_memory"}
+)
+graph_builder.add_conditional_edges(
+    "local_index",
+    route_local_index,
+    path_map={"search_tool": "search_tool", "summary_bot": "summary_bot"}
 )
 
 # 添加其他边
-graph_builder.add_edge("search_tool", "crawl4ai_tool")
-graph_builder.add_edge("crawl4ai_tool", "summary_bot")
-graph_builder.add_edge("summary_bot", END)
+graph_builder.add_conditional_edges(
+    "search_tool",
+    route_after_search,
+    path_map={"crawl4ai_tool": "crawl4ai_tool", "summary_bot": "summary_bot"}
+)
+graph_builder.add_conditional_edges(
+    "crawl4ai_tool",
+    route_summary,
+    path_map={"summary_bot": "summary_bot", "map_reduce_summary": "map_reduce_summary"}
+)
+graph_builder.add_edge("summary_bot", "compact_memory")
+graph_builder.add_edge("map_reduce_summary", "compact_memory")
+graph_builder.add_edge("compact_memory", END)
+
+def compile_graph(checkpointer=None):
+    """
+    编译图
 
-# 编译图
-graph = graph_builder.compile()
+    Args:
+        checkpointer: 会话状态的checkpointer，None表示不保存状态
+
+    Returns:
+        CompiledStateGraph: 编译后的图
+    """
+    return graph_builder.compile(checkpointer=checkpointer)
+
+# 编译图（不保存会话状态）；需要多轮对话时用 open_checkpointer() 配合 compile_graph()
+graph = compile_graph()
+
+def build_system_message():
+    """
+    创建对话模型的系统消息，带上当天日期
+
+    Returns:
+        SystemMessage: 系统消息
+    """
+    today = datetime.now().strftime("%Y-%m-%d")
+    return SystemMessage(content=f"""
+        # 你是一个强大的AI助手，擅长搜索和分析网络信息。
+        ## 对于用户的问题，请先分析是否有足够知识进行回答，否则就要进行网络查询。如果需要查询实时或专业信息，请先使用[搜索工具]获取相关内容的链接。
+        ## 如果[搜索工具]返回的是链接，需要再用[爬虫工具]获取具体内容。
+        ## 请牢记今天的日期是{today}。
+    """)
 
 # 定义一个将图导出为PNG的函数
 def export_graph_to_png():
@@ -231,44 +804,56 @@ async def run_demo():
     """异步运行LangGraph流式输出演示"""
     print("开始流式生成回答...\n")
     
-    today = datetime.now().strftime("%Y-%m-%d")
-    
     # 创建初始消息
-    system_message = SystemMessage(content=f"""
-        # 你是一个强大的AI助手，擅长搜索和分析网络信息。
-        ## 对于用户的问题，请先分析是否有足够知识进行回答，否则就要进行网络查询。如果需要查询实时或专业信息，请先使用[搜索工具]获取相关内容的链接。
-        ## 如果[搜索工具]返回的是链接，需要再用[爬虫工具]获取具体内容。
-        ## 请牢记今天的日期是{today}。
-    """)
-    
-    first_message = HumanMessage(content="""
-        crawl4ai是什么？
-    """)
+    system_message = build_system_message()
     
-    # 初始化状态
-    initial_state = {"messages": [system_message, first_message]}
+    # 同一个thread_id的多轮对话：第二个问题是追问，依赖第一轮的搜索和抓取结果
+    questions = [
+        "crawl4ai是什么？",
+        "它支持哪些输出格式？",
+    ]
+    config = {"configurable": {"thread_id": "8"}}
     output_list = []
     
     try:
-        # 异步执行流式输出
-        async for event in graph.astream_events(initial_state, config={"configurable": {"thread_id": "8"}}, version="v2"):
-            # 定义一个变量接收所有on_chat_model_stream的值
-            # print('event------>',event,'\n\n')
-            event_type = event['event']
-            # print('event_type------>',event_type,'\n\n')
-            if event_type == 'on_tool_start' and event['data']:
-                print('开始调用工具查询', event['data'],'\n\n')
-                pass
-            elif event_type == 'on_tool_end' and event['data']:
-                print('工具查询结束',event['data'],'\n\n')
-                pass
-            elif event_type == 'on_chat_model_stream':
-                # print('on_chat_model_stream事件------>',event["data"]["chunk"].content,'\n\n')
-                chunk_data = event["data"]["chunk"].content # 流式输出的内容
-                output_list.append(chunk_data)
-                print(chunk_data, end='', flush=True)
-    except Exception as e:
-        print(f"graph.astream_events执行出错: {e}")
+        async with open_checkpointer() as checkpointer:
+            session_graph = compile_graph(checkpointer)
+            for turn, question in enumerate(questions):
+                # 有checkpointer时后续轮次只需传入新问题，历史消息从checkpoint恢复
+                if turn == 0 or checkpointer is None:
+                    state = {"messages": [system_message, HumanMessage(content=question)]}
+                else:
+                    state = {"messages": [HumanMessage(content=question)]}
+                print(f"\n\n第{turn + 1}轮问题: {question}\n")
+                output_list.append(f"\n\n第{turn + 1}轮回答:\n")
+                try:
+                    # 异步执行流式输出：stream_answer只转发回答token、工具调用和抓取进度
+                    async for event in stream_answer(session_graph, state, config=config, answer_nodes=ANSWER_NODES):
+                        if event['event'] == 'tool_call':
+                            print('模型调用工具', event['name'], event['args'], '\n\n')
+                        elif event['event'] == 'tool_end':
+                            print('工具查询结束', event['name'], '\n\n')
+                        elif event['event'] == 'crawl_page':
+                            status = 'OK' if event['success'] else 'DUP' if event.get('duplicate_of') else 'ERROR'
+                            print(f"网页抓取进度[{status}] {event['url']} length: {event['length']}", '\n')
+                        elif event['event'] == 'token':
+                            output_list.append(event['content'])
+                            print(event['content'], end='', flush=True)
+                        elif event['event'] == 'done' and event['ttft'] is not None:
+                            print(f"\n\n首个token耗时: {event['ttft']:.2f}s，总耗时: {event['elapsed']:.2f}s")
+                except Exception as e:
+                    print(f"graph.astream_events执行出错: {e}")
+    finally:
+        # 关闭共享浏览器池和搜索客户端，避免残留浏览器进程和连接；把网页存储里没落盘的写完
+        await shutdown_crawler_pool()
+        await close_crawl_scheduler()
+        await close_search_clients()
+        await close_page_store()
+        await close_local_index()
+        # 指标写到文件、把缓冲中的span导出完，离线查看
+        if os.getenv('METRICS_FILE'):
+            write_metrics(os.getenv('METRICS_FILE'))
+        shutdown_tracing()
     
     print('\n\n')
     print('************'*10)